@@ -0,0 +1,40 @@
+import { NextRequest, NextResponse } from 'next/server';
+
+export const dynamic = 'force-dynamic';
+
+export async function GET(request: NextRequest) {
+  try {
+    const { searchParams } = new URL(request.url);
+
+    // Forward the event stream subscription (token from the query or the header) to the FastAPI backend
+    const backendUrl = new URL('http://localhost:8000/api/classify/events');
+    searchParams.forEach((value, key) => {
+      backendUrl.searchParams.set(key, value);
+    });
+
+    const backendResponse = await fetch(backendUrl.toString(), {
+      method: 'GET',
+      headers: {
+        'Authorization': request.headers.get('authorization') || '',
+      },
+      signal: request.signal,
+    });
+
+    if (!backendResponse.ok) {
+      const errorData = await backendResponse.json();
+      return NextResponse.json(errorData, { status: backendResponse.status });
+    }
+
+    // Pass the server-sent events through unbuffered
+    return new Response(backendResponse.body, {
+      headers: {
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'Connection': 'keep-alive',
+      },
+    });
+  } catch (error) {
+    console.error('Error forwarding to backend:', error);
+    return NextResponse.json({ error: 'Internal server error' }, { status: 500 });
+  }
+}
@@ -5,13 +5,12 @@ export const dynamic = 'force-dynamic';
 export async function GET(request: NextRequest) {
   try {
     const { searchParams } = new URL(request.url);
-    const sampleID = searchParams.get('sampleID');
 
-    // Forward the request to the FastAPI backend
+    // Forward the request (filters and pagination cursor included) to the FastAPI backend
     const backendUrl = new URL('http://localhost:8000/api/history');
-    if (sampleID) {
-      backendUrl.searchParams.set('sampleID', sampleID);
-    }
+    searchParams.forEach((value, key) => {
+      backendUrl.searchParams.set(key, value);
+    });
 
     const backendResponse = await fetch(backendUrl.toString(), {
       method: 'GET',
@@ -26,7 +25,12 @@ export async function GET(request: NextRequest) {
     }
 
     const data = await backendResponse.json();
-    return NextResponse.json(data);
+    const response = NextResponse.json(data);
+    const nextCursor = backendResponse.headers.get('x-next-cursor');
+    if (nextCursor) {
+      response.headers.set('X-Next-Cursor', nextCursor);
+    }
+    return response;
   } catch (error) {
     console.error('Error forwarding to backend:', error);
     return NextResponse.json({ error: 'Internal server error' }, { status: 500 });
@@ -1,9 +1,202 @@
+"""
+Password hashing, access tokens and the authentication caches.
+
+This is the only place passwords are hashed. New hashes are bcrypt; unsalted
+hex SHA-256 hashes from before are still accepted and replaced with bcrypt on
+the next successful login. bcrypt is deliberately slow (~250 ms at the default
+cost), so the async API runs it on a small dedicated thread pool with a bounded
+queue: a login burst waits on (or is turned away by) that pool instead of
+occupying the event loop or the threadpool that classify requests use.
+
+Verified JWT payloads are cached by token hash until the token expires, and
+active users by email for ``USER_CACHE_TTL`` seconds, so an authenticated
+request costs a dictionary lookup instead of a signature check and a DB
+query. Deactivating a user drops the entry in this process; other workers
+pick the change up within ``USER_CACHE_TTL``.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, NamedTuple, Optional, Tuple
+import asyncio
+import hashlib
+import os
+import time
+
+from jose import JWTError, jwt
 from passlib.context import CryptContext
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from cache_utils import MISSING, LRUCache
+
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "16"))
+
+pwd_context = CryptContext(
+    schemes=["bcrypt", "hex_sha256"],
+    deprecated=["hex_sha256"],  # legacy unsalted hashes; verify_and_update() replaces them
+    bcrypt__rounds=BCRYPT_ROUNDS,
+)
+
+SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here")  # Change this in production
+ALGORITHM = "HS256"
+ACCESS_TOKEN_EXPIRE_MINUTES = 30
+
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv("TOKEN_CACHE_MAX_ENTRIES", "10000"))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "30"))
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
 
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
+
+
+class PasswordHasherBusy(RuntimeError):
+    """Too many hash operations are already waiting for the password pool"""
+
+
+class PasswordHasher:
+    """Runs password hashing on a dedicated, size-limited executor and records queue time"""
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, max_pending: int = PASSWORD_HASH_MAX_PENDING):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+        self._pending = 0
+        self._peak_pending = 0
+        self._operations = 0
+        self._rejected = 0
+        self._queue_seconds = 0.0
+        self._max_queue_seconds = 0.0
+        self._run_seconds = 0.0
+
+    async def verify_and_update(self, password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+        """(valid, replacement hash or None); a replacement means the stored hash is a legacy scheme"""
+        return await self._run(pwd_context.verify_and_update, password, hashed_password)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(pwd_context.hash, password)
+
+    def stats(self) -> Dict:
+        return {
+            "workers": self.workers,
+            "maxPending": self.max_pending,
+            "pending": self._pending,
+            "peakPending": self._peak_pending,
+            "operations": self._operations,
+            "rejected": self._rejected,
+            "meanQueueMs": self._queue_seconds / self._operations * 1000 if self._operations else None,
+            "maxQueueMs": self._max_queue_seconds * 1000,
+            "meanRunMs": self._run_seconds / self._operations * 1000 if self._operations else None,
+        }
+
+    async def _run(self, fn, *args):
+        if self._pending >= self.max_pending:
+            self._rejected += 1
+            raise PasswordHasherBusy("Too many concurrent password operations")
+        self._pending += 1
+        self._peak_pending = max(self._peak_pending, self._pending)
+        submitted = time.perf_counter()
+
+        def timed():
+            started = time.perf_counter()
+            result = fn(*args)
+            return result, started - submitted, time.perf_counter() - started
+
+        try:
+            result, queued, ran = await asyncio.get_running_loop().run_in_executor(self._executor, timed)
+        finally:
+            self._pending -= 1
+        self._operations += 1
+        self._queue_seconds += queued
+        self._max_queue_seconds = max(self._max_queue_seconds, queued)
+        self._run_seconds += ran
+        return result
+
+
+password_hasher = PasswordHasher()
+
+
+class AuthenticatedUser(NamedTuple):
+    """Detached snapshot of a UserDB row, safe to share between requests"""
+    id: int
+    username: str
+    email: str
+    is_active: bool
+
+    @classmethod
+    def from_row(cls, user) -> "AuthenticatedUser":
+        return cls(user.id, user.username, user.email, bool(user.is_active))
+
+
+class AuthCache:
+    """Verified-token and active-user caches with hit/miss counters"""
+
+    def __init__(self, token_entries: int = TOKEN_CACHE_MAX_ENTRIES, user_entries: int = USER_CACHE_MAX_ENTRIES,
+                 user_ttl: float = USER_CACHE_TTL):
+        self.tokens = LRUCache(token_entries)
+        self.users = LRUCache(user_entries)
+        self.user_ttl = user_ttl
+        self._stats: Dict[str, int] = {}
+
+    def token_payload(self, token: str) -> Optional[dict]:
+        """Decoded claims of a valid token, or None if it is invalid or expired"""
+        key = hashlib.sha256(token.encode()).hexdigest()
+        payload = self.tokens.get(key)
+        if payload is not MISSING:
+            # The cache entry expires with the token, but never trust a stale clock edge
+            if payload.get("exp", 0) > time.time():
+                self._count("tokenHits")
+                return payload
+        self._count("tokenMisses")
+        try:
+            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        except JWTError:
+            return None
+        ttl = payload.get("exp", 0) - time.time()
+        if ttl > 0:
+            self.tokens.set(key, payload, ttl)
+        return payload
+
+    def get_user(self, email: str) -> Optional[AuthenticatedUser]:
+        user = self.users.get(email)
+        if user is MISSING:
+            self._count("userMisses")
+            return None
+        self._count("userHits")
+        return user
+
+    def set_user(self, user: AuthenticatedUser):
+        if user.is_active:
+            self.users.set(user.email, user, self.user_ttl)
+
+    def invalidate_user(self, email: str):
+        self.users.delete(email)
+        self._count("userInvalidations")
+
+    def stats(self) -> Dict:
+        stats = dict(self._stats, tokenEntries=len(self.tokens), userEntries=len(self.users), userTtl=self.user_ttl)
+        for kind in ("token", "user"):
+            hits, misses = self._stats.get(f"{kind}Hits", 0), self._stats.get(f"{kind}Misses", 0)
+            stats[f"{kind}HitRate"] = hits / (hits + misses) if hits + misses else None
+        return stats
+
+    def _count(self, name: str):
+        self._stats[name] = self._stats.get(name, 0) + 1
+
+
+auth_cache = AuthCache()
+
+
+def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
+    to_encode = data.copy()
+    if expires_delta:
+        expire = datetime.utcnow() + expires_delta
+    else:
+        expire = datetime.utcnow() + timedelta(minutes=15)
+    to_encode.update({"exp": expire})
+    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    return encoded_jwt
@@ -0,0 +1,132 @@
+"""
+In-process micro-batching for classify requests.
+
+Concurrent ``/api/classify`` calls each submit a single feature row. A worker
+thread gathers rows until either ``max_batch_size`` rows are queued or
+``max_wait_ms`` has passed since the first one arrived, runs one vectorized
+prediction over the stacked matrix and resolves each caller's future with its
+own row of the result.
+"""
+
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Sequence, Tuple
+import queue
+import threading
+import time
+
+import numpy as np
+
+_STOP = object()
+
+
+def _histogram_bounds(limit: int) -> List[int]:
+    """Power-of-two bucket upper bounds covering 1..limit"""
+    bounds = [1]
+    while bounds[-1] < limit:
+        bounds.append(bounds[-1] * 2)
+    return bounds
+
+
+class MicroBatcher:
+    """Collects single-row predictions from many threads into vectorized batches"""
+
+    def __init__(self, predict_fn: Callable[[np.ndarray], Sequence], max_batch_size: int = 64,
+                 max_wait_ms: float = 5.0):
+        self.predict_fn = predict_fn
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+        self._bounds = _histogram_bounds(self.max_batch_size)
+        self._batch_sizes = [0] * len(self._bounds)
+        self._queue_depths = [0] * (len(self._bounds) + 1)
+        self._batches = 0
+        self._items = 0
+        self._max_queue_depth = 0
+
+    def submit(self, features: np.ndarray) -> Future:
+        """Queue one feature row; the returned future resolves to that row's prediction"""
+        self._ensure_started()
+        future: Future = Future()
+        self._queue.put((features, future))
+        return future
+
+    def close(self):
+        """Stop the worker thread after the rows already queued have been processed"""
+        if self._thread is not None:
+            self._queue.put(_STOP)
+            self._thread.join()
+            self._thread = None
+
+    def stats(self) -> Dict:
+        """Queue depth and batch-size histograms since startup"""
+        with self._stats_lock:
+            return {
+                "maxBatchSize": self.max_batch_size,
+                "maxWaitMs": self.max_wait * 1000.0,
+                "queueDepth": self._queue.qsize(),
+                "maxQueueDepth": self._max_queue_depth,
+                "batches": self._batches,
+                "items": self._items,
+                "meanBatchSize": self._items / self._batches if self._batches else 0.0,
+                "batchSizeHistogram": dict(zip(map(str, self._bounds), self._batch_sizes)),
+                "queueDepthHistogram": dict(zip([*map(str, self._bounds), "+Inf"], self._queue_depths)),
+            }
+
+    def _ensure_started(self):
+        if self._thread is None:
+            with self._start_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="classify-batcher", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            stop = False
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            self._process(batch)
+            if stop:
+                return
+
+    def _process(self, batch: List[Tuple[np.ndarray, Future]]):
+        self._record(len(batch), self._queue.qsize())
+        try:
+            results = self.predict_fn(np.vstack([features for features, _ in batch]))
+        except Exception as exc:
+            for _, future in batch:
+                future.set_exception(exc)
+            return
+        for (_, future), result in zip(batch, results):
+            future.set_result(result)
+
+    def _record(self, batch_size: int, queue_depth: int):
+        with self._stats_lock:
+            self._batches += 1
+            self._items += batch_size
+            self._max_queue_depth = max(self._max_queue_depth, queue_depth)
+            self._batch_sizes[self._bucket(batch_size)] += 1
+            depth_bucket = self._bucket(queue_depth) if queue_depth <= self._bounds[-1] else len(self._bounds)
+            self._queue_depths[depth_bucket] += 1
+
+    def _bucket(self, value: int) -> int:
+        for i, bound in enumerate(self._bounds):
+            if value <= bound:
+                return i
+        return len(self._bounds) - 1
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Benchmark sklearn forests against the compiled NumPy evaluator and pipeline.
+
+Run from the repository root after training:
+    python fastapi-backend/benchmark_inference.py [models_dir]
+"""
+
+import os
+import sys
+import timeit
+
+import joblib
+import numpy as np
+
+from compiled_forest import CompiledForest, compile_forest
+from inference import ModelBundle
+from inference_pipeline import InferencePipeline, build_pipeline
+
+BATCH_SIZES = [1, 8, 64, 512]
+
+def benchmark(name, forest, scaler, rng):
+    compiled = CompiledForest(compile_forest(forest, scaler))
+    X = rng.normal(size=(max(BATCH_SIZES), forest.n_features_in_)) * scaler.scale_ * 2 + scaler.mean_
+
+    # Results must be identical, not just close
+    for rows in [X[:1], X[:7], X]:
+        expected = forest.predict_proba(scaler.transform(rows))
+        if not np.array_equal(expected, compiled.predict_proba(rows)):
+            raise AssertionError(f"{name}: compiled forest disagrees with sklearn")
+
+    print(f"\n{name} ({len(forest.estimators_)} trees)")
+    print(f"{'batch':>6} {'sklearn ms':>12} {'compiled ms':>12} {'speedup':>8}")
+    for size in BATCH_SIZES:
+        rows = X[:size]
+        number = max(5, 200 // size)
+        sk = min(timeit.repeat(lambda: forest.predict_proba(scaler.transform(rows)), number=number, repeat=3)) / number
+        np_time = min(timeit.repeat(lambda: compiled.predict_proba(rows), number=number, repeat=3)) / number
+        print(f"{size:>6} {sk * 1000:>12.3f} {np_time * 1000:>12.3f} {sk / np_time:>7.1f}x")
+
+def benchmark_pipeline(models, rng):
+    pipeline = InferencePipeline(build_pipeline(*models))
+    n_features = models.herb_scaler.n_features_in_
+    X = rng.normal(size=(max(BATCH_SIZES), n_features)) * models.herb_scaler.scale_ * 2 + models.herb_scaler.mean_
+
+    for rows in [X[:1], X[:7], X]:
+        expected_proba, expected_flags = models.evaluate(rows)
+        proba, flags = pipeline.evaluate(rows)
+        if not (np.array_equal(expected_proba, proba) and np.array_equal(expected_flags, flags)):
+            raise AssertionError("inference pipeline disagrees with sklearn")
+
+    print("\nfull pipeline (both scalers + both forests)")
+    print(f"{'batch':>6} {'sklearn ms':>12} {'pipeline ms':>12} {'speedup':>8}")
+    for size in BATCH_SIZES:
+        rows = X[:size]
+        number = max(5, 200 // size)
+        sk = min(timeit.repeat(lambda: models.evaluate(rows), number=number, repeat=3)) / number
+        np_time = min(timeit.repeat(lambda: pipeline.evaluate(rows), number=number, repeat=3)) / number
+        print(f"{size:>6} {sk * 1000:>12.3f} {np_time * 1000:>12.3f} {sk / np_time:>7.1f}x")
+
+def main():
+    models_dir = sys.argv[1] if len(sys.argv) > 1 else 'models'
+    rng = np.random.RandomState(0)
+    benchmark("herb classifier",
+              joblib.load(os.path.join(models_dir, 'herb_classifier.pkl')),
+              joblib.load(os.path.join(models_dir, 'herb_scaler.pkl')), rng)
+    benchmark("adulteration detector",
+              joblib.load(os.path.join(models_dir, 'adulteration_detector.pkl')),
+              joblib.load(os.path.join(models_dir, 'adulteration_scaler.pkl')), rng)
+    benchmark_pipeline(ModelBundle(
+        herb_clf=joblib.load(os.path.join(models_dir, 'herb_classifier.pkl')),
+        herb_scaler=joblib.load(os.path.join(models_dir, 'herb_scaler.pkl')),
+        label_encoder=joblib.load(os.path.join(models_dir, 'label_encoder.pkl')),
+        adulteration_clf=joblib.load(os.path.join(models_dir, 'adulteration_detector.pkl')),
+        adulteration_scaler=joblib.load(os.path.join(models_dir, 'adulteration_scaler.pkl')),
+    ), rng)
+
+if __name__ == "__main__":
+    main()
@@ -1,44 +1,402 @@
-from functools import wraps
-from typing import Any, Callable
-import json
+"""
+Two-tier response cache.
+
+Keys are deterministic: a namespace, an optional version (the model version
+for classifications, a generation counter for history) and the SHA-256 of the
+canonical JSON of the request payload. Lookups go to an in-process LRU first
+and then to a shared remote backend (Redis when ``REDIS_URL`` is set), so
+repeated payloads such as calibration standards are answered without
+inference and, on a local hit, without a network round trip.
+
+The remote tier is optional and never on the critical path: every call has a
+timeout, and a circuit breaker stops calling it after repeated failures, so a
+slow or dead Redis degrades to local-only caching instead of failing requests.
+Concurrent misses on the same key are coalesced so the value is computed once.
+
+History entries are invalidated by bumping the ``history`` generation on every
+insert; the generation lives in the remote tier so all workers see it, with a
+local counter as the fallback. Without Redis the local counter only covers one
+process, so the inserts also bump a counter in the database (see
+``ingest.bump_history``) that ``/api/history`` folds into its keys.
+"""
+
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+import asyncio
 import hashlib
-from redis import asyncio as aioredis
+import json
 import os
+import threading
+import time
+
+try:
+    from redis import asyncio as aioredis
+except ImportError:  # Redis tier is optional; the in-process LRU still works
+    aioredis = None
+
+REDIS_URL = os.getenv("REDIS_URL")
+CACHE_ENABLED = os.getenv("CACHE_ENABLED", "1") != "0"
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "redis" if REDIS_URL else "none")  # remote tier: redis | memory | none
+CACHE_LOCAL_MAX_ENTRIES = int(os.getenv("CACHE_LOCAL_MAX_ENTRIES", "4096"))
+CACHE_REMOTE_TIMEOUT_MS = float(os.getenv("CACHE_REMOTE_TIMEOUT_MS", "50"))
+CACHE_BREAKER_FAILURES = int(os.getenv("CACHE_BREAKER_FAILURES", "5"))
+CACHE_BREAKER_RESET_SECONDS = float(os.getenv("CACHE_BREAKER_RESET_SECONDS", "30"))
+CLASSIFY_CACHE_TTL = int(os.getenv("CLASSIFY_CACHE_TTL", "3600"))
+HISTORY_CACHE_TTL = int(os.getenv("HISTORY_CACHE_TTL", "30"))
+KEY_PREFIX = "herbtongue"
+
+MISSING = object()
+
+
+def canonical_hash(payload: Any) -> str:
+    """SHA-256 of the payload's canonical JSON (sorted keys, no whitespace)"""
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def cache_key(namespace: str, payload: Any, version: Any = None) -> str:
+    parts = [KEY_PREFIX, namespace]
+    if version is not None:
+        parts.append(str(version))
+    parts.append(canonical_hash(payload))
+    return ":".join(parts)
+
+
+class LRUCache:
+    """Thread-safe in-process LRU with a per-entry expiry"""
+
+    def __init__(self, max_entries: int = CACHE_LOCAL_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return MISSING
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl if ttl else float("inf"), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def remaining_ttl(self, key: str) -> Optional[float]:
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or entry[0] == float("inf"):
+            return None
+        return max(entry[0] - time.monotonic(), 0.0)
+
+    def delete(self, key: str):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+# -------------------------------
+# Backends
+# -------------------------------
+class CacheBackend:
+    """Remote tier interface; values are JSON strings, counters are ints"""
+
+    name = "backend"
+
+    async def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: str, ttl: int):
+        raise NotImplementedError
+
+    async def ttl(self, key: str) -> Optional[int]:
+        raise NotImplementedError
+
+    async def incr(self, key: str) -> int:
+        raise NotImplementedError
+
+    async def ping(self):
+        pass
+
+    async def close(self):
+        pass
+
+
+class MemoryBackend(CacheBackend):
+    """TTL/LRU backend in process memory; the remote tier for single-process and test setups"""
+
+    name = "memory"
+
+    def __init__(self, max_entries: int = CACHE_LOCAL_MAX_ENTRIES):
+        self._cache = LRUCache(max_entries)
+        self._counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    async def get(self, key: str) -> Optional[str]:
+        value = self._cache.get(key)
+        if value is MISSING:
+            return self._counter_value(key)
+        return value
+
+    async def set(self, key: str, value: str, ttl: int):
+        self._cache.set(key, value, ttl)
+
+    async def ttl(self, key: str) -> Optional[int]:
+        remaining = self._cache.remaining_ttl(key)
+        return None if remaining is None else int(remaining)
+
+    async def incr(self, key: str) -> int:
+        # Counters are kept apart from the LRU so eviction never resets a generation
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def _counter_value(self, key: str) -> Optional[str]:
+        value = self._counters.get(key)
+        return None if value is None else str(value)
+
+
+class RedisBackend(CacheBackend):
+    name = "redis"
+
+    def __init__(self, url: str):
+        if aioredis is None:
+            raise RuntimeError("The redis cache backend requires the redis package")
+        self._redis = aioredis.from_url(url)
+
+    async def get(self, key: str) -> Optional[str]:
+        value = await self._redis.get(key)
+        return value.decode() if isinstance(value, bytes) else value
+
+    async def set(self, key: str, value: str, ttl: int):
+        await self._redis.setex(key, ttl, value)
+
+    async def ttl(self, key: str) -> Optional[int]:
+        ttl = await self._redis.ttl(key)
+        return ttl if ttl >= 0 else None
+
+    async def incr(self, key: str) -> int:
+        return await self._redis.incr(key)
+
+    async def ping(self):
+        await self._redis.ping()
+
+    async def close(self):
+        await self._redis.close()
+
+
+def make_remote_backend(kind: str = CACHE_BACKEND, url: Optional[str] = REDIS_URL) -> Optional[CacheBackend]:
+    if kind == "redis":
+        if url and aioredis is not None:
+            return RedisBackend(url)
+        print("Warning: redis cache backend unavailable (no REDIS_URL or redis package); using the local tier only")
+        return None
+    if kind == "memory":
+        return MemoryBackend()
+    return None
+
+
+class CircuitBreaker:
+    """Closed until ``failures`` consecutive errors, then open for ``reset_seconds``, then one trial call"""
+
+    def __init__(self, failures: int = CACHE_BREAKER_FAILURES, reset_seconds: float = CACHE_BREAKER_RESET_SECONDS):
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self._consecutive = 0
+        self._opened_at: Optional[float] = None
+        self._trial_running = False
+        self.opened = 0
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_seconds:
+            return "half-open"
+        return "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self._trial_running:
+            self._trial_running = True
+            return True
+        return False
+
+    def record_success(self):
+        self._consecutive = 0
+        self._opened_at = None
+        self._trial_running = False
+
+    def record_failure(self):
+        self._consecutive += 1
+        if self._trial_running or (self._opened_at is None and self._consecutive >= self.failures):
+            self.opened += 1
+            self._opened_at = time.monotonic()
+        self._trial_running = False
+
+
+# -------------------------------
+# Response cache
+# -------------------------------
+class ResponseCache:
+    """In-process LRU in front of an optional remote backend, with per-namespace hit/miss counters"""
+
+    def __init__(self, remote: Optional[CacheBackend] = None, max_entries: int = CACHE_LOCAL_MAX_ENTRIES,
+                 enabled: bool = CACHE_ENABLED, timeout_ms: float = CACHE_REMOTE_TIMEOUT_MS,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.enabled = enabled
+        self.local = LRUCache(max_entries)
+        self.remote = remote if enabled else None
+        self.timeout = timeout_ms / 1000
+        self.breaker = breaker or CircuitBreaker()
+        self._generations: Dict[str, int] = {}
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    async def get(self, namespace: str, key: str) -> Any:
+        """The cached value, or None on a miss"""
+        if not self.enabled:
+            return None
+        value = self.local.get(key)
+        if value is not MISSING:
+            self._count(namespace, "localHits")
+            return value
+        cached = await self._remote(namespace, "get", key)
+        if cached is not None:
+            value = json.loads(cached)
+            self._count(namespace, "remoteHits")
+            self.local.set(key, value, await self._remote(namespace, "ttl", key) or 1)
+            return value
+        self._count(namespace, "misses")
+        return None
+
+    async def set(self, namespace: str, key: str, value: Any, ttl: int):
+        """Store a JSON-serializable value in both tiers"""
+        if not self.enabled:
+            return
+        self.local.set(key, value, ttl)
+        if self.remote is not None:
+            await self._remote(namespace, "set", key, json.dumps(value, default=str), ttl)
+
+    async def get_or_compute(self, namespace: str, key: str, compute: Callable[[], Awaitable[Any]], ttl: int,
+                             should_cache: Callable[[Any], bool] = lambda value: True) -> Any:
+        """Cached value, or compute it once for all concurrent callers missing on the same key"""
+        value = await self.get(namespace, key)
+        if value is not None:
+            return value
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self._count(namespace, "coalesced")
+            return await asyncio.shield(pending)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            value = await compute()
+            if should_cache(value):
+                await self.set(namespace, key, value, ttl)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            future.exception()  # retrieved, so an unawaited future does not log a warning
+            raise
+        finally:
+            del self._inflight[key]
+
+    async def generation(self, namespace: str) -> int:
+        """Current generation of a namespace; part of its keys so a bump invalidates every entry"""
+        value = await self._remote(namespace, "get", self._generation_key(namespace))
+        if value is not None:
+            return int(value)
+        return self._generations.get(namespace, 0)
+
+    async def invalidate(self, namespace: str):
+        if not self.enabled:
+            return
+        self._generations[namespace] = self._generations.get(namespace, 0) + 1
+        self._count(namespace, "invalidations")
+        await self._remote(namespace, "incr", self._generation_key(namespace))
+
+    def stats(self) -> Dict:
+        namespaces = {}
+        for namespace, counts in self._stats.items():
+            hits = counts.get("localHits", 0) + counts.get("remoteHits", 0)
+            lookups = hits + counts.get("misses", 0)
+            namespaces[namespace] = dict(counts, hits=hits, hitRate=hits / lookups if lookups else None)
+        return {
+            "enabled": self.enabled,
+            "backend": f"local+{self.remote.name}" if self.remote is not None else "local",
+            "breaker": self.breaker.state if self.remote is not None else None,
+            "breakerOpened": self.breaker.opened,
+            "localEntries": len(self.local),
+            "localMaxEntries": self.local.max_entries,
+            "inflight": len(self._inflight),
+            "namespaces": namespaces,
+        }
+
+    async def ping(self):
+        if self.remote is not None:
+            await asyncio.wait_for(self.remote.ping(), self.timeout)
+
+    async def close(self):
+        if self.remote is not None:
+            await self.remote.close()
 
-redis_url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
-redis = aioredis.from_url(redis_url)
+    async def _remote(self, namespace: str, operation: str, *args) -> Any:
+        """Call the remote tier with a timeout behind the breaker; None when skipped or failed"""
+        if self.remote is None:
+            return None
+        if not self.breaker.allow():
+            self._count(namespace, "remoteSkipped")
+            return None
+        try:
+            result = await asyncio.wait_for(getattr(self.remote, operation)(*args), self.timeout)
+        except asyncio.TimeoutError:
+            self._count(namespace, "remoteTimeouts")
+            self.breaker.record_failure()
+            return None
+        except Exception:
+            self._count(namespace, "remoteErrors")
+            self.breaker.record_failure()
+            return None
+        self.breaker.record_success()
+        return result
 
-def cache(expire: int = 300):
-    def decorator(func: Callable) -> Callable:
-        @wraps(func)
-        async def wrapper(*args, **kwargs) -> Any:
-            # Create cache key from function name and arguments
-            key_data = {
-                "func": func.__name__,
-                "args": str(args),
-                "kwargs": str(kwargs)
-            }
-            key = hashlib.md5(json.dumps(key_data, sort_keys=True).encode()).hexdigest()
+    @staticmethod
+    def _generation_key(namespace: str) -> str:
+        return f"{KEY_PREFIX}:generation:{namespace}"
 
-            # Try to get from cache
-            cached = await redis.get(key)
-            if cached:
-                return json.loads(cached)
+    def _count(self, namespace: str, name: str):
+        counts = self._stats.setdefault(namespace, {})
+        counts[name] = counts.get(name, 0) + 1
 
-            # Execute function
-            result = await func(*args, **kwargs)
 
-            # Cache result
-            await redis.setex(key, expire, json.dumps(result))
+response_cache = ResponseCache(make_remote_backend())
 
-            return result
-        return wrapper
-    return decorator
 
 # Initialize cache on startup
 async def init_cache():
-    await redis.ping()
+    try:
+        await response_cache.ping()
+    except Exception as e:
+        print(f"Warning: remote cache unavailable, serving from the local tier: {e!r}")
 
 # Close cache on shutdown
 async def close_cache():
-    await redis.close()
+    await response_cache.close()
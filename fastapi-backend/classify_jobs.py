@@ -0,0 +1,142 @@
+"""
+Background classification of uploaded samples.
+
+``/api/upload`` stores rows unclassified and returns at once with a job id;
+the rows are then classified ``CLASSIFY_CHUNK_SIZE`` sample IDs at a time by
+the configured executor (``CLASSIFY_EXECUTOR``):
+
+* ``local`` (default): a thread pool in the API process using its model
+  registry, for tests and deployments without a broker.
+* ``celery``: one ``tasks.classify_upload_chunk`` task per chunk, spread
+  over the Celery workers.
+
+Each chunk is one vectorized predict and one executemany UPDATE, committed
+together with a single atomic UPDATE of the job row, so
+``GET /api/upload/jobs/{id}`` reports progress whichever process did the work.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterator, List, Sequence
+import math
+import os
+
+from sqlalchemy import and_, case, update
+
+from database import SampleDB, SessionLocal, UploadJobDB, engine
+from model_registry import ModelRegistry
+from scoring import feature_query, score_rows, write_scores
+
+CLASSIFY_EXECUTOR = os.getenv("CLASSIFY_EXECUTOR", "local")  # local | celery
+CLASSIFY_WORKERS = int(os.getenv("CLASSIFY_WORKERS", "2"))
+CLASSIFY_CHUNK_SIZE = int(os.getenv("CLASSIFY_CHUNK_SIZE", "500"))
+
+
+def chunk_count(n: int, chunk_size: int = CLASSIFY_CHUNK_SIZE) -> int:
+    return math.ceil(n / chunk_size)
+
+
+def iter_chunks(sample_ids: Sequence[str], chunk_size: int = CLASSIFY_CHUNK_SIZE) -> Iterator[List[str]]:
+    for start in range(0, len(sample_ids), chunk_size):
+        yield list(sample_ids[start:start + chunk_size])
+
+
+def classify_chunk(job_id: str, sample_ids: Sequence[str], registry: ModelRegistry) -> int:
+    """Classify one chunk of a job's samples and advance the job; returns the rows classified"""
+    try:
+        loaded = registry.get()
+        if loaded is None:
+            raise RuntimeError("No trained model available")
+        with SessionLocal() as db:
+            rows = db.execute(feature_query(SampleDB.sampleID.in_(sample_ids))).all()
+        params, skipped = score_rows(loaded, rows)
+        with engine.begin() as conn:
+            write_scores(conn, params)
+            conn.execute(_advance_job(job_id, len(params), skipped))
+    except Exception as e:
+        with engine.begin() as conn:
+            conn.execute(update(UploadJobDB.__table__).where(UploadJobDB.id == job_id)
+                         .values(status="failed", error=str(e), updated_at=datetime.utcnow()))
+        raise
+    return len(params)
+
+
+def _advance_job(job_id: str, classified: int, skipped: int):
+    # One statement, so concurrent chunks never lose each other's counts
+    jobs = UploadJobDB.__table__.c
+    done = jobs.chunksDone + 1
+    return (
+        update(UploadJobDB.__table__)
+        .where(jobs.id == job_id)
+        .values(
+            chunksDone=done,
+            classified=jobs.classified + classified,
+            invalid=jobs.invalid + skipped,
+            status=case((and_(jobs.status == "classifying", done >= jobs.chunksTotal), "complete"), else_=jobs.status),
+            updated_at=datetime.utcnow(),
+        )
+    )
+
+
+# -------------------------------
+# Executors
+# -------------------------------
+class LocalExecutor:
+    """Runs chunks on a thread pool in this process"""
+    name = "local"
+
+    def __init__(self, registry: ModelRegistry, workers: int = CLASSIFY_WORKERS):
+        self.registry = registry
+        self.workers = workers
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="classify-upload")
+        self._pending = 0
+        self._chunks = 0
+        self._failed = 0
+
+    def submit(self, job_id: str, sample_ids: Sequence[str]):
+        for chunk in iter_chunks(sample_ids):
+            self._pending += 1
+            self._pool.submit(self._run, job_id, chunk)
+
+    def stats(self) -> Dict:
+        return {"executor": self.name, "workers": self.workers, "pendingChunks": self._pending,
+                "chunks": self._chunks, "failedChunks": self._failed}
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _run(self, job_id: str, chunk: List[str]):
+        try:
+            classify_chunk(job_id, chunk, self.registry)
+        except Exception as e:
+            # The failure is recorded on the job row; nothing waits on this future
+            self._failed += 1
+            print(f"Warning: classification of upload {job_id} failed: {e}")
+        finally:
+            self._pending -= 1
+            self._chunks += 1
+
+
+class CeleryExecutor:
+    """Queues one Celery task per chunk"""
+    name = "celery"
+
+    def submit(self, job_id: str, sample_ids: Sequence[str]):
+        # Imported here so the API only needs Celery installed when this executor is used
+        from tasks import classify_upload_chunk
+        for chunk in iter_chunks(sample_ids):
+            classify_upload_chunk.delay(job_id, chunk)
+
+    def stats(self) -> Dict:
+        return {"executor": self.name}
+
+    def shutdown(self):
+        pass
+
+
+def make_executor(kind: str, registry: ModelRegistry):
+    if kind == "celery":
+        return CeleryExecutor()
+    if kind == "local":
+        return LocalExecutor(registry)
+    raise ValueError(f"Unknown CLASSIFY_EXECUTOR {kind!r}")
@@ -0,0 +1,112 @@
+"""
+Array-backed evaluation of trained RandomForestClassifiers.
+
+``compile_forest`` flattens every tree of a fitted forest (and optionally the
+StandardScaler that precedes it) into a handful of contiguous NumPy arrays:
+split feature, threshold, left/right child and normalised leaf class
+probabilities. ``CompiledForest`` walks all trees for all rows at once with
+fancy indexing, one step per tree level, and accumulates leaf probabilities in
+the same order and precision as sklearn so results are identical.
+"""
+
+from typing import Dict, Optional
+
+import numpy as np
+
+
+def compile_forest(forest, scaler=None) -> Dict[str, np.ndarray]:
+    """Flatten a fitted RandomForestClassifier (and its scaler) into node arrays"""
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    for estimator in forest.estimators_:
+        tree = estimator.tree_
+        n_nodes = tree.node_count
+        node_ids = np.arange(offset, offset + n_nodes, dtype=np.int32)
+        is_leaf = tree.children_left < 0
+
+        # Leaves point at themselves so extra traversal steps are no-ops
+        lefts.append(np.where(is_leaf, node_ids, tree.children_left + offset).astype(np.int32))
+        rights.append(np.where(is_leaf, node_ids, tree.children_right + offset).astype(np.int32))
+        features.append(np.where(is_leaf, 0, tree.feature).astype(np.int32))
+        thresholds.append(np.where(is_leaf, np.inf, tree.threshold).astype(np.float64))
+
+        # Same normalisation as DecisionTreeClassifier.predict_proba
+        value = tree.value[:, 0, :forest.n_classes_].astype(np.float64)
+        normalizer = value.sum(axis=1)[:, np.newaxis]
+        normalizer[normalizer == 0.0] = 1.0
+        values.append(value / normalizer)
+
+        roots.append(offset)
+        offset += n_nodes
+
+    arrays = {
+        'feature': np.concatenate(features),
+        'threshold': np.concatenate(thresholds),
+        'left': np.concatenate(lefts),
+        'right': np.concatenate(rights),
+        'value': np.concatenate(values),
+        'roots': np.asarray(roots, dtype=np.int32),
+        'classes': np.asarray(forest.classes_),
+        'max_depth': np.asarray(max(e.tree_.max_depth for e in forest.estimators_), dtype=np.int32),
+        'n_features': np.asarray(forest.n_features_in_, dtype=np.int32),
+    }
+    if scaler is not None:
+        arrays['scaler_mean'] = np.asarray(scaler.mean_, dtype=np.float64)
+        arrays['scaler_scale'] = np.asarray(scaler.scale_, dtype=np.float64)
+    return arrays
+
+
+class CompiledForest:
+    """Pure-NumPy drop-in for a forest's predict_proba/predict on raw (unscaled) features"""
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.feature = np.ascontiguousarray(arrays['feature'])
+        self.threshold = np.ascontiguousarray(arrays['threshold'])
+        self.left = np.ascontiguousarray(arrays['left'])
+        self.right = np.ascontiguousarray(arrays['right'])
+        self.value = np.ascontiguousarray(arrays['value'])
+        self.roots = np.ascontiguousarray(arrays['roots'])
+        self.classes_ = arrays['classes']
+        self.max_depth = int(arrays['max_depth'].item())
+        self.n_features_in_ = int(arrays['n_features'].item())
+        self.scaler_mean: Optional[np.ndarray] = arrays.get('scaler_mean')
+        self.scaler_scale: Optional[np.ndarray] = arrays.get('scaler_scale')
+
+    def transform(self, X: np.ndarray) -> np.ndarray:
+        """Apply the fused StandardScaler, if any, exactly as sklearn does"""
+        X = np.array(X, dtype=np.float64)
+        if self.scaler_mean is not None:
+            X -= self.scaler_mean
+            X /= self.scaler_scale
+        return X
+
+    def leaves(self, X: np.ndarray) -> np.ndarray:
+        """Leaf node index reached by every row in every tree, shape (n_rows, n_trees)"""
+        # Trees compare float32 inputs against float64 thresholds, like sklearn's Cython code
+        return self.walk(np.ascontiguousarray(self.transform(X), dtype=np.float32))
+
+    def walk(self, X32: np.ndarray) -> np.ndarray:
+        """Traverse all trees for already scaled, C-contiguous float32 rows"""
+        n_rows = X32.shape[0]
+        nodes = np.repeat(self.roots[np.newaxis, :], n_rows, axis=0)
+        flat_offsets = (np.arange(n_rows, dtype=np.intp) * X32.shape[1])[:, np.newaxis]
+        X_flat = X32.ravel()
+        for _ in range(self.max_depth):
+            go_left = X_flat[flat_offsets + self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return nodes
+
+    def leaf_proba(self, nodes: np.ndarray) -> np.ndarray:
+        """Average the leaf class probabilities reached in each tree"""
+        proba = np.zeros((nodes.shape[0], self.value.shape[1]), dtype=np.float64)
+        # Accumulate tree by tree, in estimator order, so rounding matches sklearn
+        for tree in range(nodes.shape[1]):
+            proba += self.value[nodes[:, tree]]
+        proba /= nodes.shape[1]
+        return proba
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        return self.leaf_proba(self.leaves(X))
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1), axis=0)
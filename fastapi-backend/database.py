@@ -0,0 +1,335 @@
+"""
+Database engines, sessions and ORM models.
+
+The engine is built from ``DATABASE_URL`` (SQLite by default, Postgres under
+docker-compose). API endpoints use pooled ``AsyncSession``s so DB I/O never
+holds a threadpool slot; Celery tasks and scripts use the synchronous
+``SessionLocal`` on the same database.
+
+Sensor channels are stored as typed numeric columns on ``samples`` and each
+voltammetry curve as one packed float32 blob in ``sample_curves``, so bulk
+readers (re-scoring, analytics) read plain columns and ``np.frombuffer``
+instead of decoding a JSON document per row.
+"""
+
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Optional, Sequence
+import ast
+import json
+import os
+
+import numpy as np
+from sqlalchemy import (create_engine, Column, Index, Integer, String, Float, Boolean, Date, DateTime, JSON, LargeBinary,
+                        bindparam, inspect, select, text)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./herbal_etongue.db")
+
+# Per-process pool sizing; total connections = workers * (pool size + overflow)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+# Async drivers for the URL schemes used in this project
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "postgres": "postgresql+asyncpg",
+}
+
+
+def async_database_url(url: str) -> str:
+    parsed = make_url(url)
+    driver = ASYNC_DRIVERS.get(parsed.drivername)
+    return str(parsed.set(drivername=driver)) if driver else url
+
+
+def _engine_options(url: str) -> dict:
+    if make_url(url).get_backend_name() == "sqlite":
+        # SQLite connections are cheap and file-locked; pooling options do not apply
+        return {"connect_args": {"check_same_thread": False}}
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": True,
+    }
+
+
+engine = create_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+async_engine = create_async_engine(async_database_url(DATABASE_URL), **_engine_options(DATABASE_URL))
+AsyncSessionLocal = sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+Base = declarative_base()
+
+# -------------------------------
+# Database Models
+# -------------------------------
+class UserDB(Base):
+    __tablename__ = "users"
+    id = Column(Integer, primary_key=True, index=True)
+    username = Column(String, unique=True, index=True, nullable=False)
+    email = Column(String, unique=True, index=True, nullable=False)
+    hashed_password = Column(String, nullable=False)
+    is_active = Column(Boolean, default=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class SampleDB(Base):
+    __tablename__ = "samples"
+    id = Column(Integer, primary_key=True, index=True)
+    sampleID = Column(String, unique=True, index=True, nullable=False)
+    timestamp = Column(DateTime, nullable=False)
+    herbName = Column(String, default="Tulsi")
+    purityPercent = Column(Float)
+    adulterationFlag = Column(Boolean)
+    confidenceScore = Column(Float)
+    tasteProfile = Column(JSON(none_as_null=True))  # list of taste descriptors
+    recommendation = Column(String)
+    modelVersion = Column(String, index=True)  # Registry version that produced the classification
+
+    # Sensor channels as typed columns (SensorData field names); the voltammetry curve is in sample_curves
+    pH = Column(Float)
+    tds_ec = Column(Float)
+    orp = Column(Float)
+    turbidity = Column(Float)
+    temperature = Column(Float)
+    moisture = Column(Float)
+    rf_resonator = Column(Float)
+    Na = Column(Float)
+    K = Column(Float)
+    Ca = Column(Float)
+
+    # Keyset pagination of /api/history walks (timestamp, id) newest first, optionally within one herb / flag
+    __table_args__ = (
+        Index("ix_samples_timestamp_id", "timestamp", "id"),
+        Index("ix_samples_herb_timestamp_id", "herbName", "timestamp", "id"),
+        Index("ix_samples_adulteration_timestamp_id", "adulterationFlag", "timestamp", "id"),
+    )
+
+class SampleCurveDB(Base):
+    __tablename__ = "sample_curves"
+    sampleID = Column(String, primary_key=True)  # samples.sampleID
+    points = Column(Integer, nullable=False)
+    currents = Column(LargeBinary, nullable=False)  # packed little-endian float32, see pack_curve()
+
+# Classified samples per day and herb, maintained incrementally by rollups.py
+class HerbDailyStatsDB(Base):
+    __tablename__ = "herb_daily_stats"
+    day = Column(Date, primary_key=True)
+    herbName = Column(String, primary_key=True)
+    samples = Column(Integer, nullable=False, default=0)
+    adulterated = Column(Integer, nullable=False, default=0)
+    puritySum = Column(Float, nullable=False, default=0.0)
+    purityMin = Column(Float)
+    purityMax = Column(Float)
+    confidenceSum = Column(Float, nullable=False, default=0.0)
+    confidence0 = Column(Integer, nullable=False, default=0)  # samples with confidence in [0.0, 0.1)
+    confidence1 = Column(Integer, nullable=False, default=0)
+    confidence2 = Column(Integer, nullable=False, default=0)
+    confidence3 = Column(Integer, nullable=False, default=0)
+    confidence4 = Column(Integer, nullable=False, default=0)
+    confidence5 = Column(Integer, nullable=False, default=0)
+    confidence6 = Column(Integer, nullable=False, default=0)
+    confidence7 = Column(Integer, nullable=False, default=0)
+    confidence8 = Column(Integer, nullable=False, default=0)
+    confidence9 = Column(Integer, nullable=False, default=0)  # ... [0.9, 1.0]
+
+class UploadJobDB(Base):
+    __tablename__ = "upload_jobs"
+    id = Column(String, primary_key=True)  # uuid4 hex, may be chosen by the client to poll progress
+    status = Column(String, nullable=False, default="running")  # running | classifying | complete | failed
+    format = Column(String)
+    rowsRead = Column(Integer, default=0)
+    inserted = Column(Integer, default=0)
+    updated = Column(Integer, default=0)
+    duplicates = Column(Integer, default=0)
+    invalid = Column(Integer, default=0)
+    classified = Column(Integer, default=0)
+    chunksTotal = Column(Integer, default=0)  # background classification chunks queued / finished
+    chunksDone = Column(Integer, default=0)
+    error = Column(String)
+    createdBy = Column(Integer)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+def dialect_insert(table, dialect_name: str):
+    """INSERT supporting ON CONFLICT for the dialects this project runs on"""
+    if dialect_name == "postgresql":
+        return postgresql.insert(table)
+    if dialect_name == "sqlite":
+        return sqlite.insert(table)
+    raise ValueError(f"Upserts are not supported on {dialect_name}")
+
+
+class CacheGenerationDB(Base):
+    """Generation of a cached namespace, bumped by writers outside the API's response cache"""
+    __tablename__ = "cache_generations"
+    namespace = Column(String, primary_key=True)
+    generation = Column(Integer, nullable=False, default=0)
+
+
+def generation_query(namespace: str):
+    return select(CacheGenerationDB.generation).where(CacheGenerationDB.namespace == namespace)
+
+
+def generation_bump(dialect_name: str, namespace: str):
+    table = CacheGenerationDB.__table__
+    stmt = dialect_insert(table, dialect_name).values(namespace=namespace, generation=1)
+    return stmt.on_conflict_do_update(index_elements=[table.c.namespace],
+                                      set_={"generation": table.c.generation + 1})
+
+
+def bump_generation(conn, namespace: str):
+    """Invalidate a namespace for every API worker; runs in the caller's transaction"""
+    conn.execute(generation_bump(conn.dialect.name, namespace))
+
+
+def add_missing_columns(engine):
+    """create_all() never alters existing tables; add nullable columns (and their indexes) added since"""
+    inspector = inspect(engine)
+    preparer = engine.dialect.identifier_preparer
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and column.nullable:
+                    conn.execute(text(
+                        f"ALTER TABLE {preparer.format_table(table)} "
+                        f"ADD COLUMN {preparer.quote(column.name)} {column.type.compile(engine.dialect)}"
+                    ))
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
+
+
+# -------------------------------
+# Sensor storage
+# -------------------------------
+SENSOR_COLUMNS = ("pH", "tds_ec", "orp", "turbidity", "temperature", "moisture", "rf_resonator")
+ION_COLUMNS = ("Na", "K", "Ca")
+CURVE_DTYPE = np.dtype("<f4")
+MIGRATION_BATCH_SIZE = 5000
+
+
+def sensor_values(sensors: Dict) -> Dict[str, Optional[float]]:
+    """Typed SampleDB column values for a SensorData dict"""
+    values = {name: sensors.get(name) for name in SENSOR_COLUMNS}
+    ions = sensors.get("ion_selective") or {}
+    values.update({ion: ions.get(ion) for ion in ION_COLUMNS})
+    return values
+
+
+def pack_curve(currents: Sequence[float]) -> bytes:
+    return np.asarray(currents, dtype=CURVE_DTYPE).tobytes()
+
+
+def unpack_curve(blob: Optional[bytes]) -> np.ndarray:
+    """A stored curve as a read-only float32 array; a sample without a curve gives an empty one"""
+    return np.frombuffer(blob, dtype=CURVE_DTYPE) if blob else np.empty(0, dtype=CURVE_DTYPE)
+
+
+def curve_record(sample_id: str, currents: Sequence[float]) -> Dict:
+    return {"sampleID": sample_id, "points": len(currents), "currents": pack_curve(currents)}
+
+
+def _taste_list(value):
+    # Older rows hold str(list), i.e. a Python repr rather than JSON
+    if value is None or isinstance(value, list):
+        return value
+    try:
+        return json.loads(value)
+    except ValueError:
+        return list(ast.literal_eval(value))
+
+
+def migrate_json_sensors(engine, batch_size: int = MIGRATION_BATCH_SIZE):
+    """Move the old samples.sensors JSON blob into the typed columns and sample_curves, then drop it"""
+    if "sensors" not in {column["name"] for column in inspect(engine).get_columns("samples")}:
+        return
+    samples, curves = SampleDB.__table__, SampleCurveDB.__table__
+    update_row = (
+        samples.update()
+        .where(samples.c.id == bindparam("_id"))
+        .values({name: bindparam(name) for name in SENSOR_COLUMNS + ION_COLUMNS + ("tasteProfile",)})
+    )
+    select_batch = text('SELECT id, "sampleID", sensors, "tasteProfile" FROM samples '
+                        'WHERE id > :after AND sensors IS NOT NULL ORDER BY id LIMIT :limit')
+    after = migrated = 0
+    while True:
+        # One transaction per batch; a rerun after an interruption repeats batches harmlessly
+        with engine.begin() as conn:
+            rows = conn.execute(select_batch, {"after": after, "limit": batch_size}).all()
+            if not rows:
+                break
+            updates, curve_rows = [], []
+            for row in rows:
+                sensors = json.loads(row.sensors) if isinstance(row.sensors, str) else row.sensors
+                updates.append(dict(sensor_values(sensors), _id=row.id, tasteProfile=_taste_list(row.tasteProfile)))
+                if sensors.get("voltammetry") is not None:
+                    curve_rows.append(curve_record(row.sampleID, sensors["voltammetry"]))
+            conn.execute(update_row, updates)
+            conn.execute(curves.delete().where(curves.c.sampleID.in_([row.sampleID for row in rows])))
+            if curve_rows:
+                conn.execute(curves.insert(), curve_rows)
+        after = rows[-1].id
+        migrated += len(rows)
+
+    with engine.begin() as conn:
+        if engine.dialect.name == "postgresql":
+            conn.execute(text('ALTER TABLE samples ALTER COLUMN "tasteProfile" TYPE JSON USING "tasteProfile"::json'))
+        conn.execute(text("ALTER TABLE samples DROP COLUMN sensors"))
+    print(f"Migrated sensor data of {migrated} samples to typed columns")
+
+
+# Arbitrary application-wide key for pg_advisory_lock
+SCHEMA_LOCK_KEY = 0x48455242
+
+
+@contextmanager
+def schema_lock(engine):
+    """Serialize schema upgrades between processes; a Postgres session-level advisory lock"""
+    if engine.dialect.name != "postgresql":
+        yield
+        return
+    with engine.connect() as conn:
+        conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": SCHEMA_LOCK_KEY})
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": SCHEMA_LOCK_KEY})
+
+
+def init_db():
+    """Create missing tables and columns and migrate old data; each step re-checks the schema under the lock"""
+    with schema_lock(engine):
+        Base.metadata.create_all(bind=engine)
+        add_missing_columns(engine)
+        migrate_json_sensors(engine)
+
+
+# Dependency to get an async DB session
+async def get_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def pool_status() -> dict:
+    """Checked-out / idle connection counts for the async engine's pool"""
+    pool = async_engine.pool
+    stats = {"pool": type(pool).__name__}
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        method = getattr(pool, name, None)
+        if callable(method):
+            stats[name] = method()
+    return stats
@@ -0,0 +1,146 @@
+"""
+Online drift and anomaly detection for classified sensor readings.
+
+Every reading that passes through the classify endpoints is folded into the
+running statistics of its stream, keyed by (instrument, herb) because each herb
+has its own normal range of pH, conductivity and so on. Per channel a stream
+keeps a Welford running mean / variance and an EWMA of recent readings, so an
+update is O(channels) with no history queries:
+
+* drift: the EWMA leaves the control limits
+  ``mean +/- DRIFT_LIMIT * sigma * sqrt(lambda / (2 - lambda))``, which catches
+  slow shifts such as temperature or pH electrode drift across a session;
+* anomaly: a single reading lies more than ``DRIFT_ANOMALY_Z`` sigma from the
+  running mean.
+
+Nothing is flagged until a stream has ``DRIFT_WARMUP`` readings. Outliers are
+clipped to the anomaly bound before they update the baseline, so one bad
+reading cannot widen the limits enough to hide later drift. Streams live in
+process memory, least recently used ones are evicted past
+``DRIFT_MAX_STREAMS``.
+"""
+
+from collections import Counter, OrderedDict
+from typing import Dict, List, Mapping, NamedTuple, Optional, Tuple
+import os
+import threading
+
+import numpy as np
+
+from database import ION_COLUMNS, SENSOR_COLUMNS
+
+DRIFT_LAMBDA = float(os.getenv("DRIFT_LAMBDA", "0.2"))
+DRIFT_LIMIT = float(os.getenv("DRIFT_LIMIT", "3"))
+DRIFT_ANOMALY_Z = float(os.getenv("DRIFT_ANOMALY_Z", "4"))
+DRIFT_WARMUP = int(os.getenv("DRIFT_WARMUP", "30"))
+DRIFT_MAX_STREAMS = int(os.getenv("DRIFT_MAX_STREAMS", "1000"))
+
+CHANNELS = SENSOR_COLUMNS + ION_COLUMNS
+DEFAULT_INSTRUMENT = "default"
+
+
+class DriftStatus(NamedTuple):
+    drifting: List[str]
+    anomalous: List[str]
+
+
+class ChannelStats:
+    """Running statistics of one stream, one array slot per channel"""
+    __slots__ = ("count", "mean", "m2", "ewma", "drifting")
+
+    def __init__(self, n: int):
+        self.count = np.zeros(n)
+        self.mean = np.zeros(n)
+        self.m2 = np.zeros(n)
+        self.ewma = np.full(n, np.nan)
+        self.drifting: List[str] = []
+
+    def update(self, x: np.ndarray, lam: float, limit: float, anomaly_z: float,
+               warmup: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Check a reading against the baseline so far, then fold it in; NaN channels are skipped"""
+        seen = np.isfinite(x)
+        std = np.sqrt(np.divide(self.m2, self.count - 1, out=np.zeros_like(self.m2), where=self.count > 1))
+        # A channel that has never varied has no control limits to leave
+        ready = seen & (self.count >= warmup) & (std > 0)
+
+        bound = anomaly_z * std
+        anomalous = ready & (np.abs(x - self.mean) > bound)
+        # Outliers move the baseline only as far as the anomaly bound
+        clipped = np.where(ready, np.clip(x, self.mean - bound, self.mean + bound), x)
+
+        self.ewma = np.where(seen, np.where(np.isnan(self.ewma), clipped, lam * clipped + (1 - lam) * self.ewma),
+                             self.ewma)
+        drifting = ready & (np.abs(self.ewma - self.mean) > limit * std * np.sqrt(lam / (2 - lam)))
+
+        # Welford
+        count = self.count + seen
+        delta = np.where(seen, clipped - self.mean, 0.0)
+        mean = self.mean + np.divide(delta, count, out=np.zeros_like(delta), where=count > 0)
+        self.m2 = self.m2 + np.where(seen, delta * (clipped - mean), 0.0)
+        self.count, self.mean = count, mean
+        return drifting, anomalous
+
+
+class DriftMonitor:
+    """Per (instrument, herb) drift and anomaly flags over the classified readings"""
+
+    def __init__(self, channels=CHANNELS, lam: float = DRIFT_LAMBDA, limit: float = DRIFT_LIMIT,
+                 anomaly_z: float = DRIFT_ANOMALY_Z, warmup: int = DRIFT_WARMUP,
+                 max_streams: int = DRIFT_MAX_STREAMS):
+        self.channels = tuple(channels)
+        self.lam = lam
+        self.limit = limit
+        self.anomaly_z = anomaly_z
+        self.warmup = max(2, warmup)
+        self.max_streams = max(1, max_streams)
+        self._streams: "OrderedDict[Tuple[str, str], ChannelStats]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._readings = 0
+        self._flagged = 0
+        self._drift_flags: Counter = Counter()
+        self._anomaly_flags: Counter = Counter()
+
+    def observe(self, instrument: Optional[str], herb: str, values: Mapping[str, Optional[float]]) -> DriftStatus:
+        """Fold one classified reading into its stream and return the channels flagged for it"""
+        x = np.array([np.nan if values.get(name) is None else values[name] for name in self.channels], dtype=np.float64)
+        key = (instrument or DEFAULT_INSTRUMENT, herb)
+        with self._lock:
+            stream = self._streams.get(key)
+            if stream is None:
+                stream = self._streams[key] = ChannelStats(len(self.channels))
+                if len(self._streams) > self.max_streams:
+                    self._streams.popitem(last=False)
+            else:
+                self._streams.move_to_end(key)
+            drifting, anomalous = stream.update(x, self.lam, self.limit, self.anomaly_z, self.warmup)
+            status = DriftStatus([name for name, flag in zip(self.channels, drifting) if flag],
+                                 [name for name, flag in zip(self.channels, anomalous) if flag])
+            stream.drifting = status.drifting
+            self._readings += 1
+            if status.drifting or status.anomalous:
+                self._flagged += 1
+            self._drift_flags.update(status.drifting)
+            self._anomaly_flags.update(status.anomalous)
+        return status
+
+    def reset(self, instrument: Optional[str] = None):
+        """Forget the baselines of one instrument (e.g. after recalibration), or of all of them"""
+        with self._lock:
+            if instrument is None:
+                self._streams.clear()
+            else:
+                for key in [key for key in self._streams if key[0] == instrument]:
+                    del self._streams[key]
+
+    def stats(self) -> Dict:
+        """Flag counts since startup and the streams whose last reading was drifting"""
+        with self._lock:
+            return {
+                "streams": len(self._streams),
+                "readings": self._readings,
+                "flaggedReadings": self._flagged,
+                "driftFlags": dict(self._drift_flags),
+                "anomalyFlags": dict(self._anomaly_flags),
+                "drifting": [{"instrumentId": instrument, "herbName": herb, "channels": stream.drifting}
+                             for (instrument, herb), stream in self._streams.items() if stream.drifting],
+            }
@@ -0,0 +1,196 @@
+"""
+Streaming history export.
+
+Rows are read from the database in ``EXPORT_BATCH_SIZE`` partitions with
+``yield_per`` (a server-side cursor on Postgres) and encoded batch by batch,
+as CSV through ``csv.writer`` or as Parquet row groups when ``pyarrow`` is
+installed. Memory use stays bounded by one batch whether the export is
+streamed to an HTTP client or written to a file by the Celery task.
+"""
+
+from datetime import datetime
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Sequence
+import csv
+import io
+import os
+import uuid
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from database import AsyncSessionLocal, SampleDB
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet export is optional
+    pa = pq = None
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "5000"))
+EXPORT_DIR = os.getenv("EXPORT_DIR", os.path.join(os.path.dirname(__file__), "exports"))
+MEDIA_TYPES = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+
+EXPORT_COLUMNS = (SampleDB.sampleID, SampleDB.herbName, SampleDB.purityPercent, SampleDB.adulterationFlag,
+                  SampleDB.timestamp, SampleDB.confidenceScore, SampleDB.modelVersion)
+
+
+class ExportUnavailable(RuntimeError):
+    """The requested export format needs an optional dependency that is not installed"""
+
+
+def check_available(fmt: str):
+    if fmt == "parquet" and pq is None:
+        raise ExportUnavailable("Parquet export requires pyarrow")
+
+
+def export_query(herbName: Optional[str] = None, adulterated: Optional[bool] = None,
+                 minPurity: Optional[float] = None, maxPurity: Optional[float] = None,
+                 start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """Export columns in (timestamp, id) order, with the same filters as /api/history"""
+    query = select(*EXPORT_COLUMNS).order_by(SampleDB.timestamp, SampleDB.id)
+    if herbName:
+        query = query.where(SampleDB.herbName == herbName)
+    if adulterated is not None:
+        query = query.where(SampleDB.adulterationFlag == adulterated)
+    if minPurity is not None:
+        query = query.where(SampleDB.purityPercent >= minPurity)
+    if maxPurity is not None:
+        query = query.where(SampleDB.purityPercent <= maxPurity)
+    if start:
+        query = query.where(SampleDB.timestamp >= start)
+    if end:
+        query = query.where(SampleDB.timestamp < end)
+    return query
+
+
+# -------------------------------
+# Encoders
+# -------------------------------
+class CsvEncoder:
+    """Encode row batches as CSV text, header first"""
+
+    def __init__(self):
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+        self._writer.writerow([column.key for column in EXPORT_COLUMNS])
+
+    def encode(self, rows: Sequence) -> bytes:
+        self._writer.writerows(rows)
+        return self._drain()
+
+    def finish(self) -> bytes:
+        return self._drain()
+
+    def _drain(self) -> bytes:
+        data = self._buffer.getvalue().encode()
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+
+class _ChunkSink:
+    """Write-only file object handing back whatever pyarrow wrote since the last drain"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class ParquetEncoder:
+    """Encode row batches as Parquet, one row group per batch"""
+
+    def __init__(self):
+        check_available("parquet")
+        self._schema = pa.schema([
+            ("sampleID", pa.string()),
+            ("herbName", pa.string()),
+            ("purityPercent", pa.float64()),
+            ("adulterationFlag", pa.bool_()),
+            ("timestamp", pa.timestamp("us")),
+            ("confidenceScore", pa.float64()),
+            ("modelVersion", pa.string()),
+        ])
+        self._sink = _ChunkSink()
+        self._writer = pq.ParquetWriter(pa.PythonFile(self._sink, mode="w"), self._schema)
+
+    def encode(self, rows: Sequence) -> bytes:
+        columns = [pa.array(values, type=field.type) for values, field in zip(zip(*rows), self._schema)]
+        self._writer.write_batch(pa.record_batch(columns, schema=self._schema))
+        return self._sink.drain()
+
+    def finish(self) -> bytes:
+        self._writer.close()
+        return self._sink.drain()
+
+
+def make_encoder(fmt: str):
+    if fmt == "csv":
+        return CsvEncoder()
+    if fmt == "parquet":
+        return ParquetEncoder()
+    raise ValueError(f"Unknown export format {fmt!r}")
+
+
+# -------------------------------
+# Streaming and file exports
+# -------------------------------
+def iter_batches(db: Session, query, batch_size: int = EXPORT_BATCH_SIZE) -> Iterator[List]:
+    result = db.execute(query.execution_options(yield_per=batch_size))
+    for partition in result.partitions():
+        yield partition
+
+
+async def stream_export(fmt: str, query, batch_size: int = EXPORT_BATCH_SIZE) -> AsyncIterator[bytes]:
+    """Encoded export bytes, one DB partition at a time, for a StreamingResponse
+
+    Uses its own session so the cursor stays open for as long as the client reads.
+    """
+    encoder = make_encoder(fmt)
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query.execution_options(yield_per=batch_size))
+        async for partition in result.partitions():
+            yield encoder.encode(partition)
+    yield encoder.finish()
+
+
+def write_export(db: Session, fmt: str, query, directory: str = EXPORT_DIR,
+                 prefix: str = "history", batch_size: int = EXPORT_BATCH_SIZE) -> Dict:
+    """Write an export file and return its path and size; the file appears only once complete"""
+    encoder = make_encoder(fmt)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"{prefix}-{datetime.utcnow():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}.{fmt}")
+    staging = path + ".tmp"
+    rows = 0
+    try:
+        with open(staging, "wb") as f:
+            for partition in iter_batches(db, query, batch_size):
+                f.write(encoder.encode(partition))
+                rows += len(partition)
+            f.write(encoder.finish())
+        os.replace(staging, path)
+    except BaseException:
+        if os.path.exists(staging):
+            os.remove(staging)
+        raise
+    return {"path": path, "format": fmt, "rows": rows, "bytes": os.path.getsize(path)}
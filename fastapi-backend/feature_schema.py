@@ -0,0 +1,157 @@
+"""
+Compiled feature schema: the one definition of a model's input columns.
+
+A ``FeatureSchema`` is an ordered list of feature names, each bound to its
+source in the sensor payload (``sensors.tds_ec``, ``sensors.ion_selective.Na``,
+``curve.voltammetry_area``...). Training stores it in ``model_metadata.json``
+under ``feature_schema``; serving rebuilds it from there and refuses to load a
+model whose stored schema does not match what this code would build, so a
+renamed source or a changed curve definition fails at load time instead of
+silently skewing predictions.
+
+``build()`` writes rows straight into one preallocated contiguous float64
+matrix from ``SensorData`` objects or raw dicts: scalar columns are streamed
+with ``np.fromiter`` and curve columns come from one vectorized pass over the
+batch, without intermediate per-row Python lists. ``build_columns()`` does the
+same from the typed columns and packed curves stored in the database.
+"""
+
+from typing import Any, Dict, Mapping, Optional, Sequence
+import hashlib
+import json
+
+import numpy as np
+
+from features import CURVE_FEATURES, FEATURE_NAMES, ION_FEATURES, LEGACY_FEATURES, SENSOR_FEATURES, curve_features, pad_curves
+
+# Bump when the meaning of an existing feature changes (e.g. a new curve definition)
+SCHEMA_REVISION = 1
+
+SOURCES: Dict[str, str] = {}
+SOURCES.update({name: f"sensors.{field}" for name, field in SENSOR_FEATURES})
+SOURCES.update({ion: f"sensors.ion_selective.{ion}" for ion in ION_FEATURES})
+SOURCES.update({name: f"curve.{name}" for name in CURVE_FEATURES})
+
+
+class SchemaMismatch(ValueError):
+    """A model's stored feature schema is not the one this code builds"""
+
+
+class FeatureSchema:
+    """Ordered model input columns, compiled into direct accessors over sensor payloads"""
+
+    def __init__(self, names: Sequence[str]):
+        unknown = [name for name in names if name not in SOURCES]
+        if unknown:
+            raise SchemaMismatch(f"Unknown features {unknown}")
+        self.names = tuple(names)
+        self.n_features = len(self.names)
+        self._positions = np.array([FEATURE_NAMES.index(name) for name in self.names], dtype=np.intp)
+        self._scalars = [(column, SOURCES[name].split(".")[1:]) for column, name in enumerate(self.names)
+                         if not SOURCES[name].startswith("curve.")]
+        self._scalar_columns = np.array([column for column, _ in self._scalars], dtype=np.intp)
+        curves = [(column, CURVE_FEATURES.index(name)) for column, name in enumerate(self.names) if name in CURVE_FEATURES]
+        self._curve_columns = np.array([column for column, _ in curves], dtype=np.intp)
+        self._curve_indices = np.array([index for _, index in curves], dtype=np.intp)
+
+    @property
+    def fingerprint(self) -> str:
+        encoded = json.dumps({"revision": SCHEMA_REVISION, "columns": [[name, SOURCES[name]] for name in self.names]})
+        return hashlib.sha256(encoded.encode()).hexdigest()
+
+    def to_metadata(self) -> Dict[str, Any]:
+        return {
+            "revision": SCHEMA_REVISION,
+            "columns": [{"name": name, "source": SOURCES[name]} for name in self.names],
+            "fingerprint": self.fingerprint,
+        }
+
+    @classmethod
+    def from_metadata(cls, metadata: Dict[str, Any]) -> "FeatureSchema":
+        """Rebuild a stored schema, raising SchemaMismatch if this code would build it differently"""
+        schema = cls([column["name"] for column in metadata["columns"]])
+        stored = {column["name"]: column.get("source") for column in metadata["columns"]}
+        moved = [name for name in schema.names if stored[name] != SOURCES[name]]
+        if moved:
+            raise SchemaMismatch(f"Feature sources changed for {moved}")
+        if metadata.get("revision") != SCHEMA_REVISION:
+            raise SchemaMismatch(f"Feature schema revision {metadata.get('revision')} does not match {SCHEMA_REVISION}")
+        if metadata.get("fingerprint") != schema.fingerprint:
+            raise SchemaMismatch("Feature schema fingerprint does not match its columns")
+        return schema
+
+    def build(self, sensors_list: Sequence[Any], out: Optional[np.ndarray] = None) -> np.ndarray:
+        """(n, n_features) float64 rows for SensorData objects or sensor dicts"""
+        n = len(sensors_list)
+        if out is None:
+            out = np.empty((n, self.n_features), dtype=np.float64)
+        if n == 0:
+            return out
+        get = _item if isinstance(sensors_list[0], dict) else _attribute
+
+        if len(self._scalars):
+            paths = [path for _, path in self._scalars]
+            values = np.fromiter((_lookup(get, sensors, path) for sensors in sensors_list for path in paths),
+                                 dtype=np.float64, count=n * len(paths))
+            out[:, self._scalar_columns] = values.reshape(n, len(paths))
+        if len(self._curve_columns):
+            currents, lengths = pad_curves([get(sensors, "voltammetry") or () for sensors in sensors_list])
+            out[:, self._curve_columns] = curve_features(currents, lengths)[:, self._curve_indices]
+        return out
+
+    def build_columns(self, columns: Mapping[str, np.ndarray], curves: Sequence[np.ndarray]) -> np.ndarray:
+        """(n, n_features) float64 rows from stored sensor columns (keyed by SampleDB column name) and curves.
+
+        Missing ion readings count as zero; any other missing value comes out as NaN.
+        """
+        n = len(curves)
+        out = np.empty((n, self.n_features), dtype=np.float64)
+        for column, path in self._scalars:
+            values = np.asarray(columns[path[-1]], dtype=np.float64)
+            out[:, column] = np.nan_to_num(values, nan=0.0) if path[0] == "ion_selective" else values
+        if len(self._curve_columns) and n:
+            currents, lengths = pad_curves(curves)
+            out[:, self._curve_columns] = curve_features(currents, lengths)[:, self._curve_indices]
+        return out
+
+    def select(self, full: np.ndarray) -> np.ndarray:
+        """This schema's columns from rows built with FULL_SCHEMA"""
+        if self.names == FEATURE_NAMES:
+            return full
+        return full[:, self._positions]
+
+    def __repr__(self) -> str:
+        return f"FeatureSchema({list(self.names)})"
+
+
+def _item(obj, key):
+    return obj.get(key) if obj is not None else None
+
+
+def _attribute(obj, key):
+    return getattr(obj, key, None)
+
+
+def _lookup(get, sensors, path) -> float:
+    value = sensors
+    for key in path:
+        value = get(value, key)
+    if value is None:
+        # A missing ion reading counts as zero, as in training data without ion columns
+        if path[0] == "ion_selective":
+            return 0.0
+        raise KeyError(".".join(path))
+    return value
+
+
+FULL_SCHEMA = FeatureSchema(FEATURE_NAMES)
+LEGACY_SCHEMA = FeatureSchema(LEGACY_FEATURES)
+
+
+def schema_from_metadata(metadata: Dict[str, Any]) -> FeatureSchema:
+    """The stored schema, else one built from the plain ``features`` list, else the legacy eight"""
+    if "feature_schema" in metadata:
+        return FeatureSchema.from_metadata(metadata["feature_schema"])
+    if metadata.get("features"):
+        return FeatureSchema(metadata["features"])
+    return LEGACY_SCHEMA
@@ -0,0 +1,152 @@
+"""
+Feature extraction shared by training and serving.
+
+Every reading is turned into the full ``FEATURE_NAMES`` row: the scalar
+sensors, the ion-selective electrodes and a set of voltammetry curve features
+(peak current and potential, area, slope, derivative extrema). Curves are
+processed a whole batch at a time on a NaN-padded 2-D array, so there is no
+per-sample Python loop over the curve points.
+
+Which of these features a model uses, in which order, is its feature schema
+(see ``feature_schema.py``).
+"""
+
+from typing import Optional, Sequence, Tuple
+import json
+
+import numpy as np
+
+# Scalar sensor features: training (CSV) column name -> API SensorData field
+SENSOR_FEATURES = (
+    ('pH', 'pH'),
+    ('Conductivity', 'tds_ec'),
+    ('ORP', 'orp'),
+    ('Turbidity', 'turbidity'),
+    ('Temperature', 'temperature'),
+    ('Moisture', 'moisture'),
+    ('RF_Resonator', 'rf_resonator'),
+)
+ION_FEATURES = ('Na', 'K', 'Ca')
+CURVE_FEATURES = (
+    'voltammetry_mean',
+    'voltammetry_peak_current',
+    'voltammetry_peak_potential',
+    'voltammetry_area',
+    'voltammetry_slope',
+    'voltammetry_max_derivative',
+    'voltammetry_min_derivative',
+)
+FEATURE_NAMES = tuple(name for name, _ in SENSOR_FEATURES) + ION_FEATURES + CURVE_FEATURES
+
+# The feature set of models trained before curve and ion features existed
+LEGACY_FEATURES = ('pH', 'Conductivity', 'ORP', 'Turbidity', 'Temperature', 'Moisture', 'RF_Resonator',
+                   'voltammetry_mean')
+
+# The API only receives currents; they are sampled on the same sweep as the training data
+VOLTAMMETRY_START = 0.1
+VOLTAMMETRY_STEP = 0.1
+
+_N_SCALARS = len(SENSOR_FEATURES) + len(ION_FEATURES)
+
+
+def pad_curves(curves: Sequence[Sequence[float]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Stack ragged curves into an (n, max_len) float64 array padded with NaN, plus their lengths"""
+    lengths = np.fromiter((len(curve) for curve in curves), dtype=np.intp, count=len(curves))
+    width = int(lengths.max()) if len(lengths) else 0
+    padded = np.full((len(curves), width), np.nan)
+    if width:
+        padded[np.arange(width) < lengths[:, np.newaxis]] = np.concatenate([np.asarray(c, dtype=np.float64) for c in curves])
+    return padded, lengths
+
+
+def default_potentials(width: int) -> np.ndarray:
+    return VOLTAMMETRY_START + VOLTAMMETRY_STEP * np.arange(width)
+
+
+def curve_features(currents: np.ndarray, lengths: np.ndarray, potentials: Optional[np.ndarray] = None) -> np.ndarray:
+    """Curve features for a padded (n, width) batch of voltammograms; empty curves give zeros"""
+    n, width = currents.shape
+    out = np.zeros((n, len(CURVE_FEATURES)))
+    if width == 0:
+        return out
+    if potentials is None:
+        potentials = np.broadcast_to(default_potentials(width), currents.shape)
+    valid = np.arange(width) < lengths[:, np.newaxis]
+    has_points = lengths > 0
+    counts = np.maximum(lengths, 1)
+
+    current = np.where(valid, currents, 0.0)
+    potential = np.where(valid, potentials, 0.0)
+    mean_current = current.sum(axis=1) / counts
+    mean_potential = potential.sum(axis=1) / counts
+
+    peak = np.where(valid, currents, -np.inf).argmax(axis=1)
+    rows = np.arange(n)
+
+    # Trapezoid area and finite-difference derivative over consecutive valid points
+    pair_valid = valid[:, 1:]
+    d_potential = np.diff(potential, axis=1)
+    d_current = np.diff(current, axis=1)
+    area = np.where(pair_valid, (current[:, 1:] + current[:, :-1]) * 0.5 * d_potential, 0.0).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        derivative = d_current / d_potential
+    derivative_valid = pair_valid & np.isfinite(derivative)
+    has_pairs = derivative_valid.any(axis=1)
+
+    # Least-squares slope of current against potential
+    centred_potential = np.where(valid, potential - mean_potential[:, np.newaxis], 0.0)
+    centred_current = np.where(valid, current - mean_current[:, np.newaxis], 0.0)
+    variance = (centred_potential ** 2).sum(axis=1)
+    covariance = (centred_potential * centred_current).sum(axis=1)
+
+    out[:, 0] = mean_current
+    out[:, 1] = np.where(has_points, currents[rows, peak], 0.0)
+    out[:, 2] = np.where(has_points, potentials[rows, peak], 0.0)
+    out[:, 3] = area
+    out[:, 4] = np.divide(covariance, variance, out=np.zeros(n), where=variance > 0)
+    out[:, 5] = np.where(has_pairs, np.where(derivative_valid, derivative, -np.inf).max(axis=1, initial=-np.inf), 0.0)
+    out[:, 6] = np.where(has_pairs, np.where(derivative_valid, derivative, np.inf).min(axis=1, initial=np.inf), 0.0)
+    return out
+
+
+def extract_frame_features(df) -> np.ndarray:
+    """Full feature matrix for a training DataFrame in the sample-sensor-data.csv layout"""
+    features = np.zeros((len(df), len(FEATURE_NAMES)), dtype=np.float64)
+    for j, (name, _) in enumerate(SENSOR_FEATURES):
+        features[:, j] = df[name].to_numpy(dtype=np.float64)
+    for j, ion in enumerate(ION_FEATURES, start=len(SENSOR_FEATURES)):
+        if ion in df:
+            features[:, j] = df[ion].fillna(0.0).to_numpy(dtype=np.float64)
+
+    curves = [curve or {} for curve in _parse_curves(df['Voltammetry'].fillna('null').tolist())]
+    currents, lengths = pad_curves([curve.get('Current', ()) for curve in curves])
+    # Measured sweep potentials where they line up with the currents, the standard sweep otherwise
+    potentials, _ = pad_curves([
+        curve['Voltage'] if curve.get('Voltage') is not None and len(curve['Voltage']) == len(curve.get('Current', ()))
+        else default_potentials(len(curve.get('Current', ())))
+        for curve in curves
+    ])
+    features[:, _N_SCALARS:] = curve_features(currents, lengths, potentials if potentials.size else None)
+    return features
+
+
+def _parse_curves(raw: Sequence[str]) -> list:
+    # One json.loads for the whole column instead of one per row. A cell holding several
+    # comma-separated values would shift every later curve onto the wrong row, so the joined
+    # parse is only trusted with one curve object (or null) per cell; otherwise parse per row
+    try:
+        curves = json.loads('[' + ','.join(raw) + ']')
+    except ValueError:
+        curves = None
+    if curves is not None and len(curves) == len(raw) and all(c is None or isinstance(c, dict) for c in curves):
+        return curves
+    return [_parse_curve(cell) for cell in raw]
+
+
+def _parse_curve(cell: str) -> Optional[dict]:
+    """One Voltammetry cell, or None if it is not a curve object"""
+    try:
+        curve = json.loads(cell)
+    except ValueError:
+        return None
+    return curve if isinstance(curve, dict) else None
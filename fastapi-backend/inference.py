@@ -0,0 +1,142 @@
+"""
+Shared ML inference for the API and the Celery workers.
+
+The herb classifier is evaluated once per batch with ``predict_proba``; the
+predicted label, its confidence and the top-k alternatives are all derived
+from that single probability matrix instead of walking the forest again with
+``predict``.
+"""
+
+from typing import List, NamedTuple, Optional, Sequence, Tuple, Union
+import os
+
+import joblib
+import numpy as np
+
+from feature_schema import LEGACY_SCHEMA, FeatureSchema
+from inference_pipeline import PIPELINE_DIR, InferencePipeline
+from metrics import INFER_ADULTERATION, INFER_HERB
+
+MODELS_DIR = os.getenv('MODELS_DIR', os.path.join(os.path.dirname(__file__), 'models'))
+TOP_K = 3
+USE_COMPILED_FORESTS = os.getenv('USE_COMPILED_FORESTS', '1') == '1'
+MODELS_MMAP = os.getenv('MODELS_MMAP', '1') == '1'
+
+
+class ModelBundle(NamedTuple):
+    """The trained sklearn estimators, used when no compiled pipeline is available"""
+    herb_clf: object
+    herb_scaler: object
+    label_encoder: object
+    adulteration_clf: object
+    adulteration_scaler: object
+
+    @property
+    def herb_labels(self) -> np.ndarray:
+        return self.label_encoder.inverse_transform(self.herb_clf.classes_)
+
+    def evaluate(self, features: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Herb class probabilities and adulteration flags for a raw feature matrix"""
+        with INFER_HERB.time():
+            herb_proba = self.herb_clf.predict_proba(self.herb_scaler.transform(features))
+        with INFER_ADULTERATION.time():
+            adulteration = self.adulteration_clf.predict(self.adulteration_scaler.transform(features)).astype(bool)
+        return herb_proba, adulteration
+
+
+class Prediction(NamedTuple):
+    herb_name: str
+    confidence: float
+    adulteration: bool
+    candidates: List[Tuple[str, float]]  # (herb name, probability), best first
+    model_version: Optional[str] = None
+
+
+def load_ml_models(models_dir: str = MODELS_DIR) -> Union[InferencePipeline, ModelBundle, None]:
+    """Load trained ML models, or return None if they have not been trained yet"""
+    pipeline_path = os.path.join(models_dir, PIPELINE_DIR)
+    if USE_COMPILED_FORESTS and os.path.isdir(pipeline_path):
+        pipeline = InferencePipeline.load(pipeline_path, mmap_mode='r' if MODELS_MMAP else None)
+        print("ML models loaded successfully (compiled inference pipeline)")
+        return pipeline
+    try:
+        models = ModelBundle(
+            herb_clf=joblib.load(os.path.join(models_dir, 'herb_classifier.pkl')),
+            herb_scaler=joblib.load(os.path.join(models_dir, 'herb_scaler.pkl')),
+            label_encoder=joblib.load(os.path.join(models_dir, 'label_encoder.pkl')),
+            adulteration_clf=joblib.load(os.path.join(models_dir, 'adulteration_detector.pkl')),
+            adulteration_scaler=joblib.load(os.path.join(models_dir, 'adulteration_scaler.pkl')),
+        )
+    except FileNotFoundError:
+        print("Warning: ML models not found. Using fallback classification logic.")
+        return None
+    print("ML models loaded successfully")
+    return models
+
+
+def build_feature_matrix(sensors_list: Sequence, schema: FeatureSchema = LEGACY_SCHEMA) -> np.ndarray:
+    """Feature matrix for sensor readings (SensorData or dicts) in a model's feature schema"""
+    return schema.build(sensors_list)
+
+
+def purity_percent(confidence: float, adulteration: bool) -> float:
+    """Purity derived from classifier confidence, penalised for adulteration"""
+    purity = confidence * 100 * (0.7 if adulteration else 1.0)
+    return max(0, min(100, purity))
+
+
+TASTE_PROFILES = {
+    "Ashwagandha": ["bitter", "earthy"],
+    "Turmeric": ["bitter", "pungent"],
+    "Ginger": ["spicy", "pungent"],
+    "Brahmi": ["bitter", "astringent"],
+    "Tulsi": ["pungent", "aromatic"],
+    "Amla": ["sour", "astringent"],
+    "Neem": ["bitter", "pungent"],
+    "Triphala": ["sour", "astringent"],
+    "Shatavari": ["sweet", "bitter"],
+    "Moringa": ["bitter", "peppery"]
+}
+
+
+def taste_profile(herb_name: str, adulteration: bool) -> List[str]:
+    """Taste profile based on herb and adulteration"""
+    taste = list(TASTE_PROFILES.get(herb_name, ["unknown"]))
+    if adulteration:
+        taste.extend(["off-flavor", "chemical"])
+    return taste
+
+
+def recommendation_for(purity: float, adulteration: bool) -> str:
+    if adulteration:
+        return "Sample shows signs of adulteration. Not recommended for Ayurvedic use."
+    elif purity > 90:
+        return "High purity sample. Safe for Ayurvedic use."
+    elif purity > 75:
+        return "Moderate purity. Use with caution and verify source."
+    return "Low purity detected. Further testing recommended."
+
+
+def predict(models: Union[InferencePipeline, ModelBundle], features: np.ndarray,
+            model_version: Optional[str] = None, top_k: int = TOP_K) -> List[Prediction]:
+    """Run both models once over a feature matrix and return one Prediction per row"""
+    if len(features) == 0:
+        return []
+
+    herb_probabilities, adulteration_pred = models.evaluate(features)
+    # A stable sort keeps the first of tied classes first, matching predict()'s argmax
+    order = np.argsort(-herb_probabilities, axis=1, kind='stable')[:, :top_k]
+    top_probabilities = np.take_along_axis(herb_probabilities, order, axis=1)
+    top_names = models.herb_labels[order]
+
+    predictions = []
+    for names, probabilities, adulteration in zip(top_names, top_probabilities, adulteration_pred):
+        candidates = [(str(name), float(p)) for name, p in zip(names, probabilities)]
+        predictions.append(Prediction(
+            herb_name=candidates[0][0],
+            confidence=candidates[0][1],
+            adulteration=bool(adulteration),
+            candidates=candidates,
+            model_version=model_version,
+        ))
+    return predictions
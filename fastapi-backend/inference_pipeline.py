@@ -0,0 +1,105 @@
+"""
+Single-artifact inference pipeline for both models.
+
+``save_models()`` writes the ``inference_pipeline/`` directory holding the herb
+classifier and the adulteration detector as compiled forests together with
+both StandardScalers stacked into one (2, n_features) affine transform. A raw
+feature matrix is scaled for both models by one broadcast subtract and one
+divide into per-thread preallocated buffers; the divide writes float32
+directly, which is the dtype the tree traversal needs, so a sample goes from
+raw sensor values to both predictions without intermediate copies.
+
+Every array is stored as its own ``.npy`` file so it can be memory-mapped
+read-only: all API and Celery worker processes on a host then share the node
+arrays through the page cache instead of each holding a private copy.
+"""
+
+from typing import Dict, Optional, Tuple
+import os
+import shutil
+import threading
+
+import numpy as np
+
+from compiled_forest import CompiledForest, compile_forest
+from metrics import INFER_ADULTERATION, INFER_HERB
+
+PIPELINE_DIR = 'inference_pipeline'
+_FORESTS = ('herb', 'adulteration')
+
+
+def build_pipeline(herb_clf, herb_scaler, label_encoder, adulteration_clf, adulteration_scaler) -> Dict[str, np.ndarray]:
+    """Combine both trained forests, their scalers and the herb labels into one array set"""
+    arrays = {
+        'scaler_mean': np.vstack([herb_scaler.mean_, adulteration_scaler.mean_]).astype(np.float64),
+        'scaler_scale': np.vstack([herb_scaler.scale_, adulteration_scaler.scale_]).astype(np.float64),
+        'herb_labels': np.asarray(label_encoder.inverse_transform(herb_clf.classes_)).astype(str),
+    }
+    for prefix, forest in zip(_FORESTS, (herb_clf, adulteration_clf)):
+        for name, array in compile_forest(forest).items():
+            arrays[f'{prefix}_{name}'] = array
+    return arrays
+
+
+def save_pipeline(path: str, arrays: Dict[str, np.ndarray]):
+    """Write one .npy per array, replacing any previous pipeline at path"""
+    staging = path + '.tmp'
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    for name, array in arrays.items():
+        np.save(os.path.join(staging, name + '.npy'), np.ascontiguousarray(array), allow_pickle=False)
+    shutil.rmtree(path, ignore_errors=True)
+    os.rename(staging, path)
+
+
+class InferencePipeline:
+    """Fused scaling plus both compiled forests"""
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self.scaler_mean = np.ascontiguousarray(arrays['scaler_mean'])[:, np.newaxis, :]
+        self.scaler_scale = np.ascontiguousarray(arrays['scaler_scale'])[:, np.newaxis, :]
+        self.herb_labels = np.asarray(arrays['herb_labels'])
+        self.herb_forest, self.adulteration_forest = (
+            CompiledForest({name[len(prefix) + 1:]: array for name, array in arrays.items()
+                            if name.startswith(prefix + '_')})
+            for prefix in _FORESTS
+        )
+        self.n_features = self.scaler_mean.shape[2]
+        self._local = threading.local()
+
+    @classmethod
+    def load(cls, path: str, mmap_mode: Optional[str] = 'r') -> 'InferencePipeline':
+        """Load a pipeline directory, memory-mapping the arrays read-only by default"""
+        arrays = {}
+        for filename in os.listdir(path):
+            if filename.endswith('.npy'):
+                arrays[filename[:-4]] = np.load(os.path.join(path, filename), mmap_mode=mmap_mode, allow_pickle=False)
+        return cls(arrays)
+
+    def _buffers(self, n_rows: int) -> Tuple[np.ndarray, np.ndarray]:
+        # Per-thread so concurrent batch requests never share scratch space
+        local = self._local
+        buf64 = getattr(local, 'buf64', None)
+        if buf64 is None or buf64.shape[1] < n_rows:
+            capacity = max(n_rows, 64)
+            local.buf64 = buf64 = np.empty((2, capacity, self.n_features), dtype=np.float64)
+            local.buf32 = np.empty((2, capacity, self.n_features), dtype=np.float32)
+        return buf64[:, :n_rows], local.buf32[:, :n_rows]
+
+    def scale(self, features: np.ndarray) -> np.ndarray:
+        """Both scalers in one fused step; returns float32 rows of shape (2, n, n_features)"""
+        buf64, buf32 = self._buffers(features.shape[0])
+        np.subtract(features, self.scaler_mean, out=buf64)
+        np.divide(buf64, self.scaler_scale, out=buf32, casting='same_kind')
+        return buf32
+
+    def evaluate(self, features: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Herb class probabilities and adulteration flags for a raw feature matrix"""
+        # The fused scaling of both models is counted in the herb stage
+        with INFER_HERB.time():
+            scaled = self.scale(features)
+            herb_proba = self.herb_forest.leaf_proba(self.herb_forest.walk(scaled[0]))
+        with INFER_ADULTERATION.time():
+            adulteration_proba = self.adulteration_forest.leaf_proba(self.adulteration_forest.walk(scaled[1]))
+            adulteration = self.adulteration_forest.classes_.take(np.argmax(adulteration_proba, axis=1)).astype(bool)
+        return herb_proba, adulteration
@@ -0,0 +1,123 @@
+"""
+Bulk sample ingestion.
+
+Rows are written in chunks with one core ``INSERT ... ON CONFLICT`` statement
+executed as an executemany per chunk, bypassing the ORM unit of work. A
+duplicate ``sampleID`` is either skipped or upserted instead of failing the
+whole upload, and a single lookup per chunk tells which IDs already existed so
+the inserted / updated / duplicate counts are exact. Each record's voltammetry
+curve is written to ``sample_curves`` alongside it with the same semantics, and
+the ``/api/stats`` rollups are adjusted in the same transaction.
+"""
+
+from typing import Dict, List, NamedTuple, Sequence, Tuple
+import os
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import SampleCurveDB, SampleDB, curve_record, dialect_insert, generation_bump
+from rollups import CLASSIFICATION_COLUMNS, Classification, classifications, rollup_statements
+
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "1000"))
+INGEST_MODES = ("skip", "upsert")
+
+# Re-uploaded sensors invalidate any earlier classification of that sample
+_RESET_ON_UPSERT = ("herbName", "purityPercent", "adulterationFlag", "confidenceScore",
+                    "tasteProfile", "recommendation", "modelVersion")
+
+
+CURVE_COLUMNS = ("sampleID", "points", "currents")
+
+
+class IngestResult(NamedTuple):
+    inserted: int
+    updated: int
+    duplicates: int
+    written: Tuple[str, ...] = ()  # sampleIDs inserted or upserted, in input order; skipped ones are left out
+
+
+def split_curves(records: Sequence[Dict]) -> Tuple[List[Dict], List[Dict]]:
+    """samples rows and sample_curves rows for records that carry their curve under ``voltammetry``"""
+    rows, curves = [], []
+    for record in records:
+        row = dict(record)
+        currents = row.pop("voltammetry", None)
+        if currents is not None:
+            curves.append(curve_record(row["sampleID"], currents))
+        rows.append(row)
+    return rows, curves
+
+
+async def update_rollups(db: AsyncSession, added: Sequence[Classification], removed: Sequence[Classification] = ()):
+    for stmt, params in rollup_statements(db.bind.dialect.name, added, removed):
+        await db.execute(stmt, params)
+
+
+async def bump_history(db: AsyncSession):
+    """Move the shared history generation so every API worker drops its cached pages.
+
+    Run last before the commit so the row lock on the counter is held briefly.
+    """
+    await db.execute(generation_bump(db.bind.dialect.name, "history"))
+
+
+async def insert_samples(db: AsyncSession, records: Sequence[Dict]):
+    """Plain INSERT of new samples, their curves and their rollup counts; the caller commits"""
+    rows, curves = split_curves(records)
+    await db.execute(SampleDB.__table__.insert(), rows)
+    if curves:
+        await db.execute(SampleCurveDB.__table__.insert(), curves)
+    await update_rollups(db, classifications(rows))
+    await bump_history(db)
+
+
+def _insert_statement(table, dialect_name: str, mode: str, columns: Sequence[str], reset: Sequence[str] = ()):
+    stmt = dialect_insert(table, dialect_name)
+    if mode == "skip":
+        return stmt.on_conflict_do_nothing(index_elements=[table.c.sampleID])
+    update = {name: stmt.excluded[name] for name in columns if name != "sampleID"}
+    update.update({name: None for name in reset if name not in columns})
+    return stmt.on_conflict_do_update(index_elements=[table.c.sampleID], set_=update)
+
+
+async def ingest_samples(db: AsyncSession, records: Sequence[Dict], mode: str = "skip",
+                         chunk_size: int = INGEST_CHUNK_SIZE) -> IngestResult:
+    """Insert sample rows in chunks; records must share one set of keys and have unique sampleIDs.
+
+    Commits once at the end.
+    """
+    if mode not in INGEST_MODES:
+        raise ValueError(f"Unknown ingest mode {mode!r}")
+    if not records:
+        return IngestResult(0, 0, 0)
+
+    dialect_name = db.bind.dialect.name
+    columns = [name for name in records[0] if name != "voltammetry"]
+    stmt = _insert_statement(SampleDB.__table__, dialect_name, mode, columns, _RESET_ON_UPSERT)
+    curve_stmt = _insert_statement(SampleCurveDB.__table__, dialect_name, mode, CURVE_COLUMNS)
+    inserted = existing_total = 0
+    written: List[str] = []
+    for start in range(0, len(records), chunk_size):
+        chunk, curves = split_curves(records[start:start + chunk_size])
+        ids = [record["sampleID"] for record in chunk]
+        existing = {row.sampleID: row for row in (await db.execute(
+            select(SampleDB.sampleID, *CLASSIFICATION_COLUMNS).where(SampleDB.sampleID.in_(ids))
+        ))}
+        await db.execute(stmt, chunk)
+        if curves:
+            await db.execute(curve_stmt, curves)
+        if mode == "upsert":
+            await update_rollups(db, classifications(chunk), classifications(existing.values()))
+        else:
+            await update_rollups(db, classifications(record for record in chunk if record["sampleID"] not in existing))
+        written.extend(ids if mode == "upsert" else (sample_id for sample_id in ids if sample_id not in existing))
+        inserted += len(chunk) - len(existing)
+        existing_total += len(existing)
+    if written:
+        await bump_history(db)
+    await db.commit()
+
+    if mode == "upsert":
+        return IngestResult(inserted=inserted, updated=existing_total, duplicates=0, written=tuple(written))
+    return IngestResult(inserted=inserted, updated=0, duplicates=existing_total, written=tuple(written))
@@ -0,0 +1,187 @@
+"""
+Push channels for live classification.
+
+``LiveChannel`` serves ``/ws/classify``: an instrument keeps one WebSocket
+open and streams sensor frames over it. Frames go into a bounded
+per-connection queue; when it is full the connection is no longer read, so a
+client sending faster than the models keep up is slowed down by TCP
+backpressure instead of growing server memory. A processor drains the queue in
+micro-batches (up to ``LIVE_MAX_BATCH_SIZE`` frames, waiting at most
+``LIVE_MAX_WAIT_MS`` for more) and sends one reply per frame, in order.
+
+``ResultBroadcaster`` serves ``/api/classify/events``: classifications made by
+this process are pushed to subscribed dashboards as server-sent events. Each
+subscriber has a bounded queue; one that falls behind loses its oldest events
+rather than holding memory or slowing classification down.
+"""
+
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Set
+import asyncio
+import json
+import os
+
+from fastapi import Request, WebSocket
+
+LIVE_QUEUE_SIZE = int(os.getenv("LIVE_QUEUE_SIZE", "256"))
+LIVE_MAX_BATCH_SIZE = int(os.getenv("LIVE_MAX_BATCH_SIZE", "64"))
+LIVE_MAX_WAIT_MS = float(os.getenv("LIVE_MAX_WAIT_MS", "5"))
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "1000"))
+EVENTS_KEEPALIVE_SECONDS = float(os.getenv("EVENTS_KEEPALIVE_SECONDS", "15"))
+
+_CLOSED = object()
+
+
+class FrameError:
+    """A frame that could not be decoded; it is answered in its place in the stream"""
+
+    def __init__(self, message: str):
+        self.message = message
+
+
+async def next_batch(queue: asyncio.Queue, max_size: int, max_wait: float) -> List:
+    """Wait for one item, then take whatever else arrives within max_wait seconds, up to max_size"""
+    batch = [await queue.get()]
+    if batch[0] is _CLOSED:
+        return batch
+    if max_wait > 0 and queue.qsize() < max_size - 1:
+        await asyncio.sleep(max_wait)
+    while len(batch) < max_size and not queue.empty():
+        item = queue.get_nowait()
+        batch.append(item)
+        if item is _CLOSED:
+            break
+    return batch
+
+
+class LiveChannel:
+    """Micro-batched request/reply over WebSocket connections"""
+
+    def __init__(self, queue_size: int = LIVE_QUEUE_SIZE, max_batch_size: int = LIVE_MAX_BATCH_SIZE,
+                 max_wait_ms: float = LIVE_MAX_WAIT_MS):
+        self.queue_size = max(1, queue_size)
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self._active = 0
+        self._connections = 0
+        self._frames = 0
+        self._invalid = 0
+        self._batches = 0
+        self._max_queue_depth = 0
+
+    async def serve(self, websocket: WebSocket, handle_batch: Callable[[List[Any]], Awaitable[List[Dict]]]):
+        """Accept the connection and answer its frames until the client disconnects.
+
+        ``handle_batch`` gets the decoded JSON frames of one micro-batch and
+        returns one JSON-serializable reply per frame.
+        """
+        await websocket.accept()
+        queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        receiver = asyncio.create_task(self._receive(websocket, queue))
+        self._active += 1
+        self._connections += 1
+        try:
+            await self._process(websocket, queue, handle_batch)
+        finally:
+            self._active -= 1
+            receiver.cancel()
+
+    def stats(self) -> Dict:
+        return {
+            "activeConnections": self._active,
+            "connections": self._connections,
+            "queueSize": self.queue_size,
+            "maxQueueDepth": self._max_queue_depth,
+            "maxBatchSize": self.max_batch_size,
+            "maxWaitMs": self.max_wait * 1000.0,
+            "frames": self._frames,
+            "invalidFrames": self._invalid,
+            "batches": self._batches,
+            "meanBatchSize": self._frames / self._batches if self._batches else 0.0,
+        }
+
+    async def _receive(self, websocket: WebSocket, queue: asyncio.Queue):
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                await queue.put(_CLOSED)
+                return
+            try:
+                frame = json.loads(message.get("text") or message.get("bytes") or "")
+            except ValueError:
+                frame = FrameError("Frame is not valid JSON")
+            # Blocks while the queue is full, which stops reading from the socket
+            await queue.put(frame)
+            self._max_queue_depth = max(self._max_queue_depth, queue.qsize())
+
+    async def _process(self, websocket: WebSocket, queue: asyncio.Queue, handle_batch):
+        while True:
+            batch = await next_batch(queue, self.max_batch_size, self.max_wait)
+            closed = batch[-1] is _CLOSED
+            if closed:
+                batch.pop()
+            if batch:
+                for reply in await self._replies(batch, handle_batch):
+                    await websocket.send_json(reply)
+            if closed:
+                return
+
+    async def _replies(self, batch: List, handle_batch) -> List[Dict]:
+        self._batches += 1
+        self._frames += len(batch)
+        frames = [frame for frame in batch if not isinstance(frame, FrameError)]
+        self._invalid += len(batch) - len(frames)
+        try:
+            results = iter(await handle_batch(frames) if frames else [])
+        except Exception as e:
+            # Keep the session open; every frame of the failed batch gets the error
+            print(f"Warning: live classification batch failed: {e}")
+            results = iter([{"error": str(e)}] * len(frames))
+        return [{"error": frame.message} if isinstance(frame, FrameError) else next(results) for frame in batch]
+
+
+class ResultBroadcaster:
+    """Fans classification events out to server-sent event subscribers"""
+
+    def __init__(self, queue_size: int = EVENTS_QUEUE_SIZE, keepalive: float = EVENTS_KEEPALIVE_SECONDS):
+        self.queue_size = max(1, queue_size)
+        self.keepalive = keepalive
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._published = 0
+        self._dropped = 0
+
+    def publish(self, event: Dict):
+        """Queue an event for every subscriber; call from the event loop"""
+        self._published += 1
+        if not self._subscribers:
+            return
+        data = json.dumps(event, default=str)
+        for queue in self._subscribers:
+            if queue.full():
+                queue.get_nowait()
+                self._dropped += 1
+            queue.put_nowait(data)
+
+    async def stream(self, request: Request) -> AsyncIterator[str]:
+        """text/event-stream body for one subscriber, with keepalive comments while idle"""
+        queue: asyncio.Queue = asyncio.Queue(self.queue_size)
+        self._subscribers.add(queue)
+        getter = None
+        try:
+            while not await request.is_disconnected():
+                # The pending get is kept across keepalives so no event is lost to a timeout
+                if getter is None:
+                    getter = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait({getter}, timeout=self.keepalive)
+                if not done:
+                    yield ": keepalive\n\n"
+                    continue
+                data, getter = getter.result(), None
+                yield f"event: classification\ndata: {data}\n\n"
+        finally:
+            if getter is not None:
+                getter.cancel()
+            self._subscribers.discard(queue)
+
+    def stats(self) -> Dict:
+        return {"subscribers": len(self._subscribers), "queueSize": self.queue_size,
+                "published": self._published, "dropped": self._dropped}
@@ -1,23 +1,39 @@
-from fastapi import FastAPI, Query, HTTPException, Depends, status, Body
+from fastapi import FastAPI, Query, HTTPException, Depends, Request, Response, status, Body, WebSocket
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from pydantic import BaseModel, Field
-from typing import List, Optional
-from datetime import datetime, timedelta
+from pydantic import BaseModel, Field, ValidationError
+from typing import Any, Dict, List, Optional
+from datetime import date, datetime, timedelta
 from fastapi.middleware.cors import CORSMiddleware
-from sqlalchemy import create_engine, Column, Integer, String, Float, Boolean, DateTime, ForeignKey, JSON
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship, Session
-from jose import JWTError, jwt
+from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import select, tuple_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+import asyncio
+import time
 import uvicorn
-import joblib
 import os
-import hashlib
-
-DATABASE_URL = "sqlite:///./herbal_etongue.db"
-
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
+import base64
+import uuid
+
+from auth_utils import (ACCESS_TOKEN_EXPIRE_MINUTES, AuthenticatedUser, PasswordHasherBusy, auth_cache,
+                        create_access_token, password_hasher)
+from batching import MicroBatcher
+from cache_utils import CLASSIFY_CACHE_TTL, HISTORY_CACHE_TTL, cache_key, close_cache, init_cache, response_cache
+from classify_jobs import CLASSIFY_EXECUTOR, chunk_count, make_executor
+from database import (ION_COLUMNS, SENSOR_COLUMNS, AsyncSessionLocal, SampleDB, UploadJobDB, UserDB, engine,
+                      generation_query, get_db, init_db, pool_status)
+from exports import MEDIA_TYPES, ExportUnavailable, check_available, export_query, stream_export
+from ingest import ingest_samples, insert_samples
+from feature_schema import FULL_SCHEMA
+from drift import DriftMonitor
+from live import LiveChannel, ResultBroadcaster
+from metrics import FEATURIZE, PERSIST, VALIDATE, MetricsMiddleware, register_runtime, render, request_clock
+from inference import Prediction, build_feature_matrix, predict, purity_percent, recommendation_for, taste_profile
+from model_registry import ModelRegistry
+from rollups import CONFIDENCE_EDGES, ensure_rollups, rebuild_rollups, stats_query, summarize
+from streaming_upload import StreamFormatError, ingest_stream, iter_lines, iter_rows
 
 app = FastAPI(title="Herbal E-Tongue API", version="1.0")
 
@@ -28,120 +44,109 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],  # pagination cursor for /api/history
 )
+# Request counts and latency per route for /metrics
+app.add_middleware(MetricsMiddleware)
 
-# -------------------------------
-# Database Models
-# -------------------------------
-class UserDB(Base):
-    __tablename__ = "users"
-    id = Column(Integer, primary_key=True, index=True)
-    username = Column(String, unique=True, index=True, nullable=False)
-    email = Column(String, unique=True, index=True, nullable=False)
-    hashed_password = Column(String, nullable=False)
-    is_active = Column(Boolean, default=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
-
-class SampleDB(Base):
-    __tablename__ = "samples"
-    id = Column(Integer, primary_key=True, index=True)
-    sampleID = Column(String, unique=True, index=True, nullable=False)
-    timestamp = Column(DateTime, nullable=False)
-    herbName = Column(String, default="Tulsi")
-    purityPercent = Column(Float)
-    adulterationFlag = Column(Boolean)
-    confidenceScore = Column(Float)
-    tasteProfile = Column(String)  # JSON stringified list
-    recommendation = Column(String)
-    sensors = Column(JSON)  # Store sensor data as JSON
-
-Base.metadata.create_all(bind=engine)
+# Create tables / add new columns on the configured database. Deployments with several workers
+# run migrate.py once before starting them and set DB_MIGRATE_ON_STARTUP=0
+DB_MIGRATE_ON_STARTUP = os.getenv("DB_MIGRATE_ON_STARTUP", "1") == "1"
+if DB_MIGRATE_ON_STARTUP:
+    init_db()
+    ensure_rollups(engine)
+
+app.add_event_handler("startup", init_cache)
+app.add_event_handler("shutdown", close_cache)
+
+@app.exception_handler(PasswordHasherBusy)
+async def password_hasher_busy(request: Request, exc: PasswordHasherBusy):
+    # Shed login bursts rather than queueing them behind the password pool
+    return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content={"detail": str(exc)},
+                        headers={"Retry-After": "1"})
 
 # -------------------------------
 # ML Model Loading
 # -------------------------------
-def load_ml_models():
-    """Load trained ML models for classification"""
-    models_dir = os.path.join(os.path.dirname(__file__), 'models')
-
-    try:
-        herb_classifier = joblib.load(os.path.join(models_dir, 'herb_classifier.pkl'))
-        herb_scaler = joblib.load(os.path.join(models_dir, 'herb_scaler.pkl'))
-        label_encoder = joblib.load(os.path.join(models_dir, 'label_encoder.pkl'))
-
-        adulteration_detector = joblib.load(os.path.join(models_dir, 'adulteration_detector.pkl'))
-        adulteration_scaler = joblib.load(os.path.join(models_dir, 'adulteration_scaler.pkl'))
+# Models are loaded lazily on first use from the versioned registry; the arrays are
+# memory-mapped and shared across workers, and new versions are hot-swapped in
+ml_models = ModelRegistry()
+
+def predict_with_active_model(features):
+    """Predict FULL_SCHEMA rows with whichever version is active now"""
+    loaded = ml_models.get()
+    return predict(loaded.models, loaded.schema.select(features), loaded.version)
+
+# Uploaded samples are classified in the background, in chunks, by a local thread pool or Celery
+classify_executor = make_executor(CLASSIFY_EXECUTOR, ml_models)
+app.add_event_handler("shutdown", classify_executor.shutdown)
+
+# Concurrent single-sample classify calls are gathered into one vectorized predict
+CLASSIFY_MAX_BATCH_SIZE = int(os.getenv("CLASSIFY_MAX_BATCH_SIZE", "64"))
+CLASSIFY_MAX_WAIT_MS = float(os.getenv("CLASSIFY_MAX_WAIT_MS", "5"))
+classify_batcher = MicroBatcher(
+    predict_with_active_model,
+    max_batch_size=CLASSIFY_MAX_BATCH_SIZE,
+    max_wait_ms=CLASSIFY_MAX_WAIT_MS,
+)
 
-        print("ML models loaded successfully")
-        return herb_classifier, herb_scaler, label_encoder, adulteration_detector, adulteration_scaler
-    except FileNotFoundError:
-        print("Warning: ML models not found. Using fallback classification logic.")
-        return None, None, None, None, None
+# Instruments stream readings over /ws/classify; dashboards follow results on /api/classify/events
+live_channel = LiveChannel()
+result_broadcaster = ResultBroadcaster()
 
-# Load ML models at startup
-herb_clf, herb_scaler, label_encoder, adulteration_clf, adulteration_scaler = load_ml_models()
+# Running per-instrument, per-herb sensor statistics that flag drifting channels on each result
+drift_monitor = DriftMonitor()
 
 # -------------------------------
 # Authentication Setup
 # -------------------------------
-SECRET_KEY = "your-secret-key-here"  # Change this in production
-ALGORITHM = "HS256"
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
-
 security = HTTPBearer()
+# EventSource cannot send headers, so the events stream also accepts ?token=
+optional_security = HTTPBearer(auto_error=False)
 
-def verify_password(plain_password, hashed_password):
-    """Simple verification for demo purposes - in production use proper password verification"""
-    return hashlib.sha256(plain_password.encode()).hexdigest() == hashed_password
-
-def get_password_hash(password):
-    """Simple hash for demo purposes - in production use proper password hashing"""
-    return hashlib.sha256(password.encode()).hexdigest()
-
-def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
-    to_encode = data.copy()
-    if expires_delta:
-        expire = datetime.utcnow() + expires_delta
-    else:
-        expire = datetime.utcnow() + timedelta(minutes=15)
-    to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
-
-# Dependency to get DB session
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-def authenticate_user(db: Session, email: str, password: str):
-    user = db.query(UserDB).filter(UserDB.email == email).first()
+async def authenticate_user(db: AsyncSession, email: str, password: str):
+    user = (await db.execute(select(UserDB).where(UserDB.email == email))).scalars().first()
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    # bcrypt runs on the password pool; legacy SHA-256 hashes are upgraded on the way through
+    valid, new_hash = await password_hasher.verify_and_update(password, user.hashed_password)
+    if not valid:
         return False
+    if new_hash:
+        user.hashed_password = new_hash
+        await db.commit()
     return user
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: Session = Depends(get_db)):
+async def user_for_token(token: str, db: AsyncSession) -> AuthenticatedUser:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-    except JWTError:
+    # Verified tokens and active users are cached, so a warm request needs neither jose nor the DB
+    payload = auth_cache.token_payload(token)
+    email: Optional[str] = payload.get("sub") if payload else None
+    if email is None:
         raise credentials_exception
-    user = db.query(UserDB).filter(UserDB.email == email).first()
+    user = auth_cache.get_user(email)
     if user is None:
-        raise credentials_exception
+        row = (await db.execute(select(UserDB).where(UserDB.email == email))).scalars().first()
+        if row is None:
+            raise credentials_exception
+        user = AuthenticatedUser.from_row(row)
+        auth_cache.set_user(user)
+    if not user.is_active:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="User account is deactivated")
     return user
 
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db: AsyncSession = Depends(get_db)):
+    return await user_for_token(credentials.credentials, db)
+
+def get_current_admin(current_user: AuthenticatedUser = Depends(get_current_user)):
+    if current_user.username != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin privileges required")
+    return current_user
+
 # -------------------------------
 # Pydantic Models
 # -------------------------------
@@ -164,8 +169,20 @@ class SensorData(BaseModel):
 class Sample(BaseModel):
     sampleID: str
     timestamp: Optional[datetime] = None
+    instrumentId: Optional[str] = None  # drift statistics are kept per instrument
+    sensors: SensorData
+
+class LiveFrame(BaseModel):
+    seq: Optional[int] = None  # echoed back so clients can match replies
+    sampleID: Optional[str] = None
+    timestamp: Optional[datetime] = None
+    instrumentId: Optional[str] = None
     sensors: SensorData
 
+class HerbCandidate(BaseModel):
+    herbName: str
+    probability: float
+
 class ClassificationResponse(BaseModel):
     herbName: str
     purityPercent: float
@@ -173,20 +190,83 @@ class ClassificationResponse(BaseModel):
     confidence: float
     tasteProfile: List[str]
     recommendation: str
+    candidates: List[HerbCandidate] = []
+    modelVersion: Optional[str] = None
+    driftFlags: List[str] = []  # sensor channels drifting on this instrument for this herb
+    anomalyFlags: List[str] = []  # sensor channels far outside their running range in this reading
+
+class BatchClassificationItem(BaseModel):
+    index: int
+    sampleID: Optional[str] = None
+    result: Optional[ClassificationResponse] = None
+    error: Optional[str] = None
+
+class BatchClassificationResponse(BaseModel):
+    total: int
+    classified: int
+    failed: int
+    results: List[BatchClassificationItem]
+
+class RowError(BaseModel):
+    index: int
+    sampleID: Optional[str] = None
+    error: str
 
 class UploadResponse(BaseModel):
     status: str
     uploadedSamples: int
     invalidRows: int
+    duplicateRows: int = 0
+    updatedRows: int = 0
+    errors: List[RowError] = []
+    jobId: Optional[str] = None  # poll /api/upload/jobs/{jobId} for classification progress
+
+class UploadJobResponse(BaseModel):
+    uploadId: str
+    status: str
+    format: Optional[str] = None
+    rowsRead: int = 0
+    inserted: int = 0
+    updated: int = 0
+    duplicates: int = 0
+    invalid: int = 0
+    classified: int = 0
+    chunksTotal: int = 0
+    chunksDone: int = 0
+    error: Optional[str] = None
+    createdAt: datetime
+    updatedAt: Optional[datetime] = None
+    errors: List[RowError] = []
 
 class HistoryResponse(BaseModel):
     sampleID: str
-    herbName: str
+    herbName: Optional[str] = None  # None until the sample is classified
     testedOn: datetime
     purityPercent: float
     adulterationFlag: bool
     confidenceScore: float
 
+class HerbStats(BaseModel):
+    herbName: str
+    samples: int
+    meanPurity: Optional[float] = None
+    minPurity: Optional[float] = None
+    maxPurity: Optional[float] = None
+    adulterationRate: Optional[float] = None
+    meanConfidence: Optional[float] = None
+    confidenceHistogram: List[int]  # sample counts per confidenceBuckets bucket
+
+class DailyHerbStats(HerbStats):
+    day: date
+
+class StatsResponse(BaseModel):
+    confidenceBuckets: List[float]  # lower edge of each histogram bucket
+    herbs: List[HerbStats]  # totals over the requested days
+    days: List[DailyHerbStats]
+
+class ActivateModelRequest(BaseModel):
+    version: str
+
 class RegisterRequest(BaseModel):
     username: str
     email: str
@@ -196,27 +276,264 @@ class LoginRequest(BaseModel):
     email: str
     password: str
 
+# -------------------------------
+# Classification helpers
+# -------------------------------
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "1000"))
+MAX_REPORTED_ERRORS = 100
+
+def validation_message(error: ValidationError) -> str:
+    """Flatten a pydantic ValidationError into one line per failing field"""
+    # Errors about the row as a whole (e.g. a number where an object belongs) have no field to name
+    return "; ".join(
+        err['msg'] if err['loc'] == ("__root__",) else f"{'.'.join(str(loc) for loc in err['loc'])}: {err['msg']}"
+        for err in error.errors()
+    )
+
+def classify_samples(samples: List[Sample]) -> List[ClassificationResponse]:
+    """Classify a batch of samples, running each model once over the whole feature matrix"""
+    if not samples:
+        return []
+
+    loaded = ml_models.get()
+    if loaded:
+        with FEATURIZE.time():
+            features = build_feature_matrix([sample.sensors for sample in samples], loaded.schema)
+        return [describe_prediction(prediction) for prediction in predict(loaded.models, features, loaded.version)]
+
+    # Fallback to simple logic if ML models not available
+    results = []
+    for sample in samples:
+        purity = 90.0 + (sample.sensors.pH - 7) * 2
+        purity = max(0, min(100, purity))
+        adulteration = purity < 85
+        confidence = 0.8 + (purity / 100) * 0.2
+        results.append(ClassificationResponse(
+            herbName="Tulsi",  # Default fallback
+            purityPercent=purity,
+            adulterationFlag=adulteration,
+            confidence=confidence,
+            tasteProfile=["bitter", "pungent"] if adulteration else ["sweet", "mild"],
+            recommendation="Safe for Ayurvedic use" if not adulteration else "Use with caution"
+        ))
+    return results
+
+def describe_prediction(prediction: Prediction) -> ClassificationResponse:
+    """Derive purity, taste profile and recommendation from a model prediction"""
+    herb_name, confidence, adulteration = prediction.herb_name, prediction.confidence, prediction.adulteration
+
+    # Calculate purity based on confidence and adulteration
+    purity = purity_percent(confidence, adulteration)
+
+    return ClassificationResponse(
+        herbName=herb_name,
+        purityPercent=purity,
+        adulterationFlag=adulteration,
+        confidence=confidence,
+        tasteProfile=taste_profile(herb_name, adulteration),
+        recommendation=recommendation_for(purity, adulteration),
+        candidates=[HerbCandidate(herbName=name, probability=p) for name, p in prediction.candidates],
+        modelVersion=prediction.model_version
+    )
+
+def sensor_columns(sensors: SensorData) -> dict:
+    """Typed SampleDB sensor columns read off the model; .dict() would copy every field, the curve included"""
+    ions = sensors.ion_selective
+    values = {name: getattr(sensors, name) for name in SENSOR_COLUMNS}
+    values.update({ion: getattr(ions, ion) for ion in ION_COLUMNS})
+    return values
+
+def sample_record(sample: Sample, result: ClassificationResponse) -> dict:
+    """Column values for a classified SampleDB row"""
+    return {
+        "sampleID": sample.sampleID,
+        "timestamp": sample.timestamp or datetime.utcnow(),
+        "herbName": result.herbName,
+        "purityPercent": result.purityPercent,
+        "adulterationFlag": result.adulterationFlag,
+        "confidenceScore": result.confidence,
+        "tasteProfile": result.tasteProfile,
+        "recommendation": result.recommendation,
+        "modelVersion": result.modelVersion,
+        **sensor_columns(sample.sensors),
+        "voltammetry": sample.sensors.voltammetry
+    }
+
+def unclassified_record(sample: Sample) -> dict:
+    """Column values for a SampleDB row stored without classification"""
+    return {
+        "sampleID": sample.sampleID,
+        "timestamp": sample.timestamp or datetime.utcnow(),
+        "herbName": None,  # not the column default, which would read as a prediction
+        **sensor_columns(sample.sensors),
+        "voltammetry": sample.sensors.voltammetry
+    }
+
+def classified_records(samples: List[Sample]) -> List[dict]:
+    return [sample_record(sample, result) for sample, result in zip(samples, classify_samples(samples))]
+
+def unclassified_records(samples: List[Sample]) -> List[dict]:
+    return [unclassified_record(sample) for sample in samples]
+
+def flag_drift(samples: List[Sample], results: List[ClassificationResponse]):
+    """Feed classified readings to the drift monitor and flag drifting channels on their results"""
+    for sample, result in zip(samples, results):
+        status = drift_monitor.observe(sample.instrumentId, result.herbName, sensor_columns(sample.sensors))
+        result.driftFlags, result.anomalyFlags = status.drifting, status.anomalous
+
+def publish_results(samples: List[Sample], results: List[ClassificationResponse], source: str):
+    """Push classifications to /api/classify/events subscribers"""
+    for sample, result in zip(samples, results):
+        result_broadcaster.publish({"source": source, "sampleID": sample.sampleID,
+                                    "timestamp": sample.timestamp, **result.dict()})
+
+def live_frame(raw: Any) -> LiveFrame:
+    """Parse a /ws/classify frame; a bare SensorData object is accepted as the sensors of a frame"""
+    if isinstance(raw, dict) and "sensors" not in raw:
+        raw = {"seq": raw.get("seq"), "sensors": raw}
+    return LiveFrame.parse_obj(raw)
+
+async def classify_live_frames(frames: List[Any], save: bool, instrumentId: Optional[str]) -> List[dict]:
+    """Replies for one micro-batch of /ws/classify frames; saved samples are written in one commit"""
+    replies = [{"seq": raw.get("seq") if isinstance(raw, dict) else None} for raw in frames]
+    valid = []
+    seen_ids = set()
+    with VALIDATE.time():
+        for reply, raw in zip(replies, frames):
+            try:
+                frame = live_frame(raw)
+            except ValidationError as e:
+                reply["error"] = validation_message(e)
+                continue
+            sample = Sample(sampleID=frame.sampleID or str(uuid.uuid4()), timestamp=frame.timestamp or datetime.utcnow(),
+                            instrumentId=frame.instrumentId or instrumentId, sensors=frame.sensors)
+            if sample.sampleID in seen_ids:
+                reply["error"] = "Duplicate sampleID in batch"
+                continue
+            seen_ids.add(sample.sampleID)
+            valid.append((reply, sample))
+
+    async with AsyncSessionLocal() as db:
+        if save and seen_ids:
+            existing = set((await db.execute(
+                select(SampleDB.sampleID).where(SampleDB.sampleID.in_(seen_ids))
+            )).scalars())
+            for reply, sample in valid:
+                if sample.sampleID in existing:
+                    reply["error"] = "sampleID already exists"
+            valid = [(reply, sample) for reply, sample in valid if "error" not in reply]
+
+        samples = [sample for _, sample in valid]
+        results = await run_in_threadpool(classify_samples, samples)
+        flag_drift(samples, results)
+        for (reply, sample), result in zip(valid, results):
+            reply.update(sampleID=sample.sampleID, result=result)
+
+        if save and samples:
+            with PERSIST.time():
+                await insert_samples(db, [sample_record(sample, result) for sample, result in zip(samples, results)])
+                await db.commit()
+            await response_cache.invalidate("history")
+
+    publish_results(samples, results, "live")
+    return jsonable_encoder(replies)
+
+def upload_job_response(job: UploadJobDB, errors: List[dict] = ()) -> UploadJobResponse:
+    return UploadJobResponse(
+        uploadId=job.id,
+        status=job.status,
+        format=job.format,
+        rowsRead=job.rowsRead or 0,
+        inserted=job.inserted or 0,
+        updated=job.updated or 0,
+        duplicates=job.duplicates or 0,
+        invalid=job.invalid or 0,
+        classified=job.classified or 0,
+        chunksTotal=job.chunksTotal or 0,
+        chunksDone=job.chunksDone or 0,
+        error=job.error,
+        createdAt=job.created_at,
+        updatedAt=job.updated_at,
+        errors=[RowError(**error) for error in errors]
+    )
+
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "100"))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv("HISTORY_MAX_PAGE_SIZE", "1000"))
+HISTORY_COLUMNS = (SampleDB.id, SampleDB.sampleID, SampleDB.herbName, SampleDB.timestamp,
+                   SampleDB.purityPercent, SampleDB.adulterationFlag, SampleDB.confidenceScore)
+
+def encode_history_cursor(timestamp: datetime, row_id: int) -> str:
+    """Opaque keyset cursor for the last (timestamp, id) of a history page"""
+    return base64.urlsafe_b64encode(f"{timestamp.isoformat()}|{row_id}".encode()).decode()
+
+def decode_history_cursor(cursor: str):
+    try:
+        timestamp, row_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def history_page(db: AsyncSession, sampleID, herbName, adulterated, minPurity, maxPurity,
+                       start, end, limit, cursor) -> dict:
+    """One page of history rows plus the cursor for the next page, in a cacheable form"""
+    # Only the columns HistoryResponse needs; sensor columns and curves are never loaded
+    query = select(*HISTORY_COLUMNS).order_by(SampleDB.timestamp.desc(), SampleDB.id.desc()).limit(limit)
+    if sampleID:
+        query = query.where(SampleDB.sampleID == sampleID)
+    if herbName:
+        query = query.where(SampleDB.herbName == herbName)
+    if adulterated is not None:
+        query = query.where(SampleDB.adulterationFlag == adulterated)
+    if minPurity is not None:
+        query = query.where(SampleDB.purityPercent >= minPurity)
+    if maxPurity is not None:
+        query = query.where(SampleDB.purityPercent <= maxPurity)
+    if start:
+        query = query.where(SampleDB.timestamp >= start)
+    if end:
+        query = query.where(SampleDB.timestamp < end)
+    if cursor:
+        query = query.where(tuple_(SampleDB.timestamp, SampleDB.id) < decode_history_cursor(cursor))
+
+    rows = (await db.execute(query)).all()
+    items = [
+        HistoryResponse(
+            sampleID=row.sampleID,
+            herbName=row.herbName,
+            testedOn=row.timestamp,
+            purityPercent=row.purityPercent or 0,
+            adulterationFlag=row.adulterationFlag or False,
+            confidenceScore=row.confidenceScore or 0
+        ).dict()
+        for row in rows
+    ]
+    next_cursor = encode_history_cursor(rows[-1].timestamp, rows[-1].id) if len(rows) == limit else None
+    return {"items": items, "nextCursor": next_cursor}
+
 # -------------------------------
 # Endpoints
 # -------------------------------
 
 @app.post("/api/register", status_code=status.HTTP_201_CREATED)
-def register(request: RegisterRequest = Body(...), db: Session = Depends(get_db)):
-    user = db.query(UserDB).filter((UserDB.username == request.username) | (UserDB.email == request.email)).first()
+async def register(request: RegisterRequest = Body(...), db: AsyncSession = Depends(get_db)):
+    user = (await db.execute(
+        select(UserDB).where((UserDB.username == request.username) | (UserDB.email == request.email))
+    )).scalars().first()
     if user:
         raise HTTPException(status_code=400, detail="Username or email already registered")
-    hashed_password = get_password_hash(request.password)
+    hashed_password = await password_hasher.hash(request.password)
     new_user = UserDB(username=request.username, email=request.email, hashed_password=hashed_password)
     db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await db.commit()
     return {"msg": "User registered successfully"}
 
 @app.post("/api/login")
-def login(request: LoginRequest = Body(...), db: Session = Depends(get_db)):
-    user = authenticate_user(db, request.email, request.password)
+async def login(request: LoginRequest = Body(...), db: AsyncSession = Depends(get_db)):
+    user = await authenticate_user(db, request.email, request.password)
     if not user:
         raise HTTPException(status_code=401, detail="Invalid email or password")
+    if not user.is_active:
+        raise HTTPException(status_code=403, detail="User account is deactivated")
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(data={"sub": user.email}, expires_delta=access_token_expires)
     return {
@@ -231,149 +548,384 @@ def login(request: LoginRequest = Body(...), db: Session = Depends(get_db)):
     }
 
 @app.post("/api/classify", response_model=ClassificationResponse)
-def classify(sample: Sample, db: Session = Depends(get_db)):
+async def classify(sample: Sample, db: AsyncSession = Depends(get_db), clock: float = Depends(request_clock)):
     # Note: Authentication removed for demo purposes
-    # Use ML models for classification if available
-    if herb_clf and herb_scaler and label_encoder and adulteration_clf and adulteration_scaler:
-        # Prepare features for ML models
-        import numpy as np
-
-        # Extract features in the same order as training
-        features = np.array([[
-            sample.sensors.pH,
-            sample.sensors.tds_ec,  # conductivity
-            sample.sensors.orp,
-            sample.sensors.turbidity,
-            sample.sensors.temperature,
-            sample.sensors.moisture,
-            sample.sensors.rf_resonator,
-            np.mean(sample.sensors.voltammetry) if sample.sensors.voltammetry else 0.0  # voltammetry mean
-        ]])
-
-        # Scale features
-        features_scaled = herb_scaler.transform(features)
-
-        # Predict herb type
-        herb_pred = herb_clf.predict(features_scaled)
-        herb_name = label_encoder.inverse_transform(herb_pred)[0]
-
-        # Get prediction probabilities for confidence
-        herb_probabilities = herb_clf.predict_proba(features_scaled)
-        confidence = float(np.max(herb_probabilities))
-
-        # Check for adulteration
-        adulteration_pred = adulteration_clf.predict(adulteration_scaler.transform(features))
-        adulteration = bool(adulteration_pred[0])
-
-        # Calculate purity based on confidence and adulteration
-        base_purity = confidence * 100
-        purity = base_purity * (0.7 if adulteration else 1.0)
-        purity = max(0, min(100, purity))
-
-        # Generate taste profile based on herb and adulteration
-        taste_profiles = {
-            "Ashwagandha": ["bitter", "earthy"],
-            "Turmeric": ["bitter", "pungent"],
-            "Ginger": ["spicy", "pungent"],
-            "Brahmi": ["bitter", "astringent"],
-            "Tulsi": ["pungent", "aromatic"],
-            "Amla": ["sour", "astringent"],
-            "Neem": ["bitter", "pungent"],
-            "Triphala": ["sour", "astringent"],
-            "Shatavari": ["sweet", "bitter"],
-            "Moringa": ["bitter", "peppery"]
-        }
-
-        taste = taste_profiles.get(herb_name, ["unknown"])
-        if adulteration:
-            taste.extend(["off-flavor", "chemical"])
-
-        # Generate recommendation
-        if adulteration:
-            recommendation = "Sample shows signs of adulteration. Not recommended for Ayurvedic use."
-        elif purity > 90:
-            recommendation = "High purity sample. Safe for Ayurvedic use."
-        elif purity > 75:
-            recommendation = "Moderate purity. Use with caution and verify source."
-        else:
-            recommendation = "Low purity detected. Further testing recommended."
-
-    else:
-        # Fallback to simple logic if ML models not available
-        purity = 90.0 + (sample.sensors.pH - 7) * 2
-        purity = max(0, min(100, purity))
-        adulteration = purity < 85
-        confidence = 0.8 + (purity / 100) * 0.2
-        taste = ["bitter", "pungent"] if adulteration else ["sweet", "mild"]
-        recommendation = "Safe for Ayurvedic use" if not adulteration else "Use with caution"
-        herb_name = "Tulsi"  # Default fallback
+    VALIDATE.observe(time.perf_counter() - clock)
+    if not ml_models.warm:
+        # The first call loads the models; keep that disk I/O off the event loop
+        await run_in_threadpool(ml_models.get)
+    loaded = ml_models.get()
+    sensors = sample.sensors.dict()
+
+    # Identical readings under the same model version always classify the same way;
+    # concurrent identical payloads share one inference
+    version = loaded.version if loaded else None
+
+    async def compute():
+        if loaded:
+            # Queue the full feature row; the batcher selects the columns of the version it runs
+            with FEATURIZE.time():
+                features = FULL_SCHEMA.build([sample.sensors])
+            prediction = await asyncio.wrap_future(classify_batcher.submit(features[0]))
+            return describe_prediction(prediction).dict()
+        return classify_samples([sample])[0].dict()
+
+    result = ClassificationResponse(**await response_cache.get_or_compute(
+        "classify", cache_key("classify", sensors, version), compute, CLASSIFY_CACHE_TTL,
+        # A hot swap may have happened while queued; never file a result under another version
+        should_cache=lambda value: value["modelVersion"] == version
+    ))
+    # Drift depends on the readings before this one, so it is never part of the cached result
+    flag_drift([sample], [result])
 
     # Save sample to DB
-    sample_db = SampleDB(
-        sampleID=sample.sampleID,
-        timestamp=sample.timestamp,
-        herbName=herb_name,
-        purityPercent=purity,
-        adulterationFlag=adulteration,
-        confidenceScore=confidence,
-        tasteProfile=str(taste),
-        recommendation=recommendation,
-        sensors=sample.sensors.dict()
+    with PERSIST.time():
+        await insert_samples(db, [sample_record(sample, result)])
+        await db.commit()
+    await response_cache.invalidate("history")
+    publish_results([sample], [result], "classify")
+
+    return result
+
+@app.post("/api/classify/batch", response_model=BatchClassificationResponse)
+async def classify_batch(samples: List[Any] = Body(...), db: AsyncSession = Depends(get_db)):
+    """Classify many samples in one request with a single pass of each model and one bulk insert"""
+    if len(samples) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch size exceeds limit of {MAX_BATCH_SIZE} samples")
+
+    items = [BatchClassificationItem(index=i, sampleID=raw.get("sampleID") if isinstance(raw, dict) else None)
+             for i, raw in enumerate(samples)]
+
+    # Validate rows individually so one bad reading does not reject the batch
+    valid = []
+    seen_ids = set()
+    with VALIDATE.time():
+        for item, raw in zip(items, samples):
+            try:
+                sample = Sample.parse_obj(raw)
+            except ValidationError as e:
+                item.error = validation_message(e)
+                continue
+            if sample.sampleID in seen_ids:
+                item.error = "Duplicate sampleID in batch"
+                continue
+            seen_ids.add(sample.sampleID)
+            valid.append((item, sample))
+
+    # Reject IDs that are already stored (sampleID is unique)
+    if seen_ids:
+        existing = set((await db.execute(
+            select(SampleDB.sampleID).where(SampleDB.sampleID.in_(seen_ids))
+        )).scalars())
+        for item, sample in valid:
+            if sample.sampleID in existing:
+                item.error = "sampleID already exists"
+        valid = [(item, sample) for item, sample in valid if item.error is None]
+
+    # Vectorized inference over the whole batch is CPU work; run it off the event loop
+    predictions = await run_in_threadpool(classify_samples, [sample for _, sample in valid])
+    flag_drift([sample for _, sample in valid], predictions)
+    records = []
+    for (item, sample), result in zip(valid, predictions):
+        item.result = result
+        records.append(sample_record(sample, result))
+
+    if records:
+        with PERSIST.time():
+            await insert_samples(db, records)
+            await db.commit()
+        await response_cache.invalidate("history")
+        publish_results([sample for _, sample in valid], predictions, "batch")
+
+    return BatchClassificationResponse(
+        total=len(items),
+        classified=len(records),
+        failed=len(items) - len(records),
+        results=items
     )
-    db.add(sample_db)
-    db.commit()
-    db.refresh(sample_db)
 
-    return ClassificationResponse(
-        herbName=herb_name,
-        purityPercent=purity,
-        adulterationFlag=adulteration,
-        confidenceScore=confidence,
-        tasteProfile=taste,
-        recommendation=recommendation
-    )
+@app.websocket("/ws/classify")
+async def classify_stream(websocket: WebSocket,
+                          save: bool = Query(True, description="Store classified frames like /api/classify does"),
+                          instrumentId: Optional[str] = Query(None, description="Instrument of frames that do not name one")):
+    """Classify a continuous stream of sensor frames over one connection.
+
+    Send one JSON frame per reading, ``{"seq": 1, "sampleID": "...", "sensors": {...}}`` or a bare
+    SensorData object; each frame is answered in order with ``{"seq", "sampleID", "result"}`` or
+    ``{"seq", "error"}``. Frames are classified in micro-batches and saved with one commit per batch.
+    """
+    # Note: no authentication, matching /api/classify
+    await live_channel.serve(websocket, lambda frames: classify_live_frames(frames, save, instrumentId))
+
+@app.get("/api/classify/events")
+async def classification_events(request: Request,
+                                token: Optional[str] = Query(None, description="Access token, for EventSource clients"),
+                                credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security)):
+    """Server-sent events with every classification made by this worker"""
+    # Authenticate with a short-lived session rather than holding one open for the whole stream
+    async with AsyncSessionLocal() as db:
+        await user_for_token(credentials.credentials if credentials else token or "", db)
+    return StreamingResponse(result_broadcaster.stream(request), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.post("/api/upload", response_model=UploadResponse)
-def upload(samples: List[Sample], db: Session = Depends(get_db), current_user: UserDB = Depends(get_current_user)):
-    valid_samples = 0
-    invalid_rows = 0
-    for sample in samples:
-        if sample.sampleID and sample.sensors:
-            sample_db = SampleDB(
-                sampleID=sample.sampleID,
-                timestamp=sample.timestamp,
-                sensors=sample.sensors.dict()
-            )
-            db.add(sample_db)
-            valid_samples += 1
-        else:
-            invalid_rows += 1
-    db.commit()
+async def upload(samples: List[Any] = Body(...),
+                 mode: str = Query("skip", regex="^(skip|upsert)$", description="How to treat sampleIDs that already exist"),
+                 classify: bool = Query(True, description="Classify the stored samples in the background"),
+                 db: AsyncSession = Depends(get_db), current_user: AuthenticatedUser = Depends(get_current_user)):
+    """Store samples unclassified and return; classification runs as a background job"""
+    # Validate rows individually so invalid rows are counted instead of rejecting the upload
+    records = {}
+    errors = []
+    in_batch_duplicates = 0
+    for index, raw in enumerate(samples):
+        try:
+            sample = Sample.parse_obj(raw)
+        except ValidationError as e:
+            errors.append(RowError(index=index, sampleID=raw.get("sampleID") if isinstance(raw, dict) else None,
+                                   error=validation_message(e)))
+            continue
+        if sample.sampleID in records:
+            # Later rows win, matching what sequential upserts would leave behind
+            in_batch_duplicates += 1
+        records[sample.sampleID] = unclassified_record(sample)
+
+    result = await ingest_samples(db, list(records.values()), mode=mode)
+    await response_cache.invalidate("history")
+
+    job = None
+    if classify and result.written:
+        # Rows skipped as duplicates keep their stored classification
+        sample_ids = list(result.written)
+        job = UploadJobDB(id=uuid.uuid4().hex, status="classifying", format="json", rowsRead=len(samples),
+                          inserted=result.inserted, updated=result.updated,
+                          duplicates=result.duplicates + in_batch_duplicates, invalid=len(errors),
+                          chunksTotal=chunk_count(len(sample_ids)), chunksDone=0, createdBy=current_user.id)
+        db.add(job)
+        # The job row must exist before any chunk can report progress on it
+        await db.commit()
+        classify_executor.submit(job.id, sample_ids)
+
     return UploadResponse(
         status="success",
-        uploadedSamples=valid_samples,
-        invalidRows=invalid_rows
+        uploadedSamples=result.inserted + result.updated,
+        invalidRows=len(errors),
+        duplicateRows=result.duplicates + in_batch_duplicates,
+        updatedRows=result.updated,
+        errors=errors[:MAX_REPORTED_ERRORS],
+        jobId=job.id if job else None
     )
 
+@app.post("/api/upload/stream", response_model=UploadJobResponse)
+async def upload_stream(request: Request,
+                        format: Optional[str] = Query(None, regex="^(ndjson|csv)$", description="Body format; inferred from Content-Type if omitted"),
+                        mode: str = Query("skip", regex="^(skip|upsert)$", description="How to treat sampleIDs that already exist"),
+                        classify: bool = Query(True, description="Classify rows as they are ingested"),
+                        uploadId: Optional[str] = Query(None, max_length=64, description="Client-chosen id to poll progress with"),
+                        db: AsyncSession = Depends(get_db), current_user: AuthenticatedUser = Depends(get_current_user)):
+    """Ingest an NDJSON or CSV body of any size in bounded chunks while it is still arriving"""
+    if format is None:
+        content_type = request.headers.get("content-type", "")
+        format = "csv" if "csv" in content_type else "ndjson"
+
+    job = UploadJobDB(id=uploadId or uuid.uuid4().hex, format=format, createdBy=current_user.id)
+    db.add(job)
+    try:
+        await db.commit()
+    except IntegrityError:
+        raise HTTPException(status_code=409, detail="uploadId is already in use")
+
+    if classify and not ml_models.warm:
+        await run_in_threadpool(ml_models.get)
+    try:
+        progress = await ingest_stream(
+            db, job.id, iter_rows(iter_lines(request.stream()), format),
+            parse=Sample.parse_obj,
+            build_records=classified_records if classify else unclassified_records,
+            format_error=validation_message,
+            mode=mode,
+            classified=classify
+        )
+    except StreamFormatError as e:
+        job.status, job.error = "failed", str(e)
+        await db.commit()
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        # Chunks committed so far stay in place; the job row tells the client where it stopped
+        await db.rollback()
+        job.status, job.error = "failed", str(e)
+        await db.commit()
+        raise
+    finally:
+        await response_cache.invalidate("history")
+
+    for name, value in progress.counts().items():
+        setattr(job, name, value)
+    job.status, job.updated_at = "complete", datetime.utcnow()
+    await db.commit()
+    return upload_job_response(job, progress.errors)
+
+@app.get("/api/upload/jobs/{upload_id}", response_model=UploadJobResponse)
+async def get_upload_job(upload_id: str, db: AsyncSession = Depends(get_db), current_user: AuthenticatedUser = Depends(get_current_user)):
+    """Progress of an upload job, updated after every committed chunk"""
+    job = await db.get(UploadJobDB, upload_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Upload job not found")
+    return upload_job_response(job)
+
 @app.get("/api/history", response_model=List[HistoryResponse])
-def get_history(sampleID: Optional[str] = Query(None, description="Unique sample ID"), db: Session = Depends(get_db), current_user: UserDB = Depends(get_current_user)):
-    query = db.query(SampleDB)
-    if sampleID:
-        query = query.filter(SampleDB.sampleID == sampleID)
-    samples = query.all()
-    if not samples:
+async def get_history(response: Response,
+                      sampleID: Optional[str] = Query(None, description="Unique sample ID"),
+                      herbName: Optional[str] = Query(None),
+                      adulterated: Optional[bool] = Query(None),
+                      minPurity: Optional[float] = Query(None, ge=0, le=100),
+                      maxPurity: Optional[float] = Query(None, ge=0, le=100),
+                      start: Optional[datetime] = Query(None, description="Earliest timestamp (inclusive)"),
+                      end: Optional[datetime] = Query(None, description="Latest timestamp (exclusive)"),
+                      limit: int = Query(HISTORY_PAGE_SIZE, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+                      cursor: Optional[str] = Query(None, description="X-Next-Cursor value from the previous page"),
+                      db: AsyncSession = Depends(get_db), current_user: AuthenticatedUser = Depends(get_current_user)):
+    """Samples newest first, one page at a time; the next page's cursor is returned in X-Next-Cursor"""
+    # Every insert bumps the generation stored in the DB, so cached pages never outlive new data even
+    # when another worker (or a Celery task) wrote it and there is no Redis to share the local counter
+    params = {"sampleID": sampleID, "herbName": herbName, "adulterated": adulterated, "minPurity": minPurity,
+              "maxPurity": maxPurity, "start": start, "end": end, "limit": limit, "cursor": cursor}
+    stored = (await db.execute(generation_query("history"))).scalar() or 0
+    key = cache_key("history", params, f"{stored}.{await response_cache.generation('history')}")
+    page = await response_cache.get_or_compute(
+        "history", key, lambda: history_page(db, **params), HISTORY_CACHE_TTL,
+        should_cache=lambda value: bool(value["items"])
+    )
+    if not page["items"] and not cursor:
         raise HTTPException(status_code=404, detail="No history found for the given sampleID")
-    results = []
-    for sample in samples:
-        results.append(HistoryResponse(
-            sampleID=sample.sampleID,
-            herbName=sample.herbName,
-            testedOn=sample.timestamp,
-            purityPercent=sample.purityPercent or 0,
-            adulterationFlag=sample.adulterationFlag or False,
-            confidenceScore=sample.confidenceScore or 0
-        ))
-    return results
+    if page["nextCursor"]:
+        response.headers["X-Next-Cursor"] = page["nextCursor"]
+    return page["items"]
+
+@app.get("/api/stats", response_model=StatsResponse)
+async def get_stats(herbName: Optional[str] = Query(None),
+                    start: Optional[date] = Query(None, description="First day (inclusive)"),
+                    end: Optional[date] = Query(None, description="Last day (exclusive)"),
+                    db: AsyncSession = Depends(get_db), current_user: AuthenticatedUser = Depends(get_current_user)):
+    """Per-herb, per-day purity, adulteration and confidence statistics from the rollup table"""
+    rows = (await db.execute(stats_query(herbName, start, end))).all()
+    by_herb: Dict[str, list] = {}
+    for row in rows:
+        by_herb.setdefault(row.herbName, []).append(row)
+    return StatsResponse(
+        confidenceBuckets=list(CONFIDENCE_EDGES),
+        herbs=[HerbStats(herbName=herb, **summarize(herb_rows)) for herb, herb_rows in sorted(by_herb.items())],
+        days=[DailyHerbStats(day=row.day, herbName=row.herbName, **summarize([row])) for row in rows]
+    )
+
+@app.post("/api/stats/rebuild")
+def rebuild_stats(current_user: AuthenticatedUser = Depends(get_current_admin)):
+    """Recompute the statistics rollups from the samples table"""
+    with engine.begin() as conn:
+        rebuild_rollups(conn)
+    return {"status": "success"}
+
+@app.get("/api/history/export")
+async def export_history(format: str = Query("csv", regex="^(csv|parquet)$"),
+                         herbName: Optional[str] = Query(None),
+                         adulterated: Optional[bool] = Query(None),
+                         minPurity: Optional[float] = Query(None, ge=0, le=100),
+                         maxPurity: Optional[float] = Query(None, ge=0, le=100),
+                         start: Optional[datetime] = Query(None, description="Earliest timestamp (inclusive)"),
+                         end: Optional[datetime] = Query(None, description="Latest timestamp (exclusive)"),
+                         current_user: AuthenticatedUser = Depends(get_current_user)):
+    """Download the filtered history as CSV or Parquet, streamed from the database in batches"""
+    try:
+        check_available(format)
+    except ExportUnavailable as e:
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED, detail=str(e))
+    query = export_query(herbName=herbName, adulterated=adulterated, minPurity=minPurity,
+                         maxPurity=maxPurity, start=start, end=end)
+    filename = f"history-{datetime.utcnow():%Y%m%d-%H%M%S}.{format}"
+    return StreamingResponse(
+        stream_export(format, query),
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@app.post("/api/users/{user_id}/deactivate")
+async def deactivate_user(user_id: int, db: AsyncSession = Depends(get_db), current_user: AuthenticatedUser = Depends(get_current_admin)):
+    """Block a user's existing tokens and future logins"""
+    user = await db.get(UserDB, user_id)
+    if user is None:
+        raise HTTPException(status_code=404, detail="User not found")
+    user.is_active = False
+    await db.commit()
+    auth_cache.invalidate_user(user.email)
+    return {"status": "deactivated", "id": str(user.id), "email": user.email}
+
+@app.get("/api/ready")
+def ready():
+    """Readiness probe: 503 until the models are warm; the first probe starts warming them"""
+    status_body = ml_models.status()
+    if not status_body["warm"]:
+        ml_models.warm_in_background()
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content=status_body)
+    return status_body
+
+@app.get("/api/models")
+def list_models(current_user: AuthenticatedUser = Depends(get_current_admin)):
+    """Registered model versions and the version this worker is serving"""
+    return {
+        "active": ml_models.status(),
+        "versions": ml_models.versions()
+    }
+
+@app.post("/api/models/activate", status_code=status.HTTP_202_ACCEPTED)
+def activate_model(request: ActivateModelRequest, current_user: AuthenticatedUser = Depends(get_current_admin)):
+    """Load a model version in the background and swap it in once warm"""
+    try:
+        started = ml_models.activate(request.version)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if not started:
+        raise HTTPException(status_code=409, detail="Another model version is already loading")
+    return {"status": "loading", "version": request.version}
+
+@app.post("/api/models/rollback")
+def rollback_model(current_user: AuthenticatedUser = Depends(get_current_admin)):
+    """Swap the previously active model version back in immediately"""
+    try:
+        version = ml_models.rollback()
+    except LookupError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"status": "active", "version": version}
+
+@app.post("/api/drift/reset")
+def reset_drift(instrumentId: Optional[str] = Query(None, description="Only this instrument; all if omitted"),
+                current_user: AuthenticatedUser = Depends(get_current_admin)):
+    """Forget the drift baselines, e.g. after an instrument was recalibrated"""
+    drift_monitor.reset(instrumentId)
+    return {"status": "reset", "instrumentId": instrumentId}
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus exposition of request, stage and runtime metrics"""
+    body, content_type = render()
+    return Response(content=body, headers={"Content-Type": content_type})
+
+@app.get("/api/system/stats")
+def system_stats():
+    """Runtime statistics for the inference pipeline"""
+    return {
+        "models": ml_models.status(),
+        "inference": classify_batcher.stats(),
+        "database": pool_status(),
+        "cache": response_cache.stats(),
+        "auth": auth_cache.stats(),
+        "passwords": password_hasher.stats(),
+        "uploadClassification": classify_executor.stats(),
+        "live": {"websocket": live_channel.stats(), "events": result_broadcaster.stats()},
+        "drift": drift_monitor.stats()
+    }
+
+# Runtime gauges are read from the system stats at scrape time
+register_runtime(system_stats)
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
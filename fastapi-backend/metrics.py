@@ -0,0 +1,209 @@
+"""
+Prometheus metrics for ``/metrics``.
+
+Three kinds of series:
+
+* per-route request counts and latency histograms, recorded by
+  ``MetricsMiddleware`` under the route template (``/api/upload/jobs/{upload_id}``),
+  so label cardinality stays bounded;
+* per-stage timers inside classification (``validate``, ``featurize``,
+  ``infer_herb``, ``infer_adulteration``, ``persist``); batched paths observe
+  once per batch;
+* runtime gauges (model version, DB pool, response and auth cache hit ratios,
+  password hashing queue, inference batcher, live channels, drift flags)
+  read from ``/api/system/stats`` by ``RuntimeCollector`` at scrape time, so
+  they cost nothing per request.
+
+A counter increment or histogram observation is a lock and a few additions,
+cheap enough to leave on in production. With several uvicorn workers set
+``PROMETHEUS_MULTIPROC_DIR`` to an empty directory: counters and histograms
+are then aggregated over all workers, while runtime gauges describe the worker
+that answered the scrape.
+"""
+
+from typing import Callable, Dict, Tuple
+import os
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+if MULTIPROC_DIR:
+    # Metric values are files in this directory, created as soon as a labelled child exists below.
+    # Any process importing the inference modules (e.g. the Celery worker) may be the first one
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+REQUEST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STAGE_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+HTTP_REQUESTS = Counter("herbal_http_requests", "HTTP requests by route and status",
+                        ["method", "route", "status"])
+HTTP_REQUEST_SECONDS = Histogram("herbal_http_request_duration_seconds", "HTTP request latency by route",
+                                 ["method", "route"], buckets=REQUEST_BUCKETS)
+CLASSIFY_STAGE_SECONDS = Histogram("herbal_classify_stage_duration_seconds", "Time spent in each classification stage",
+                                   ["stage"], buckets=STAGE_BUCKETS)
+
+VALIDATE, FEATURIZE, INFER_HERB, INFER_ADULTERATION, PERSIST = (
+    CLASSIFY_STAGE_SECONDS.labels(stage=stage)
+    for stage in ("validate", "featurize", "infer_herb", "infer_adulteration", "persist")
+)
+
+
+def request_clock() -> float:
+    """Dependency returning the time it was resolved.
+
+    FastAPI resolves dependencies before it validates query and body
+    parameters, so an endpoint that declares this last can observe
+    ``perf_counter() - clock`` as its validation time.
+    """
+    return time.perf_counter()
+
+
+class MetricsMiddleware:
+    """ASGI middleware counting and timing HTTP requests per route"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router records the matched route in the scope; unmatched paths share one label
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            HTTP_REQUESTS.labels(scope["method"], path, str(status_code)).inc()
+            HTTP_REQUEST_SECONDS.labels(scope["method"], path).observe(time.perf_counter() - start)
+
+
+def _gauge(name: str, documentation: str, value) -> GaugeMetricFamily:
+    return GaugeMetricFamily(name, documentation, value=float(value or 0))
+
+
+def _counter(name: str, documentation: str, value) -> CounterMetricFamily:
+    return CounterMetricFamily(name, documentation, value=float(value or 0))
+
+
+class RuntimeCollector:
+    """Exposes the /api/system/stats sections as gauges and counters at scrape time"""
+
+    def __init__(self, system_stats: Callable[[], Dict]):
+        self.system_stats = system_stats
+
+    def collect(self):
+        stats = self.system_stats()
+
+        models = stats["models"]
+        info = GaugeMetricFamily("herbal_model_info", "Active model version", labels=["version", "backend"])
+        if models["available"]:
+            info.add_metric([models["version"] or "", models["backend"] or ""], 1)
+        yield info
+        yield _gauge("herbal_model_available", "1 when a trained model is loaded", models["available"])
+
+        pool = stats["database"]
+        for name in ("size", "checkedin", "checkedout", "overflow"):
+            if name in pool:
+                yield _gauge(f"herbal_db_pool_{name}", f"Async engine pool {name}", pool[name])
+
+        hits = CounterMetricFamily("herbal_cache_hits", "Response cache hits", labels=["namespace"])
+        misses = CounterMetricFamily("herbal_cache_misses", "Response cache misses", labels=["namespace"])
+        ratio = GaugeMetricFamily("herbal_cache_hit_ratio", "Response cache hit ratio since startup",
+                                  labels=["namespace"])
+        for namespace, counts in stats["cache"]["namespaces"].items():
+            hits.add_metric([namespace], counts.get("hits", 0))
+            misses.add_metric([namespace], counts.get("misses", 0))
+            if counts.get("hitRate") is not None:
+                ratio.add_metric([namespace], counts["hitRate"])
+        yield from (hits, misses, ratio)
+        yield _gauge("herbal_cache_local_entries", "Entries in the in-process cache tier", stats["cache"]["localEntries"])
+
+        auth = stats["auth"]
+        hits = CounterMetricFamily("herbal_auth_cache_hits", "Auth cache hits", labels=["kind"])
+        misses = CounterMetricFamily("herbal_auth_cache_misses", "Auth cache misses", labels=["kind"])
+        ratio = GaugeMetricFamily("herbal_auth_cache_hit_ratio", "Auth cache hit ratio since startup", labels=["kind"])
+        entries = GaugeMetricFamily("herbal_auth_cache_entries", "Entries in the auth cache", labels=["kind"])
+        for kind in ("token", "user"):
+            hits.add_metric([kind], auth.get(f"{kind}Hits", 0))
+            misses.add_metric([kind], auth.get(f"{kind}Misses", 0))
+            if auth.get(f"{kind}HitRate") is not None:
+                ratio.add_metric([kind], auth[f"{kind}HitRate"])
+            entries.add_metric([kind], auth[f"{kind}Entries"])
+        yield from (hits, misses, ratio, entries)
+
+        passwords = stats["passwords"]
+        yield _gauge("herbal_password_pending", "Password hash operations queued or running", passwords["pending"])
+        yield _gauge("herbal_password_peak_pending", "Most password hash operations pending at once",
+                     passwords["peakPending"])
+        yield _counter("herbal_password_operations", "Password hash operations completed", passwords["operations"])
+        yield _counter("herbal_password_rejected", "Password hash operations rejected as busy", passwords["rejected"])
+        for key, name, documentation in (
+            ("meanQueueMs", "herbal_password_queue_seconds_mean", "Mean wait for a password hashing worker"),
+            ("maxQueueMs", "herbal_password_queue_seconds_max", "Longest wait for a password hashing worker"),
+            ("meanRunMs", "herbal_password_run_seconds_mean", "Mean password hash run time"),
+        ):
+            if passwords[key] is not None:
+                yield _gauge(name, documentation, passwords[key] / 1000.0)
+
+        batcher = stats["inference"]
+        yield _gauge("herbal_inference_queue_depth", "Rows waiting for the classify micro-batcher",
+                     batcher["queueDepth"])
+        yield _counter("herbal_inference_batches", "Micro-batches predicted", batcher["batches"])
+        yield _counter("herbal_inference_batch_rows", "Rows predicted in micro-batches", batcher["items"])
+
+        uploads = stats["uploadClassification"]
+        if "pendingChunks" in uploads:
+            yield _gauge("herbal_upload_pending_chunks", "Upload chunks waiting to be classified",
+                         uploads["pendingChunks"])
+
+        live, events = stats["live"]["websocket"], stats["live"]["events"]
+        yield _gauge("herbal_live_connections", "Open /ws/classify connections", live["activeConnections"])
+        yield _counter("herbal_live_frames", "Frames received on /ws/classify", live["frames"])
+        yield _gauge("herbal_event_subscribers", "Open /api/classify/events streams", events["subscribers"])
+        yield _counter("herbal_events_dropped", "Events dropped for slow subscribers", events["dropped"])
+
+        drift = stats["drift"]
+        flags = CounterMetricFamily("herbal_drift_flags", "Readings flagged per sensor channel",
+                                    labels=["channel", "kind"])
+        for kind, counts in (("drift", drift["driftFlags"]), ("anomaly", drift["anomalyFlags"])):
+            for channel, count in counts.items():
+                flags.add_metric([channel, kind], count)
+        yield flags
+        yield _gauge("herbal_drift_streams", "Instrument/herb streams tracked for drift", drift["streams"])
+        yield _gauge("herbal_drifting_streams", "Streams whose last reading was drifting", len(drift["drifting"]))
+
+
+_runtime = None
+
+
+def register_runtime(system_stats: Callable[[], Dict]):
+    """Install the scrape-time collector for this process's runtime stats"""
+    global _runtime
+    _runtime = RuntimeCollector(system_stats)
+    if not MULTIPROC_DIR:
+        REGISTRY.register(_runtime)
+
+
+def render() -> Tuple[bytes, str]:
+    """The /metrics body and its content type"""
+    if not MULTIPROC_DIR:
+        return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+    # Imported here because it reads PROMETHEUS_MULTIPROC_DIR
+    from prometheus_client import multiprocess
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    if _runtime is not None:
+        registry.register(_runtime)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
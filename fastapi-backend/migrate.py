@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""
+One-shot database upgrade, run once before the API workers start.
+
+Creates missing tables and columns, migrates data written by older versions
+(the ``samples.sensors`` JSON blob into typed columns and packed curves) and
+builds the ``/api/stats`` rollups if they are missing. The API can do this at
+import, but with several uvicorn workers each would start the same
+``ALTER TABLE``, backfill and rollup rebuild; the Docker image runs this script
+first and starts the workers with ``DB_MIGRATE_ON_STARTUP=0``. On Postgres the
+steps also hold an advisory lock, so concurrent runs wait for each other
+instead of racing.
+
+Run from the repository root:
+    python fastapi-backend/migrate.py
+"""
+
+from database import engine, init_db
+from rollups import ensure_rollups
+
+
+def main():
+    init_db()
+    ensure_rollups(engine)
+    print("Database schema is up to date")
+
+
+if __name__ == "__main__":
+    main()
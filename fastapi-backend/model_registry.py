@@ -0,0 +1,236 @@
+"""
+Versioned model registry with background loading and atomic hot swaps.
+
+``train_ml_model.py`` writes each trained model set to
+``models/versions/<version>/`` and records it in ``models/model_metadata.json``,
+which doubles as the registry manifest (``current_version`` plus a
+``versions`` list). Every worker process polls the manifest's mtime; when the
+current version changes the new models are loaded and warmed on a background
+thread and then swapped in with a single reference assignment, so in-flight
+requests finish on the version they started with and no request waits for a
+load. The previously active version stays in memory for instant rollback.
+
+A models directory without a ``current_version`` (pickles and pipeline at the
+top level, as before versioning) is served as version ``legacy``.
+"""
+
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Union
+import json
+import os
+import threading
+import time
+
+import numpy as np
+
+from feature_schema import LEGACY_SCHEMA, FeatureSchema, SchemaMismatch, schema_from_metadata
+from inference import MODELS_DIR, MODELS_MMAP, ModelBundle, load_ml_models
+from inference_pipeline import InferencePipeline
+
+MANIFEST_FILE = 'model_metadata.json'
+VERSIONS_DIR = 'versions'
+LEGACY_VERSION = 'legacy'
+POLL_SECONDS = float(os.getenv('MODEL_REGISTRY_POLL_SECONDS', '5'))
+
+
+class LoadedModel(NamedTuple):
+    version: str
+    models: Union[InferencePipeline, ModelBundle]
+    loaded_at: datetime
+    load_seconds: float
+    schema: FeatureSchema = LEGACY_SCHEMA  # input columns the models were trained on, in order
+
+
+def new_version_id() -> str:
+    return datetime.utcnow().strftime('%Y%m%d-%H%M%S')
+
+
+def read_manifest(models_dir: str = MODELS_DIR) -> Dict:
+    try:
+        with open(os.path.join(models_dir, MANIFEST_FILE)) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def write_manifest(manifest: Dict, models_dir: str = MODELS_DIR):
+    """Replace the manifest atomically so readers never see a partial file"""
+    path = os.path.join(models_dir, MANIFEST_FILE)
+    staging = path + '.tmp'
+    with open(staging, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(staging, path)
+
+
+def version_dir(version: str, models_dir: str = MODELS_DIR) -> str:
+    if version == LEGACY_VERSION:
+        return models_dir
+    return os.path.join(models_dir, VERSIONS_DIR, version)
+
+
+class ModelRegistry:
+    """Serves the active model version and swaps in new ones without blocking requests"""
+
+    def __init__(self, models_dir: str = MODELS_DIR, poll_seconds: float = POLL_SECONDS):
+        self.models_dir = models_dir
+        self.poll_seconds = poll_seconds
+        self._active: Optional[LoadedModel] = None
+        self._previous: Optional[LoadedModel] = None
+        self._checked = False
+        self._loading: Optional[str] = None
+        self._last_error: Optional[str] = None
+        self._manifest_mtime = None
+        self._next_poll = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def warm(self) -> bool:
+        return self._checked
+
+    def get(self) -> Optional[LoadedModel]:
+        """The active model version, or None if no trained models exist"""
+        if not self._checked:
+            with self._lock:
+                if not self._checked:
+                    version = self._manifest_version()
+                    try:
+                        self._active = self._load(version)
+                    except SchemaMismatch as e:
+                        # Serving a model with misaligned inputs is worse than serving none
+                        self._last_error = f"{version}: {e}"
+                        print(f"Warning: refusing to load model version {version}: {e}")
+                    self._checked = True
+        elif self.poll_seconds > 0 and time.monotonic() >= self._next_poll:
+            self._poll_manifest()
+        return self._active
+
+    def warm_in_background(self):
+        if not self._checked:
+            threading.Thread(target=self.get, name="model-warmup", daemon=True).start()
+
+    def activate(self, version: str, persist: bool = True) -> bool:
+        """Load a version in the background and swap it in; returns False if one is already loading"""
+        if not os.path.isdir(version_dir(version, self.models_dir)):
+            raise FileNotFoundError(f"Model version {version} not found")
+        with self._lock:
+            if self._loading is not None:
+                return False
+            self._loading = version
+        threading.Thread(target=self._load_and_swap, args=(version, persist), name="model-swap", daemon=True).start()
+        return True
+
+    def rollback(self, persist: bool = True) -> str:
+        """Swap the previous version back in immediately"""
+        with self._lock:
+            if self._previous is None:
+                raise LookupError("No previous model version to roll back to")
+            self._active, self._previous = self._previous, self._active
+            version = self._active.version
+        if persist:
+            self._persist_current(version)
+        return version
+
+    def versions(self) -> List[Dict]:
+        manifest = read_manifest(self.models_dir)
+        return manifest.get('versions', [])
+
+    def status(self) -> Dict:
+        active, previous = self._active, self._previous
+        models = active.models if active else None
+        return {
+            "warm": self._checked,
+            "available": active is not None,
+            "version": active.version if active else None,
+            "previousVersion": previous.version if previous else None,
+            "loading": self._loading,
+            "lastError": self._last_error,
+            "backend": None if models is None else ("pipeline" if isinstance(models, InferencePipeline) else "sklearn"),
+            "memoryMapped": isinstance(models, InferencePipeline) and MODELS_MMAP,
+            "loadedAt": active.loaded_at.isoformat() if active else None,
+            "loadSeconds": active.load_seconds if active else None,
+            "features": list(active.schema.names) if active else None,
+        }
+
+    def _manifest_version(self) -> str:
+        path = os.path.join(self.models_dir, MANIFEST_FILE)
+        try:
+            self._manifest_mtime = os.stat(path).st_mtime
+        except FileNotFoundError:
+            self._manifest_mtime = None
+        self._next_poll = time.monotonic() + self.poll_seconds
+        return read_manifest(self.models_dir).get('current_version') or LEGACY_VERSION
+
+    def _poll_manifest(self):
+        self._next_poll = time.monotonic() + self.poll_seconds
+        try:
+            mtime = os.stat(os.path.join(self.models_dir, MANIFEST_FILE)).st_mtime
+        except FileNotFoundError:
+            return
+        if mtime == self._manifest_mtime:
+            return
+        version = self._manifest_version()
+        active = self._active
+        if (active is None or version != active.version) and self._loading is None:
+            try:
+                self.activate(version, persist=False)
+            except FileNotFoundError as e:
+                self._last_error = str(e)
+
+    def _load(self, version: str) -> Optional[LoadedModel]:
+        started = time.perf_counter()
+        path = version_dir(version, self.models_dir)
+        models = load_ml_models(path)
+        if models is None:
+            return None
+        schema = _feature_schema(version, path)
+        if schema.n_features != _n_features(models):
+            raise SchemaMismatch(f"Model version {version} expects {_n_features(models)} features, "
+                                 f"its schema describes {schema.n_features}")
+        # Touch every node array once so the first real request does not page them in
+        models.evaluate(np.zeros((1, _n_features(models)), dtype=np.float64))
+        return LoadedModel(version, models, datetime.utcnow(), time.perf_counter() - started, schema)
+
+    def _load_and_swap(self, version: str, persist: bool):
+        try:
+            loaded = self._load(version)
+            if loaded is None:
+                raise FileNotFoundError(f"Model version {version} has no loadable models")
+            with self._lock:
+                self._previous, self._active = self._active, loaded
+                self._checked = True
+            self._last_error = None
+            if persist:
+                self._persist_current(version)
+            print(f"Model version {version} activated")
+        except Exception as e:
+            self._last_error = f"{version}: {e}"
+            print(f"Warning: failed to activate model version {version}: {e}")
+        finally:
+            self._loading = None
+
+    def _persist_current(self, version: str):
+        # Other worker processes follow the manifest; read-only model mounts keep the swap local
+        manifest = read_manifest(self.models_dir)
+        if manifest.get('current_version', LEGACY_VERSION) == version:
+            return
+        manifest['current_version'] = version
+        try:
+            write_manifest(manifest, self.models_dir)
+            self._manifest_mtime = os.stat(os.path.join(self.models_dir, MANIFEST_FILE)).st_mtime
+        except OSError as e:
+            self._last_error = f"manifest not updated: {e}"
+
+
+def _feature_schema(version: str, path: str) -> FeatureSchema:
+    metadata = read_manifest(path)
+    # The top-level manifest also carries the metadata of the latest trained version, which
+    # says nothing about the legacy top-level models once a version has been registered
+    if version == LEGACY_VERSION and 'version' in metadata:
+        metadata = {}
+    return schema_from_metadata(metadata)
+
+
+def _n_features(models: Union[InferencePipeline, ModelBundle]) -> int:
+    if isinstance(models, InferencePipeline):
+        return models.n_features
+    return models.herb_scaler.n_features_in_
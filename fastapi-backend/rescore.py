@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Re-score stored samples with the current model version.
+
+Rows keep the classification of the model that was active when they arrived,
+and rows ingested unclassified (``/api/upload``) have none. This job walks the
+``samples`` table in primary-key order, ``--chunk-size`` rows at a time, and
+classifies each chunk with one vectorized ``predict`` call. Worker processes
+read and score chunks in parallel (the memory-mapped model arrays are shared
+between them); the parent writes each chunk back with a single executemany
+UPDATE, in order, and records the last committed id in a checkpoint file, so
+an interrupted run resumes where it stopped.
+
+By default only rows not already scored by the current version are selected
+(including never-classified ones); ``--all`` re-scores every row.
+
+Run from the repository root after training:
+    python fastapi-backend/rescore.py [--workers N] [--chunk-size N] [--all] [--restart]
+"""
+
+from typing import Dict, Iterator, List, Optional, Tuple
+import argparse
+import json
+import multiprocessing
+import os
+import time
+
+from sqlalchemy import or_, select
+
+from database import SampleDB, SessionLocal, engine, init_db
+from inference import MODELS_DIR
+from model_registry import ModelRegistry
+from scoring import feature_query, score_rows, write_scores
+
+RESCORE_CHUNK_SIZE = int(os.getenv("RESCORE_CHUNK_SIZE", "5000"))
+RESCORE_CHECKPOINT = os.getenv("RESCORE_CHECKPOINT", "rescore.checkpoint.json")
+
+# Set per worker process by _init_worker
+_registry: Optional[ModelRegistry] = None
+
+
+# -------------------------------
+# Chunking
+# -------------------------------
+def selection(version: str, rescore_all: bool):
+    """WHERE clause for the rows to re-score"""
+    if rescore_all:
+        return []
+    return [or_(SampleDB.modelVersion.is_(None), SampleDB.modelVersion != version)]
+
+
+def iter_ranges(version: str, rescore_all: bool, after_id: int, chunk_size: int) -> Iterator[Tuple[int, int]]:
+    """(after id, last id] ranges holding up to chunk_size selected rows each, found by keyset on the primary key"""
+    where = selection(version, rescore_all)
+    with SessionLocal() as db:
+        while True:
+            ids = select(SampleDB.id).where(SampleDB.id > after_id, *where).order_by(SampleDB.id)
+            last = db.execute(ids.offset(chunk_size - 1).limit(1)).scalar()
+            if last is None:
+                # Final, partial chunk
+                last = db.execute(select(SampleDB.id).where(SampleDB.id > after_id, *where)
+                                  .order_by(SampleDB.id.desc()).limit(1)).scalar()
+                if last is not None:
+                    yield after_id, last
+                return
+            yield after_id, last
+            after_id = last
+
+
+# -------------------------------
+# Workers
+# -------------------------------
+def _init_worker(models_dir: Optional[str]):
+    global _registry
+    # Connections inherited from the parent must not be shared across processes
+    engine.dispose(close=False)
+    _registry = ModelRegistry(models_dir or MODELS_DIR, poll_seconds=0)
+
+
+def score_range(task: Tuple[int, int, str, bool]) -> Tuple[int, List[Dict], int]:
+    """Classify the selected rows in one id range; returns (last id, update params, skipped rows)"""
+    after_id, last_id, version, rescore_all = task
+    loaded = _registry.get()
+    if loaded is None or loaded.version != version:
+        raise RuntimeError(f"Worker could not load model version {version}")
+
+    with SessionLocal() as db:
+        rows = db.execute(
+            feature_query(SampleDB.id > after_id, SampleDB.id <= last_id, *selection(version, rescore_all))
+        ).all()
+
+    params, skipped = score_rows(loaded, rows)
+    return last_id, params, skipped
+
+
+# -------------------------------
+# Writes and checkpoints
+# -------------------------------
+def write_results(params: List[Dict]):
+    with engine.begin() as conn:
+        write_scores(conn, params)
+
+
+def read_checkpoint(path: str) -> Dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def write_checkpoint(path: str, checkpoint: Dict):
+    """Replace the checkpoint atomically so a crash never leaves a partial file"""
+    staging = path + ".tmp"
+    with open(staging, "w") as f:
+        json.dump(checkpoint, f)
+    os.replace(staging, path)
+
+
+# -------------------------------
+# Entry point
+# -------------------------------
+def rescore(workers: int, chunk_size: int, checkpoint_path: str, rescore_all: bool = False,
+            restart: bool = False, models_dir: Optional[str] = None) -> Dict:
+    registry = ModelRegistry(models_dir or MODELS_DIR, poll_seconds=0)
+    loaded = registry.get()
+    if loaded is None:
+        raise SystemExit("No trained model available; run train_ml_model.py first")
+    version = loaded.version
+
+    checkpoint = {} if restart else read_checkpoint(checkpoint_path)
+    if checkpoint.get("modelVersion") != version or checkpoint.get("all") != rescore_all:
+        checkpoint = {"modelVersion": version, "all": rescore_all, "lastId": 0, "updated": 0, "skipped": 0}
+    elif checkpoint.get("lastId"):
+        print(f"Resuming after id {checkpoint['lastId']}")
+
+    started = time.perf_counter()
+    ranges = ((after_id, last_id, version, rescore_all)
+              for after_id, last_id in iter_ranges(version, rescore_all, checkpoint["lastId"], chunk_size))
+    context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn")
+    with context.Pool(workers, initializer=_init_worker, initargs=(models_dir,)) as pool:
+        # imap keeps chunk order, so the checkpoint always marks a contiguous prefix as done
+        for last_id, params, skipped in pool.imap(score_range, ranges):
+            write_results(params)
+            checkpoint.update(lastId=last_id, updated=checkpoint["updated"] + len(params),
+                              skipped=checkpoint["skipped"] + skipped)
+            write_checkpoint(checkpoint_path, checkpoint)
+            elapsed = time.perf_counter() - started
+            print(f"  id <= {last_id}: {checkpoint['updated']} updated, {checkpoint['skipped']} skipped "
+                  f"({checkpoint['updated'] / elapsed:.0f} rows/s)")
+
+    checkpoint["seconds"] = time.perf_counter() - started
+    return checkpoint
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-score stored samples with the current model version")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="scoring processes")
+    parser.add_argument("--chunk-size", type=int, default=RESCORE_CHUNK_SIZE, help="rows per chunk")
+    parser.add_argument("--checkpoint", default=RESCORE_CHECKPOINT, help="checkpoint file")
+    parser.add_argument("--all", action="store_true", help="re-score rows already scored by the current version")
+    parser.add_argument("--restart", action="store_true", help="ignore an existing checkpoint")
+    parser.add_argument("--models-dir", help="models directory (default: fastapi-backend/models)")
+    args = parser.parse_args()
+
+    init_db()
+    result = rescore(args.workers, args.chunk_size, args.checkpoint, args.all, args.restart, args.models_dir)
+    print(f"Re-scored {result['updated']} samples with model {result['modelVersion']} "
+          f"in {result['seconds']:.1f}s ({result['skipped']} skipped)")
+
+
+if __name__ == "__main__":
+    main()
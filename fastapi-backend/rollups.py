@@ -0,0 +1,223 @@
+"""
+Per-day, per-herb rollups of classified samples behind ``/api/stats``.
+
+Every path that classifies a ``samples`` row (the classify endpoints, upload
+ingestion, background and Celery classification, re-scoring) passes the
+classifications it adds and the ones it replaces to ``rollup_statements()``
+and runs the returned statements in the same transaction. Counts, sums and the
+confidence histogram are applied as deltas with one ``INSERT ... ON CONFLICT``
+per batch; min/max purity only grow on insert, so a (day, herb) whose
+classification was removed has its bounds recomputed from that day's samples.
+Dashboard queries then read O(days x herbs) rollup rows instead of scanning
+samples.
+
+Only classified rows (``purityPercent`` set) are counted. ``rebuild_rollups()``
+recomputes the table from scratch, e.g. after restoring a database; it writes
+complete rows rather than deltas, so overlapping rebuilds cannot double counts.
+"""
+
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import and_, bindparam, case, func, or_, select
+
+from database import HerbDailyStatsDB, SampleDB, dialect_insert, schema_lock
+
+CONFIDENCE_BUCKETS = 10
+# Lower edges of the confidence histogram buckets; the last bucket also holds 1.0
+CONFIDENCE_EDGES = tuple(i / CONFIDENCE_BUCKETS for i in range(CONFIDENCE_BUCKETS))
+BUCKET_COLUMNS = tuple(f"confidence{i}" for i in range(CONFIDENCE_BUCKETS))
+ADDITIVE_COLUMNS = ("samples", "adulterated", "puritySum", "confidenceSum") + BUCKET_COLUMNS
+
+REBUILD_BATCH_SIZE = 10000
+
+_stats = HerbDailyStatsDB.__table__
+_samples = SampleDB.__table__
+CLASSIFICATION_COLUMNS = (_samples.c.timestamp, _samples.c.herbName, _samples.c.purityPercent,
+                          _samples.c.adulterationFlag, _samples.c.confidenceScore)
+
+
+class Classification(NamedTuple):
+    """The columns of one classified samples row that the rollups aggregate"""
+    timestamp: datetime
+    herbName: str
+    purityPercent: float
+    adulterationFlag: bool
+    confidenceScore: float
+
+
+def classification(record) -> Optional[Classification]:
+    """The rollup contribution of a samples record or row, or None if it is not classified"""
+    get = record.get if isinstance(record, dict) else lambda name: getattr(record, name, None)
+    if get("purityPercent") is None or get("timestamp") is None:
+        return None
+    return Classification(get("timestamp"), get("herbName"), get("purityPercent"),
+                          bool(get("adulterationFlag")), get("confidenceScore") or 0.0)
+
+
+def classifications(records: Iterable) -> List[Classification]:
+    return [c for c in map(classification, records) if c is not None]
+
+
+def confidence_buckets(confidence: Sequence[float]) -> np.ndarray:
+    return np.clip(np.searchsorted(CONFIDENCE_EDGES, confidence, side="right") - 1, 0, CONFIDENCE_BUCKETS - 1)
+
+
+def _deltas(added: Sequence[Classification], removed: Sequence[Classification]) -> Dict[Tuple[date, str], Dict]:
+    deltas: Dict[Tuple[date, str], Dict] = {}
+    for sign, rows in ((1, added), (-1, removed)):
+        if not rows:
+            continue
+        buckets = confidence_buckets([row.confidenceScore for row in rows])
+        for row, bucket in zip(rows, buckets):
+            key = (row.timestamp.date(), row.herbName)
+            delta = deltas.get(key)
+            if delta is None:
+                delta = deltas[key] = dict(dict.fromkeys(ADDITIVE_COLUMNS, 0), day=key[0], herbName=key[1],
+                                           purityMin=None, purityMax=None)
+            delta["samples"] += sign
+            delta["adulterated"] += sign * row.adulterationFlag
+            delta["puritySum"] += sign * row.purityPercent
+            delta["confidenceSum"] += sign * row.confidenceScore
+            delta[BUCKET_COLUMNS[bucket]] += sign
+            if sign > 0:
+                purity = row.purityPercent
+                delta["purityMin"] = purity if delta["purityMin"] is None else min(delta["purityMin"], purity)
+                delta["purityMax"] = purity if delta["purityMax"] is None else max(delta["purityMax"], purity)
+    return deltas
+
+
+def _merge(totals: Dict[Tuple[date, str], Dict], deltas: Dict[Tuple[date, str], Dict]):
+    """Fold the _deltas() of added classifications into running totals"""
+    for key, delta in deltas.items():
+        total = totals.get(key)
+        if total is None:
+            totals[key] = delta
+            continue
+        for name in ADDITIVE_COLUMNS:
+            total[name] += delta[name]
+        total["purityMin"] = min(total["purityMin"], delta["purityMin"])
+        total["purityMax"] = max(total["purityMax"], delta["purityMax"])
+
+
+def _replace_statement(dialect_name: str):
+    stmt = dialect_insert(_stats, dialect_name)
+    columns = ADDITIVE_COLUMNS + ("purityMin", "purityMax")
+    return stmt.on_conflict_do_update(index_elements=[_stats.c.day, _stats.c.herbName],
+                                      set_={name: stmt.excluded[name] for name in columns})
+
+
+def _upsert_statement(dialect_name: str):
+    stmt = dialect_insert(_stats, dialect_name)
+    excluded = stmt.excluded
+    set_ = {name: _stats.c[name] + excluded[name] for name in ADDITIVE_COLUMNS}
+    set_["purityMin"] = case(
+        (excluded.purityMin.is_(None), _stats.c.purityMin),
+        (or_(_stats.c.purityMin.is_(None), excluded.purityMin < _stats.c.purityMin), excluded.purityMin),
+        else_=_stats.c.purityMin,
+    )
+    set_["purityMax"] = case(
+        (excluded.purityMax.is_(None), _stats.c.purityMax),
+        (or_(_stats.c.purityMax.is_(None), excluded.purityMax > _stats.c.purityMax), excluded.purityMax),
+        else_=_stats.c.purityMax,
+    )
+    return stmt.on_conflict_do_update(index_elements=[_stats.c.day, _stats.c.herbName], set_=set_)
+
+
+def _day_window():
+    return and_(
+        _samples.c.herbName == _stats.c.herbName,
+        _samples.c.timestamp >= bindparam("_start"),
+        _samples.c.timestamp < bindparam("_end"),
+    )
+
+
+# Removing a classification can take away the current min or max; recompute both for that day
+RECOMPUTE_BOUNDS = (
+    _stats.update()
+    .where(_stats.c.day == bindparam("_day"), _stats.c.herbName == bindparam("_herb"))
+    .values(
+        purityMin=select(func.min(_samples.c.purityPercent)).where(_day_window()).scalar_subquery(),
+        purityMax=select(func.max(_samples.c.purityPercent)).where(_day_window()).scalar_subquery(),
+    )
+)
+DELETE_EMPTY = _stats.delete().where(_stats.c.samples <= 0)
+
+
+def rollup_statements(dialect_name: str, added: Sequence[Classification] = (),
+                      removed: Sequence[Classification] = ()) -> List[Tuple[object, Any]]:
+    """(statement, params) pairs to run after the samples rows themselves were written"""
+    deltas = _deltas(added, removed)
+    if not deltas:
+        return []
+    statements = [(_upsert_statement(dialect_name), list(deltas.values()))]
+    if removed:
+        changed = {(row.timestamp.date(), row.herbName) for row in removed}
+        statements.append((RECOMPUTE_BOUNDS, [
+            {"_day": day, "_herb": herb, "_start": datetime.combine(day, datetime.min.time()),
+             "_end": datetime.combine(day + timedelta(days=1), datetime.min.time())}
+            for day, herb in changed
+        ]))
+        statements.append((DELETE_EMPTY, {}))
+    return statements
+
+
+def rebuild_rollups(conn):
+    """Recompute every rollup row from the samples table, replacing what is there"""
+    # Classifications are read in batches and totalled in memory (one entry per day and herb),
+    # so no dialect-specific date SQL is needed
+    totals: Dict[Tuple[date, str], Dict] = {}
+    result = conn.execute(
+        select(*CLASSIFICATION_COLUMNS)
+        .where(_samples.c.purityPercent.is_not(None))
+        .execution_options(yield_per=REBUILD_BATCH_SIZE)
+    )
+    for partition in result.partitions():
+        _merge(totals, _deltas(classifications(partition), ()))
+    conn.execute(_stats.delete())
+    if totals:
+        # Rows another rebuild committed meanwhile are overwritten, never added to
+        conn.execute(_replace_statement(conn.dialect.name), list(totals.values()))
+
+
+def ensure_rollups(engine):
+    """Build the rollups once for a database that has classified samples but no rollup rows yet.
+
+    Holds the schema lock, so a concurrent caller waits and then finds the rows built.
+    """
+    with schema_lock(engine), engine.begin() as conn:
+        if conn.execute(select(_stats.c.day).limit(1)).first() is not None:
+            return
+        if conn.execute(select(_samples.c.id).where(_samples.c.purityPercent.is_not(None)).limit(1)).first() is None:
+            return
+        rebuild_rollups(conn)
+    print("Built sample statistics rollups")
+
+
+def stats_query(herbName: Optional[str] = None, start: Optional[date] = None, end: Optional[date] = None):
+    """Rollup rows in (day, herb) order; start is inclusive, end exclusive"""
+    query = select(_stats).where(_stats.c.samples > 0).order_by(_stats.c.day, _stats.c.herbName)
+    if herbName:
+        query = query.where(_stats.c.herbName == herbName)
+    if start:
+        query = query.where(_stats.c.day >= start)
+    if end:
+        query = query.where(_stats.c.day < end)
+    return query
+
+
+def summarize(rows: Sequence) -> Dict:
+    """Derived statistics (means, rate, histogram) for one rollup row or the sum of several"""
+    samples = sum(row.samples for row in rows)
+    mins = [row.purityMin for row in rows if row.purityMin is not None]
+    maxes = [row.purityMax for row in rows if row.purityMax is not None]
+    return {
+        "samples": samples,
+        "meanPurity": sum(row.puritySum for row in rows) / samples if samples else None,
+        "minPurity": min(mins) if mins else None,
+        "maxPurity": max(maxes) if maxes else None,
+        "adulterationRate": sum(row.adulterated for row in rows) / samples if samples else None,
+        "meanConfidence": sum(row.confidenceSum for row in rows) / samples if samples else None,
+        "confidenceHistogram": [sum(getattr(row, name) for row in rows) for name in BUCKET_COLUMNS],
+    }
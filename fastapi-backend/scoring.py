@@ -0,0 +1,85 @@
+"""
+Bulk classification of stored sample rows.
+
+Used by the re-scoring CLI and the upload classification jobs: rows selected
+with ``feature_query()`` (typed sensor columns plus the packed curve) are
+classified with one vectorized ``predict`` call, without decoding any JSON,
+and written back with a single executemany UPDATE bound by primary key,
+together with the matching ``/api/stats`` rollup changes and a bump of the
+history cache generation.
+"""
+
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import bindparam, select, update
+
+from database import ION_COLUMNS, SENSOR_COLUMNS, SampleCurveDB, SampleDB, bump_generation, unpack_curve
+from inference import predict, purity_percent, recommendation_for, taste_profile
+from model_registry import LoadedModel
+from rollups import CLASSIFICATION_COLUMNS, Classification, classifications, rollup_statements
+
+UPDATE_COLUMNS = ("herbName", "purityPercent", "adulterationFlag", "confidenceScore", "tasteProfile",
+                  "recommendation", "modelVersion")
+
+FEATURE_COLUMNS = SENSOR_COLUMNS + ION_COLUMNS
+
+UPDATE_STATEMENT = (
+    update(SampleDB.__table__)
+    .where(SampleDB.__table__.c.id == bindparam("_id"))
+    .values({column: bindparam(column) for column in UPDATE_COLUMNS})
+)
+
+
+def feature_query(*where):
+    """Primary key, sensor columns and packed curve of the matching samples, in id order"""
+    table = SampleDB.__table__
+    return (
+        select(table.c.id, *(table.c[name] for name in FEATURE_COLUMNS), SampleCurveDB.currents)
+        .outerjoin(SampleCurveDB, SampleCurveDB.sampleID == table.c.sampleID)
+        .where(*where)
+        .order_by(table.c.id)
+    )
+
+
+def score_rows(loaded: LoadedModel, rows: Sequence) -> Tuple[List[Dict], int]:
+    """UPDATE_STATEMENT parameters for the feature_query() rows that could be classified, and the number skipped"""
+    # Columns 1..n of feature_query(); NULL readings become NaN
+    values = np.array([row[1:-1] for row in rows], dtype=np.float64).reshape(len(rows), len(FEATURE_COLUMNS))
+    columns = {name: values[:, i] for i, name in enumerate(FEATURE_COLUMNS)}
+    features = loaded.schema.build_columns(columns, [unpack_curve(row.currents) for row in rows])
+    # Rows with a missing sensor reading cannot be classified
+    valid = ~np.isnan(features).any(axis=1)
+    ids = [row.id for row, ok in zip(rows, valid) if ok]
+
+    params = []
+    for row_id, prediction in zip(ids, predict(loaded.models, features[valid], loaded.version)):
+        purity = purity_percent(prediction.confidence, prediction.adulteration)
+        params.append({
+            "_id": row_id,
+            "herbName": prediction.herb_name,
+            "purityPercent": purity,
+            "adulterationFlag": prediction.adulteration,
+            "confidenceScore": prediction.confidence,
+            "tasteProfile": taste_profile(prediction.herb_name, prediction.adulteration),
+            "recommendation": recommendation_for(purity, prediction.adulteration),
+            "modelVersion": prediction.model_version,
+        })
+    return params, len(rows) - len(params)
+
+
+def write_scores(conn, params: List[Dict]):
+    """Apply score_rows() results and move the rows' rollup counts from their old to their new classification"""
+    if not params:
+        return
+    previous = {row.id: row for row in conn.execute(
+        select(SampleDB.id, *CLASSIFICATION_COLUMNS).where(SampleDB.id.in_([p["_id"] for p in params]))
+    )}
+    conn.execute(UPDATE_STATEMENT, params)
+    added = [Classification(previous[p["_id"]].timestamp, p["herbName"], p["purityPercent"], p["adulterationFlag"],
+                            p["confidenceScore"]) for p in params if p["_id"] in previous]
+    for stmt, rollup_params in rollup_statements(conn.dialect.name, added, classifications(previous.values())):
+        conn.execute(stmt, rollup_params)
+    # Scores are written by job threads, Celery and the re-scoring CLI, none of which
+    # share the API's response cache; the DB generation reaches every API worker
+    bump_generation(conn, "history")
@@ -3,30 +3,8 @@
 Script to seed the database with demo users for the Herbal AI Authenticity Dashboard.
 """
 
-from sqlalchemy import create_engine, Column, Integer, String, Boolean, DateTime
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from datetime import datetime
-import hashlib
-
-DATABASE_URL = "sqlite:///./herbal_etongue.db"
-
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-Base = declarative_base()
-
-def get_password_hash(password):
-    """Simple hash for demo purposes - in production use proper password hashing"""
-    return hashlib.sha256(password.encode()).hexdigest()
-
-class UserDB(Base):
-    __tablename__ = "users"
-    id = Column(Integer, primary_key=True, index=True)
-    username = Column(String, unique=True, index=True, nullable=False)
-    email = Column(String, unique=True, index=True, nullable=False)
-    hashed_password = Column(String, nullable=False)
-    is_active = Column(Boolean, default=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+from auth_utils import get_password_hash
+from database import Base, SessionLocal, UserDB, engine
 
 def seed_demo_users():
     """Create demo users in the database."""
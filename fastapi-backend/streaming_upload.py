@@ -0,0 +1,176 @@
+"""
+Incremental parsing and ingestion of large instrument dumps.
+
+The request body is consumed as a byte stream, decoded and split into lines
+as it arrives, and parsed either as NDJSON (one ``Sample`` object per line) or
+as the CSV layout of ``public/sample-sensor-data.csv``. Rows are validated,
+optionally classified, and inserted in bounded chunks, so memory use depends
+on the chunk size rather than on the size of the upload. Progress is written
+to the upload's ``upload_jobs`` row after every chunk.
+"""
+
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+import codecs
+import csv
+import json
+import os
+
+from pydantic import ValidationError
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+from database import UploadJobDB
+from ingest import INGEST_CHUNK_SIZE, ingest_samples
+
+MAX_REPORTED_ERRORS = 100
+# Longest line accepted, in characters; bounds the buffer held for a line that never ends
+STREAM_MAX_LINE_LENGTH = int(os.getenv("STREAM_MAX_LINE_LENGTH", str(1024 * 1024)))
+
+# CSV header -> SensorData field
+CSV_SENSOR_COLUMNS = {
+    "pH": "pH",
+    "Conductivity": "tds_ec",
+    "ORP": "orp",
+    "Turbidity": "turbidity",
+    "Temperature": "temperature",
+    "Moisture": "moisture",
+    "RF_Resonator": "rf_resonator",
+}
+# Optional in the CSV layout; missing ion readings are stored as 0.0
+CSV_ION_COLUMNS = ("Na", "K", "Ca")
+
+
+class StreamFormatError(ValueError):
+    """The stream cannot be parsed at all (e.g. a CSV without a header)"""
+
+
+async def iter_lines(chunks: AsyncIterator[bytes],
+                     max_line_length: int = STREAM_MAX_LINE_LENGTH) -> AsyncIterator[str]:
+    """Decode a UTF-8 byte stream incrementally and yield complete, non-empty lines.
+
+    Raises StreamFormatError as soon as a line grows past max_line_length.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    pending = ""
+    line_number = 0
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        if "\n" in pending:
+            *lines, pending = pending.split("\n")
+            for line in lines:
+                line_number += 1
+                _check_line_length(line, line_number, max_line_length)
+                if line.strip():
+                    yield line.rstrip("\r")
+        _check_line_length(pending, line_number + 1, max_line_length)
+    pending += decoder.decode(b"", final=True)
+    _check_line_length(pending, line_number + 1, max_line_length)
+    if pending.strip():
+        yield pending.rstrip("\r")
+
+
+def _check_line_length(line: str, line_number: int, max_line_length: int):
+    if len(line) > max_line_length:
+        raise StreamFormatError(f"Line {line_number} is longer than {max_line_length} characters; "
+                                "rows must be separated by newlines")
+
+
+def csv_row_to_sample(row: Dict[str, str]) -> Dict[str, Any]:
+    """Map a sample-sensor-data.csv row onto the Sample request shape"""
+    sensors: Dict[str, Any] = {field: row.get(column) for column, field in CSV_SENSOR_COLUMNS.items()}
+    voltammetry = row.get("Voltammetry")
+    sensors["voltammetry"] = json.loads(voltammetry)["Current"] if voltammetry else []
+    sensors["ion_selective"] = {ion: row.get(ion) or 0.0 for ion in CSV_ION_COLUMNS}
+    return {"sampleID": row.get("SampleID"), "timestamp": row.get("Timestamp") or None, "sensors": sensors}
+
+
+async def iter_rows(lines: AsyncIterator[str], fmt: str) -> AsyncIterator[Tuple[int, Any]]:
+    """Yield (row index, raw sample dict or the parse error) for each data line"""
+    header: Optional[List[str]] = None
+    index = 0
+    async for line in lines:
+        if fmt == "csv" and header is None:
+            header = next(csv.reader([line]))
+            if "SampleID" not in header:
+                raise StreamFormatError("CSV header must include a SampleID column")
+            continue
+        try:
+            if fmt == "csv":
+                row = csv_row_to_sample(dict(zip(header, next(csv.reader([line])))))
+            else:
+                row = json.loads(line)
+        except (ValueError, KeyError, TypeError) as e:
+            row = e
+        yield index, row
+        index += 1
+
+
+class StreamProgress:
+    """Running totals for one streamed upload"""
+
+    def __init__(self):
+        self.rowsRead = 0
+        self.inserted = 0
+        self.updated = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.classified = 0
+        self.errors: List[Dict[str, Any]] = []
+
+    def counts(self) -> Dict[str, int]:
+        return {name: getattr(self, name)
+                for name in ("rowsRead", "inserted", "updated", "duplicates", "invalid", "classified")}
+
+    def add_error(self, index: int, sample_id: Optional[str], message: str):
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"index": index, "sampleID": sample_id, "error": message})
+
+
+async def ingest_stream(db: AsyncSession, job_id: str, rows: AsyncIterator[Tuple[int, Any]],
+                        parse: Callable[[Dict], Any], build_records: Callable[[List[Any]], List[Dict]],
+                        format_error: Callable[[ValidationError], str], mode: str = "skip",
+                        chunk_size: int = INGEST_CHUNK_SIZE, classified: bool = True) -> StreamProgress:
+    """Validate, build and insert rows chunk by chunk, recording progress on the upload job
+
+    ``parse`` validates one raw dict into a Sample; ``build_records`` turns a list of
+    Samples into SampleDB rows (classifying them if requested) and runs in the
+    threadpool since inference is CPU work.
+    """
+    progress = StreamProgress()
+    chunk: Dict[str, Any] = {}
+
+    async def flush():
+        if not chunk:
+            return
+        records = await run_in_threadpool(build_records, list(chunk.values()))
+        result = await ingest_samples(db, records, mode=mode, chunk_size=len(records))
+        progress.inserted += result.inserted
+        progress.updated += result.updated
+        progress.duplicates += result.duplicates
+        if classified:
+            progress.classified += len(records)
+        chunk.clear()
+        await db.execute(update(UploadJobDB).where(UploadJobDB.id == job_id)
+                         .values(updated_at=datetime.utcnow(), **progress.counts()))
+        await db.commit()
+
+    async for index, raw in rows:
+        progress.rowsRead += 1
+        if isinstance(raw, Exception):
+            progress.add_error(index, None, f"unparseable row: {raw}")
+            continue
+        try:
+            sample = parse(raw)
+        except ValidationError as e:
+            progress.add_error(index, raw.get("sampleID") if isinstance(raw, dict) else None, format_error(e))
+            continue
+        if sample.sampleID in chunk:
+            progress.duplicates += 1
+        chunk[sample.sampleID] = sample
+        if len(chunk) >= chunk_size:
+            await flush()
+    await flush()
+    return progress
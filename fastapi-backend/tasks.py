@@ -1,91 +1,105 @@
 from celery import Celery
+from datetime import date, datetime, time, timedelta
 import os
-import joblib
-import numpy as np
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from .main import SampleDB, SessionLocal  # Import from main.py
+from classify_jobs import classify_chunk
+from database import SampleCurveDB, SampleDB, SessionLocal, bump_generation, curve_record, sensor_values
+from exports import export_query, write_export
+from inference import build_feature_matrix, predict, purity_percent
+from model_registry import ModelRegistry
+from rollups import classifications, rollup_statements
 
-celery = Celery('tasks', broker=os.getenv('REDIS_URL', 'redis://localhost:6379/0'))
+# Broker / result backend are configurable so workers can run against RabbitMQ, SQS or a local Redis
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', os.getenv('REDIS_URL', 'redis://localhost:6379/0'))
+CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND')
+celery = Celery('tasks', broker=CELERY_BROKER_URL, backend=CELERY_RESULT_BACKEND)
 
-# Load ML models
-models_dir = os.path.join(os.path.dirname(__file__), 'models')
-herb_clf = joblib.load(os.path.join(models_dir, 'herb_classifier.pkl'))
-herb_scaler = joblib.load(os.path.join(models_dir, 'herb_scaler.pkl'))
-label_encoder = joblib.load(os.path.join(models_dir, 'label_encoder.pkl'))
-adulteration_clf = joblib.load(os.path.join(models_dir, 'adulteration_detector.pkl'))
-adulteration_scaler = joblib.load(os.path.join(models_dir, 'adulteration_scaler.pkl'))
+# Models load on the first task and share the memory-mapped arrays with the API workers
+ml_models = ModelRegistry()
 
 @celery.task
 def classify_sample_async(sample_data: dict):
     """Async ML classification task"""
-    # Extract features
-    sensors = sample_data['sensors']
-    features = np.array([[
-        sensors['pH'],
-        sensors['tds_ec'],
-        sensors['orp'],
-        sensors['turbidity'],
-        sensors['temperature'],
-        sensors['moisture'],
-        sensors['rf_resonator'],
-        np.mean(sensors.get('voltammetry', [0.0]))
-    ]])
-
-    # Scale and predict
-    features_scaled = herb_scaler.transform(features)
-    herb_pred = herb_clf.predict(features_scaled)
-    herb_name = label_encoder.inverse_transform(herb_pred)[0]
-    confidence = float(np.max(herb_clf.predict_proba(features_scaled)))
-
-    adulteration_pred = adulteration_clf.predict(adulteration_scaler.transform(features))
-    adulteration = bool(adulteration_pred[0])
-
-    purity = max(0, min(100, confidence * 100 * (0.7 if adulteration else 1.0)))
+    loaded = ml_models.get()
+    if loaded is None:
+        raise RuntimeError("No trained model available")
+    features = build_feature_matrix([sample_data['sensors']], loaded.schema)
+    prediction = predict(loaded.models, features, loaded.version)[0]
+    herb_name = prediction.herb_name
+    confidence = prediction.confidence
+    adulteration = prediction.adulteration
+    purity = purity_percent(confidence, adulteration)
+    timestamp = sample_data.get('timestamp') or datetime.utcnow()
+    if isinstance(timestamp, str):  # task arguments arrive JSON-encoded
+        timestamp = datetime.fromisoformat(timestamp)
 
     # Save to DB
     db = SessionLocal()
     try:
         sample = SampleDB(
             sampleID=sample_data['sampleID'],
-            timestamp=sample_data['timestamp'],
+            timestamp=timestamp,
             herbName=herb_name,
             purityPercent=purity,
             adulterationFlag=adulteration,
             confidenceScore=confidence,
-            tasteProfile='[]',  # Simplified
+            tasteProfile=[],  # Simplified
             recommendation='Processed asynchronously',
-            sensors=sample_data['sensors']
+            modelVersion=prediction.model_version,
+            **sensor_values(sample_data['sensors'])
         )
         db.add(sample)
+        currents = sample_data['sensors'].get('voltammetry')
+        if currents is not None:
+            db.add(SampleCurveDB(**curve_record(sample_data['sampleID'], currents)))
+        for stmt, params in rollup_statements(db.bind.dialect.name, classifications([sample])):
+            db.execute(stmt, params)
+        # Cached /api/history pages must not outlive the new row
+        bump_generation(db.connection(), "history")
         db.commit()
         return {
             'herbName': herb_name,
             'purityPercent': purity,
             'adulterationFlag': adulteration,
-            'confidenceScore': confidence
+            'confidenceScore': confidence,
+            'candidates': prediction.candidates,
+            'modelVersion': prediction.model_version
         }
     finally:
         db.close()
 
 @celery.task
-def export_history_async(user_id: int, filters: dict = None):
-    """Async data export task"""
+def classify_upload_chunk(job_id: str, sample_ids: list):
+    """Classify one chunk of an upload job's samples; progress is recorded on the job row"""
+    return classify_chunk(job_id, sample_ids, ml_models)
+
+@celery.task
+def export_history_async(user_id: int, filters: dict = None, fmt: str = 'csv'):
+    """Async data export task; writes the file under EXPORT_DIR and returns its path, not its contents"""
+    filters = filters or {}
+    query = export_query(
+        herbName=filters.get('herbName'),
+        adulterated=filters.get('adulterated'),
+        start=_filter_datetime(filters.get('start_date')),
+        end=_inclusive_end(filters.get('end_date'))
+    )
     db = SessionLocal()
     try:
-        query = db.query(SampleDB)
-        if filters:
-            if 'start_date' in filters:
-                query = query.filter(SampleDB.timestamp >= filters['start_date'])
-            if 'end_date' in filters:
-                query = query.filter(SampleDB.timestamp <= filters['end_date'])
-
-        samples = query.all()
-        # Generate CSV
-        csv_data = "sampleID,herbName,purityPercent,adulterationFlag,timestamp\n"
-        for sample in samples:
-            csv_data += f"{sample.sampleID},{sample.herbName},{sample.purityPercent},{sample.adulterationFlag},{sample.timestamp}\n"
-
-        return csv_data
+        return write_export(db, fmt, query, prefix=f"history-{user_id}")
     finally:
         db.close()
+
+def _filter_datetime(value):
+    """A date filter as a datetime; task arguments arrive JSON-encoded"""
+    if isinstance(value, str):
+        value = date.fromisoformat(value) if len(value) == 10 else datetime.fromisoformat(value)
+    if isinstance(value, date) and not isinstance(value, datetime):
+        value = datetime.combine(value, time.min)
+    return value
+
+def _inclusive_end(value):
+    """export_query's exclusive end for this task's inclusive end_date; a bare date covers its whole day"""
+    if value is None:
+        return None
+    end = _filter_datetime(value)
+    bare_date = not isinstance(value, datetime) and (isinstance(value, date) or len(value) == 10)
+    return end + (timedelta(days=1) if bare_date else timedelta(microseconds=1))
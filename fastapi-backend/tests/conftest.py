@@ -0,0 +1,58 @@
+"""
+Shared setup for the backend tests.
+
+The API modules build their engines and caches at import time, so the
+environment is pointed at a throwaway SQLite database, the trained models in
+the repository and a local-only cache before anything is imported.
+
+Run from ``fastapi-backend/``:
+    python -m pytest tests
+"""
+
+import copy
+import json
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(BACKEND_DIR)
+TEST_DIR = tempfile.mkdtemp(prefix="herbal-tests-")
+
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(TEST_DIR, 'test.db')}"
+os.environ.setdefault("MODELS_DIR", os.path.join(REPO_DIR, "models"))
+os.environ["CACHE_BACKEND"] = "none"
+os.environ["CLASSIFY_EXECUTOR"] = "local"
+os.environ.pop("PROMETHEUS_MULTIPROC_DIR", None)
+sys.path.insert(0, BACKEND_DIR)
+
+import pytest
+
+with open(os.path.join(REPO_DIR, "test_classify.json")) as f:
+    SAMPLE = json.load(f)
+
+
+def make_sample(sample_id: str, **sensors) -> dict:
+    """The reference sample under another sampleID, with optional sensor overrides"""
+    sample = copy.deepcopy(SAMPLE)
+    sample["sampleID"] = sample_id
+    sample["sensors"].update(sensors)
+    return sample
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    import main
+    import seed_demo_users
+
+    seed_demo_users.seed_demo_users()
+    with TestClient(main.app) as test_client:
+        yield test_client
+
+
+@pytest.fixture(scope="session")
+def auth_headers(client):
+    response = client.post("/api/login", json={"email": "admin@herbalauth.com", "password": "Admin@123"})
+    assert response.status_code == 200, response.text
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
@@ -0,0 +1,54 @@
+import asyncio
+import hashlib
+import threading
+
+import pytest
+
+from auth_utils import PasswordHasher, PasswordHasherBusy
+
+
+def test_legacy_sha256_hash_is_upgraded_on_login(client):
+    from sqlalchemy import select
+    from database import SessionLocal, UserDB
+
+    password = "Legacy@123"
+    with SessionLocal() as db:
+        db.add(UserDB(username="legacy", email="legacy@herbalauth.com",
+                      hashed_password=hashlib.sha256(password.encode()).hexdigest()))
+        db.commit()
+
+    credentials = {"email": "legacy@herbalauth.com", "password": password}
+    assert client.post("/api/login", json=dict(credentials, password="wrong")).status_code == 401
+    assert client.post("/api/login", json=credentials).status_code == 200
+    with SessionLocal() as db:
+        stored = db.execute(select(UserDB.hashed_password).where(UserDB.email == "legacy@herbalauth.com")).scalar()
+    assert stored.startswith("$2b$")
+    assert client.post("/api/login", json=credentials).status_code == 200
+
+
+def test_hasher_rejects_work_beyond_max_pending():
+    release = threading.Event()
+
+    async def scenario():
+        hasher = PasswordHasher(workers=1, max_pending=2)
+        running = [asyncio.ensure_future(hasher._run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0)
+        with pytest.raises(PasswordHasherBusy):
+            await hasher.hash("one too many")
+        release.set()
+        await asyncio.gather(*running)
+        assert hasher.stats()["rejected"] == 1
+        assert hasher.stats()["operations"] == 2 and hasher.stats()["peakPending"] == 2
+        # Capacity is back once the queue drains
+        assert (await hasher.hash("fits again")).startswith("$2b$")
+
+    asyncio.run(scenario())
+
+
+def test_login_returns_503_when_the_hasher_is_saturated(client, monkeypatch):
+    import main
+
+    monkeypatch.setattr(main, "password_hasher", PasswordHasher(workers=1, max_pending=0))
+    response = client.post("/api/login", json={"email": "admin@herbalauth.com", "password": "Admin@123"})
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
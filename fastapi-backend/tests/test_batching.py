@@ -0,0 +1,98 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from batching import MicroBatcher
+
+
+class RecordingPredict:
+    """Doubles the first column and remembers the size of every batch"""
+
+    def __init__(self):
+        self.sizes = []
+
+    def __call__(self, X):
+        self.sizes.append(len(X))
+        return X[:, 0] * 2
+
+
+def rows(n):
+    return [np.array([[float(i), 0.0]]) for i in range(n)]
+
+
+def test_rows_queued_together_share_one_batch():
+    predict = RecordingPredict()
+    batcher = MicroBatcher(predict, max_batch_size=64, max_wait_ms=200)
+    try:
+        futures = [batcher.submit(row) for row in rows(10)]
+        assert [f.result(timeout=5) for f in futures] == [2.0 * i for i in range(10)]
+    finally:
+        batcher.close()
+    assert predict.sizes == [10]
+    assert batcher.stats()["batches"] == 1 and batcher.stats()["items"] == 10
+
+
+def test_batches_are_capped_at_max_batch_size():
+    predict = RecordingPredict()
+    batcher = MicroBatcher(predict, max_batch_size=4, max_wait_ms=50)
+    try:
+        futures = [batcher.submit(row) for row in rows(10)]
+        assert [f.result(timeout=5) for f in futures] == [2.0 * i for i in range(10)]
+    finally:
+        batcher.close()
+    assert predict.sizes == [4, 4, 2]
+
+
+def test_a_lone_row_waits_at_most_max_wait():
+    predict = RecordingPredict()
+    batcher = MicroBatcher(predict, max_batch_size=64, max_wait_ms=20)
+    try:
+        started = time.monotonic()
+        assert batcher.submit(np.array([[3.0, 0.0]])).result(timeout=5) == 6.0
+        assert time.monotonic() - started < 1.0
+    finally:
+        batcher.close()
+    assert predict.sizes == [1]
+
+
+def test_concurrent_callers_get_their_own_results():
+    predict = RecordingPredict()
+    batcher = MicroBatcher(predict, max_batch_size=16, max_wait_ms=100)
+    start = threading.Barrier(32)
+
+    def call(i):
+        start.wait()
+        return batcher.submit(np.array([[float(i), 0.0]])).result(timeout=5)
+
+    try:
+        with ThreadPoolExecutor(32) as pool:
+            results = list(pool.map(call, range(32)))
+    finally:
+        batcher.close()
+    assert results == [2.0 * i for i in range(32)]
+    assert sum(predict.sizes) == 32
+    assert max(predict.sizes) <= 16 and len(predict.sizes) < 32
+
+
+def test_a_failed_batch_fails_every_waiter_and_the_batcher_recovers():
+    calls = []
+
+    def predict(X):
+        calls.append(len(X))
+        if len(calls) == 1:
+            raise ValueError("model exploded")
+        return X[:, 0]
+
+    batcher = MicroBatcher(predict, max_batch_size=64, max_wait_ms=100)
+    try:
+        futures = [batcher.submit(row) for row in rows(3)]
+        for future in futures:
+            with pytest.raises(ValueError, match="model exploded"):
+                future.result(timeout=5)
+        assert batcher.submit(np.array([[7.0, 0.0]])).result(timeout=5) == 7.0
+    finally:
+        batcher.close()
+    assert calls == [3, 1]
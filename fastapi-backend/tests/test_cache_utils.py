@@ -0,0 +1,130 @@
+import asyncio
+
+import cache_utils
+from cache_utils import CacheBackend, CircuitBreaker, MemoryBackend, ResponseCache
+
+
+class FailingBackend(CacheBackend):
+    """Remote tier that raises, or hangs past the timeout, on every call"""
+
+    name = "failing"
+
+    def __init__(self, hang: bool = False):
+        self.hang = hang
+        self.calls = 0
+
+    async def _fail(self, *args):
+        self.calls += 1
+        if self.hang:
+            await asyncio.sleep(1)
+        raise ConnectionError("remote cache down")
+
+    get = set = ttl = incr = _fail
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_memory_backend():
+    async def scenario():
+        backend = MemoryBackend(max_entries=2)
+        await backend.set("a", "1", ttl=60)
+        assert await backend.get("a") == "1"
+        assert 0 < await backend.ttl("a") <= 60
+        assert await backend.get("missing") is None
+
+        # Counters survive LRU eviction and read back as strings
+        assert await backend.incr("gen") == 1
+        assert await backend.incr("gen") == 2
+        await backend.set("b", "2", ttl=60)
+        await backend.set("c", "3", ttl=60)
+        assert await backend.get("a") is None
+        assert await backend.get("gen") == "2"
+
+    asyncio.run(scenario())
+
+
+def test_circuit_breaker_opens_and_half_opens(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_utils.time, "monotonic", clock)
+    breaker = CircuitBreaker(failures=2, reset_seconds=10)
+
+    breaker.record_failure()
+    assert breaker.state == "closed" and breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and not breaker.allow()
+    assert breaker.opened == 1
+
+    # After the reset period exactly one trial call is let through
+    clock.now += 10
+    assert breaker.state == "half-open"
+    assert breaker.allow()
+    assert not breaker.allow()
+
+    # A failed trial reopens straight away; a successful one closes
+    breaker.record_failure()
+    assert breaker.state == "open" and breaker.opened == 2
+    clock.now += 10
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_get_or_compute_coalesces_concurrent_misses():
+    async def scenario():
+        cache = ResponseCache(MemoryBackend(), enabled=True)
+        calls = 0
+
+        async def compute():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return {"value": calls}
+
+        results = await asyncio.gather(*(cache.get_or_compute("classify", "k", compute, ttl=60) for _ in range(10)))
+        assert calls == 1
+        assert results == [{"value": 1}] * 10
+        assert cache.stats()["namespaces"]["classify"]["coalesced"] == 9
+        assert cache.stats()["inflight"] == 0
+
+        # Later callers are served from the cache
+        assert await cache.get_or_compute("classify", "k", compute, ttl=60) == {"value": 1}
+        assert calls == 1
+
+    asyncio.run(scenario())
+
+
+def test_remote_timeouts_fall_back_to_the_local_tier():
+    async def scenario():
+        remote = FailingBackend(hang=True)
+        cache = ResponseCache(remote, enabled=True, timeout_ms=5, breaker=CircuitBreaker(failures=2, reset_seconds=60))
+
+        await cache.set("classify", "k", {"purity": 99.0}, ttl=60)
+        assert await cache.get("classify", "k") == {"purity": 99.0}
+        assert await cache.get("classify", "other") is None
+        await cache.invalidate("history")
+        assert await cache.generation("history") == 1
+
+        counts = cache.stats()["namespaces"]
+        # set and the "other" lookup time out and open the breaker; the rest skip the remote tier
+        assert counts["classify"]["remoteTimeouts"] == 2
+        assert counts["history"]["remoteSkipped"] == 2
+        assert remote.calls == 2
+        assert cache.stats()["breaker"] == "open"
+
+    asyncio.run(scenario())
+
+
+def test_remote_errors_are_counted_and_not_raised():
+    async def scenario():
+        cache = ResponseCache(FailingBackend(), enabled=True, breaker=CircuitBreaker(failures=5, reset_seconds=60))
+        assert await cache.get("classify", "k") is None
+        assert cache.stats()["namespaces"]["classify"]["remoteErrors"] == 1
+        assert cache.stats()["breaker"] == "closed"
+
+    asyncio.run(scenario())
@@ -0,0 +1,63 @@
+import os
+
+import joblib
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import StandardScaler
+
+from compiled_forest import CompiledForest, compile_forest
+from conftest import REPO_DIR
+from features import FEATURE_NAMES
+
+BATCH_SIZES = (1, 257)
+
+
+def split_rows(forest, scaler, n, rng):
+    """Raw rows that land on, just below and just above the forest's split thresholds"""
+    thresholds = np.concatenate([e.tree_.threshold[e.tree_.children_left >= 0] for e in forest.estimators_])
+    features = np.concatenate([e.tree_.feature[e.tree_.children_left >= 0] for e in forest.estimators_])
+    scaled = rng.normal(size=(n, forest.n_features_in_))
+    picks = rng.integers(len(thresholds), size=(n, 4))
+    nudge = rng.choice([-1e-7, 0.0, 1e-7], size=(n, 4))
+    for row, (pick, step) in enumerate(zip(picks, nudge)):
+        scaled[row, features[pick]] = thresholds[pick] + step
+    return scaler.inverse_transform(scaled) if scaler is not None else scaled
+
+
+@pytest.fixture(scope="module")
+def wide_forest():
+    """A forest over the full seventeen-feature schema"""
+    rng = np.random.default_rng(0)
+    X = rng.normal(size=(600, len(FEATURE_NAMES))) * rng.uniform(0.1, 50, size=len(FEATURE_NAMES))
+    y = (X[:, 0] > 0).astype(int) + (X[:, 10] > 0) + 2 * (X[:, 16] > 0)
+    scaler = StandardScaler().fit(X)
+    forest = RandomForestClassifier(n_estimators=25, max_depth=12, random_state=0).fit(scaler.transform(X), y)
+    return forest, scaler
+
+
+@pytest.mark.parametrize("forest_file, scaler_file", [("herb_classifier.pkl", "herb_scaler.pkl"),
+                                                       ("adulteration_detector.pkl", "adulteration_scaler.pkl")])
+@pytest.mark.parametrize("n", BATCH_SIZES)
+def test_trained_forests_match_sklearn(forest_file, scaler_file, n):
+    models_dir = os.path.join(REPO_DIR, "models")
+    forest = joblib.load(os.path.join(models_dir, forest_file))
+    scaler = joblib.load(os.path.join(models_dir, scaler_file))
+    compiled = CompiledForest(compile_forest(forest, scaler))
+
+    X = split_rows(forest, scaler, n, np.random.default_rng(n))
+    expected = forest.predict_proba(scaler.transform(X))
+    np.testing.assert_allclose(compiled.predict_proba(X), expected, rtol=0, atol=1e-12)
+    np.testing.assert_array_equal(compiled.predict(X), forest.predict(scaler.transform(X)))
+
+
+@pytest.mark.parametrize("n", BATCH_SIZES)
+def test_seventeen_feature_forest_matches_sklearn(wide_forest, n):
+    forest, scaler = wide_forest
+    compiled = CompiledForest(compile_forest(forest, scaler))
+    assert compiled.n_features_in_ == len(FEATURE_NAMES)
+
+    X = split_rows(forest, scaler, n, np.random.default_rng(100 + n))
+    expected = forest.predict_proba(scaler.transform(X))
+    np.testing.assert_allclose(compiled.predict_proba(X), expected, rtol=0, atol=1e-12)
+    np.testing.assert_array_equal(compiled.predict(X), forest.predict(scaler.transform(X)))
@@ -0,0 +1,64 @@
+import numpy as np
+
+from drift import DriftMonitor
+
+CHANNELS = ("pH", "temperature")
+
+
+def readings(n, phase=0.0, pH=6.5, temperature=25.0):
+    """Bounded, deterministic sensor noise around the given levels"""
+    return [{"pH": pH + 0.05 * np.sin(2.4 * i + phase), "temperature": temperature + 0.2 * np.sin(1.7 * i + phase)}
+            for i in range(n)]
+
+
+def monitor():
+    return DriftMonitor(channels=CHANNELS, lam=0.2, limit=3, anomaly_z=4, warmup=30)
+
+
+def test_stable_stream_is_not_flagged():
+    drift = monitor()
+    statuses = [drift.observe("ET-1", "Tulsi", values) for values in readings(500, phase=1)]
+    assert not any(status.drifting or status.anomalous for status in statuses)
+    assert drift.stats()["flaggedReadings"] == 0
+
+
+def test_nothing_is_flagged_during_warmup():
+    drift = monitor()
+    statuses = [drift.observe("ET-1", "Tulsi", values) for values in readings(29, phase=2)]
+    statuses.append(drift.observe("ET-1", "Tulsi", {"pH": 14.0, "temperature": 25.0}))
+    assert not any(status.drifting or status.anomalous for status in statuses)
+
+
+def test_shifted_stream_raises_drift_and_a_spike_raises_an_anomaly():
+    drift = monitor()
+    for values in readings(200, phase=3):
+        drift.observe("ET-1", "Tulsi", values)
+
+    spike = drift.observe("ET-1", "Tulsi", {"pH": 7.5, "temperature": 25.0})
+    assert spike.anomalous == ["pH"] and spike.drifting == []
+
+    # The pH electrode drifts by about three standard deviations; temperature stays put
+    statuses = [drift.observe("ET-1", "Tulsi", values) for values in readings(20, phase=4, pH=6.6)]
+    assert statuses[-1].drifting == ["pH"]
+    assert not any("temperature" in status.drifting for status in statuses)
+    assert drift.stats()["drifting"] == [{"instrumentId": "ET-1", "herbName": "Tulsi", "channels": ["pH"]}]
+
+
+def test_streams_are_kept_per_instrument_and_herb():
+    drift = monitor()
+    for values in readings(200, phase=5):
+        drift.observe("ET-1", "Tulsi", values)
+    for values in readings(200, phase=6, pH=4.0):
+        drift.observe("ET-1", "Neem", values)
+        drift.observe("ET-2", "Tulsi", values)
+
+    # pH 4 is normal for Neem on ET-1 and for Tulsi on ET-2, but far off for Tulsi on ET-1
+    assert drift.observe("ET-1", "Neem", {"pH": 4.0, "temperature": 25.0}).anomalous == []
+    assert drift.observe("ET-2", "Tulsi", {"pH": 4.0, "temperature": 25.0}).anomalous == []
+    assert drift.observe("ET-1", "Tulsi", {"pH": 4.0, "temperature": 25.0}).anomalous == ["pH"]
+    assert drift.stats()["streams"] == 3
+
+    drift.reset("ET-1")
+    assert drift.stats()["streams"] == 1
+    # A reset stream warms up again before it flags anything
+    assert drift.observe("ET-1", "Tulsi", {"pH": 9.0, "temperature": 25.0}).anomalous == []
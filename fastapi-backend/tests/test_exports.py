@@ -0,0 +1,98 @@
+import csv
+import io
+import os
+from datetime import datetime
+
+import pytest
+
+HERB = 'Export, "holy"\nbasil'
+
+
+@pytest.fixture(scope="module")
+def export_rows(client):
+    from database import SampleDB, engine
+    from rollups import classifications, rollup_statements
+
+    rows = [
+        {"sampleID": f"EXPORT-{i}", "herbName": HERB, "purityPercent": 90.0 + i, "adulterationFlag": i == 1,
+         "confidenceScore": 0.5, "modelVersion": 'v1, "rc"', "timestamp": datetime(2025, 3, 1, 8 + i)}
+        for i in range(3)
+    ]
+    with engine.begin() as conn:
+        conn.execute(SampleDB.__table__.insert(), rows)
+        for stmt, params in rollup_statements(conn.dialect.name, classifications(rows)):
+            conn.execute(stmt, params)
+    return rows
+
+
+def expected_csv_rows(rows):
+    return [[row["sampleID"], row["herbName"], str(row["purityPercent"]), str(row["adulterationFlag"]),
+             str(row["timestamp"]), str(row["confidenceScore"]), row["modelVersion"]] for row in rows]
+
+
+def test_write_export_csv_quotes_fields_and_reports_the_file(export_rows, tmp_path):
+    from database import SessionLocal
+    from exports import export_query, write_export
+
+    with SessionLocal() as db:
+        result = write_export(db, "csv", export_query(herbName=HERB), directory=str(tmp_path), batch_size=2)
+
+    assert result["rows"] == 3 and result["format"] == "csv"
+    assert os.path.getsize(result["path"]) == result["bytes"]
+    assert os.listdir(tmp_path) == [os.path.basename(result["path"])]  # no staging file left behind
+    with open(result["path"], newline="") as f:
+        header, *rows = list(csv.reader(f))
+    assert header == ["sampleID", "herbName", "purityPercent", "adulterationFlag", "timestamp",
+                      "confidenceScore", "modelVersion"]
+    assert rows == expected_csv_rows(export_rows)
+
+
+def test_streamed_csv_matches_the_rows(client, auth_headers, export_rows):
+    response = client.get("/api/history/export", params={"herbName": HERB}, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/csv")
+    header, *rows = list(csv.reader(io.StringIO(response.text, newline="")))
+    assert rows == expected_csv_rows(export_rows)
+
+
+def test_parquet_export_has_typed_columns(client, auth_headers, export_rows):
+    pq = pytest.importorskip("pyarrow.parquet")
+    import pyarrow as pa
+
+    response = client.get("/api/history/export", params={"herbName": HERB, "format": "parquet"}, headers=auth_headers)
+    assert response.status_code == 200
+    table = pq.read_table(pa.BufferReader(response.content))
+    assert table.schema.field("purityPercent").type == pa.float64()
+    assert table.schema.field("adulterationFlag").type == pa.bool_()
+    assert table.schema.field("timestamp").type == pa.timestamp("us")
+    assert table.column("sampleID").to_pylist() == [row["sampleID"] for row in export_rows]
+    assert table.column("herbName").to_pylist() == [HERB] * 3
+    assert table.column("timestamp").to_pylist() == [row["timestamp"] for row in export_rows]
+
+
+@pytest.fixture
+def export_task(tmp_path, monkeypatch):
+    pytest.importorskip("celery")
+    import functools
+    import exports
+    import tasks
+
+    monkeypatch.setattr(tasks, "write_export", functools.partial(exports.write_export, directory=str(tmp_path)))
+    return tasks.export_history_async
+
+
+def test_export_task_returns_the_file_not_its_contents(export_rows, export_task):
+    result = export_task(1, {"herbName": HERB, "adulterated": True})
+    assert result["rows"] == 1
+    with open(result["path"], newline="") as f:
+        assert list(csv.reader(f))[1:] == expected_csv_rows(export_rows[1:2])
+
+
+@pytest.mark.parametrize("end_date, rows", [
+    ("2025-03-01", 3),           # a bare date includes the whole day
+    ("2025-03-01T09:00:00", 2),  # a timestamp is inclusive
+    ("2025-02-28", 0),
+])
+def test_export_task_end_date_is_inclusive(export_rows, export_task, end_date, rows):
+    result = export_task(1, {"herbName": HERB, "start_date": "2025-03-01", "end_date": end_date})
+    assert result["rows"] == rows
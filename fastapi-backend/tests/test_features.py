@@ -0,0 +1,23 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+from features import SENSOR_FEATURES, extract_frame_features
+
+
+def frame(voltammetry):
+    df = pd.DataFrame({name: np.ones(len(voltammetry)) for name, _ in SENSOR_FEATURES})
+    df["Voltammetry"] = voltammetry
+    return df
+
+
+def test_malformed_curve_cell_does_not_shift_later_rows():
+    first = json.dumps({"Voltage": [0.0, 0.5, 1.0], "Current": [0.1, 0.4, 0.2]})
+    last = json.dumps({"Voltage": [0.0, 0.5, 1.0], "Current": [0.3, 0.9, 0.6]})
+    # The middle cell parses as two values when the column is joined into one JSON array
+    features = extract_frame_features(frame([first, "1.5,2.5", last]))
+
+    expected = extract_frame_features(frame([first, "null", last]))
+    np.testing.assert_array_equal(features, expected)
+    np.testing.assert_array_equal(features[2], extract_frame_features(frame([last]))[0])
@@ -0,0 +1,51 @@
+import base64
+
+import pytest
+
+from conftest import make_sample
+
+
+def test_history_pages_do_not_overlap(client, auth_headers):
+    response = client.post("/api/classify/batch", json=[make_sample(f"HISTORY-{i}") for i in range(5)])
+    assert response.status_code == 200, response.text
+
+    first = client.get("/api/history", params={"limit": 2}, headers=auth_headers)
+    assert first.status_code == 200, first.text
+    cursor = first.headers["X-Next-Cursor"]
+    second = client.get("/api/history", params={"limit": 2, "cursor": cursor}, headers=auth_headers)
+    assert second.status_code == 200, second.text
+    first_ids = {row["sampleID"] for row in first.json()}
+    assert len(first_ids) == 2
+    assert not first_ids & {row["sampleID"] for row in second.json()}
+
+
+@pytest.mark.parametrize("cursor", [
+    "garbage",
+    base64.urlsafe_b64encode(b"no-separator").decode(),
+    base64.urlsafe_b64encode(b"not-a-date|1").decode(),
+    base64.urlsafe_b64encode(b"2024-01-01T00:00:00|not-an-id").decode(),
+])
+def test_history_rejects_malformed_cursor(client, auth_headers, cursor):
+    response = client.get("/api/history", params={"cursor": cursor}, headers=auth_headers)
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+
+@pytest.mark.parametrize("path, params", [("/api/classify/batch", {}), ("/api/upload", {"classify": False})])
+def test_cached_history_sees_writes_from_other_workers(client, auth_headers, monkeypatch, path, params):
+    import main
+
+    sample_id = f"OTHER-WORKER-{path.rsplit('/', 1)[1].upper()}"
+    assert client.get("/api/history", params={"limit": 500}, headers=auth_headers).status_code == 200
+
+    # The write lands on another worker without Redis: its local generation bump never reaches this one
+    async def other_process(namespace):
+        pass
+
+    monkeypatch.setattr(main.response_cache, "invalidate", other_process)
+    response = client.post(path, json=[make_sample(sample_id)], params=params, headers=auth_headers)
+    assert response.status_code == 200, response.text
+
+    history = client.get("/api/history", params={"limit": 500}, headers=auth_headers).json()
+    assert sample_id in {row["sampleID"] for row in history}
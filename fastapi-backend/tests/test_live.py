@@ -0,0 +1,82 @@
+import asyncio
+import json
+
+from conftest import make_sample
+from live import ResultBroadcaster
+
+
+def test_websocket_replies_in_order_with_per_frame_errors(client):
+    frames = [
+        {"seq": 1, **make_sample("WS-1")},
+        "not json",
+        {"seq": 3, **make_sample("WS-1")},
+        {"seq": 4, "sampleID": "WS-4", "sensors": {"pH": "acidic"}},
+        {"seq": 5, **make_sample("WS-5")},
+    ]
+    with client.websocket_connect("/ws/classify") as websocket:
+        for frame in frames:
+            if isinstance(frame, str):
+                websocket.send_text(frame)
+            else:
+                websocket.send_json(frame)
+        replies = [websocket.receive_json() for _ in frames]
+
+    assert [reply.get("seq") for reply in replies] == [1, None, 3, 4, 5]
+    assert replies[0]["sampleID"] == "WS-1" and replies[0]["result"]["herbName"]
+    assert replies[1] == {"error": "Frame is not valid JSON"}
+    # Within one micro-batch or after the first one was saved, the repeat is refused
+    assert replies[2]["error"] in ("Duplicate sampleID in batch", "sampleID already exists")
+    assert "sensors" in replies[3]["error"] and "result" not in replies[3]
+    assert replies[4]["sampleID"] == "WS-5" and replies[4]["result"]["purityPercent"] > 0
+
+
+class FakeRequest:
+    def __init__(self):
+        self.disconnected = False
+
+    async def is_disconnected(self):
+        return self.disconnected
+
+
+def test_events_are_delivered_to_subscribers():
+    async def scenario():
+        broadcaster = ResultBroadcaster(queue_size=2, keepalive=0.05)
+        request = FakeRequest()
+        stream = broadcaster.stream(request)
+
+        assert await stream.__anext__() == ": keepalive\n\n"
+        assert broadcaster.stats()["subscribers"] == 1
+        for sample_id in ("SSE-1", "SSE-2", "SSE-3"):
+            broadcaster.publish({"sampleID": sample_id})
+        # The subscriber fell behind by one event; the oldest was dropped
+        events = [await stream.__anext__() for _ in range(2)]
+        assert [json.loads(event.split("data: ", 1)[1]) for event in events] == [{"sampleID": "SSE-2"},
+                                                                               {"sampleID": "SSE-3"}]
+        assert all(event.startswith("event: classification\n") for event in events)
+        assert broadcaster.stats()["dropped"] == 1
+
+        request.disconnected = True
+        assert [chunk async for chunk in stream] in ([], [": keepalive\n\n"])
+        assert broadcaster.stats()["subscribers"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_events_endpoint_requires_a_token(client):
+    assert client.get("/api/classify/events").status_code == 401
+    assert client.get("/api/classify/events", params={"token": "garbage"}).status_code == 401
+
+
+def test_classifications_are_published_as_events(client):
+    import main
+
+    # Stand in for an open /api/classify/events stream
+    queue = asyncio.Queue(10)
+    main.result_broadcaster._subscribers.add(queue)
+    try:
+        assert client.post("/api/classify/batch", json=[make_sample("SSE-BATCH")]).status_code == 200
+    finally:
+        main.result_broadcaster._subscribers.discard(queue)
+    event = json.loads(queue.get_nowait())
+    assert (event["source"], event["sampleID"]) == ("batch", "SSE-BATCH")
+    assert event["herbName"] and event["purityPercent"] > 0
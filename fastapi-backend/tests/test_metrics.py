@@ -0,0 +1,11 @@
+def test_metrics_export_auth_and_password_stats(client, auth_headers):
+    # A protected call hits the token cache; the login behind auth_headers ran the password hasher
+    assert client.get("/api/stats", headers=auth_headers).status_code == 200
+
+    body = client.get("/metrics").text
+    assert 'herbal_auth_cache_hits_total{kind="token"}' in body
+    assert 'herbal_auth_cache_hit_ratio{kind="token"}' in body
+    assert 'herbal_auth_cache_entries{kind="user"}' in body
+    assert "herbal_password_pending " in body
+    assert "herbal_password_operations_total " in body
+    assert "herbal_password_queue_seconds_mean " in body
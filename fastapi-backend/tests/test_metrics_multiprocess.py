@@ -0,0 +1,19 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+from conftest import BACKEND_DIR
+
+
+@pytest.mark.parametrize("module", ["metrics", "tasks"])
+def test_import_creates_missing_multiprocess_dir(tmp_path, module):
+    if module == "tasks":
+        pytest.importorskip("celery")
+    multiproc_dir = tmp_path / "prometheus"
+    env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=str(multiproc_dir))
+    result = subprocess.run([sys.executable, "-c", f"import {module}"], cwd=BACKEND_DIR, env=env,
+                            capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+    assert multiproc_dir.is_dir()
@@ -0,0 +1,94 @@
+import json
+import os
+import shutil
+import time
+
+import pytest
+
+from conftest import REPO_DIR
+
+
+def wait_until_idle(registry, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while registry.status()["loading"] is not None:
+        assert time.monotonic() < deadline, "model swap did not finish"
+        time.sleep(0.01)
+
+
+def add_version(models_dir, version, metadata):
+    path = os.path.join(models_dir, "versions", version)
+    shutil.copytree(os.path.join(REPO_DIR, "models"), path)
+    with open(os.path.join(path, "model_metadata.json"), "w") as f:
+        json.dump(metadata, f)
+
+
+@pytest.fixture
+def models_dir(tmp_path):
+    from feature_schema import LEGACY_SCHEMA
+    from features import FEATURE_NAMES
+
+    path = str(tmp_path / "models")
+    shutil.copytree(os.path.join(REPO_DIR, "models"), path)
+    add_version(path, "v2", {"version": "v2", "feature_schema": LEGACY_SCHEMA.to_metadata()})
+    tampered = dict(LEGACY_SCHEMA.to_metadata(), fingerprint="0" * 64)
+    add_version(path, "tampered", {"version": "tampered", "feature_schema": tampered})
+    # The stored models take eight inputs; this schema describes seventeen
+    add_version(path, "wide", {"version": "wide", "features": list(FEATURE_NAMES)})
+    return path
+
+
+def test_activate_swaps_and_rollback_restores(models_dir):
+    from model_registry import ModelRegistry, read_manifest
+
+    registry = ModelRegistry(models_dir, poll_seconds=0)
+    legacy = registry.get()
+    assert legacy.version == "legacy"
+
+    assert registry.activate("v2")
+    wait_until_idle(registry)
+    assert registry.get().version == "v2"
+    assert registry.status()["previousVersion"] == "legacy"
+    assert read_manifest(models_dir)["current_version"] == "v2"
+
+    assert registry.rollback() == "legacy"
+    assert registry.get() is legacy
+    assert read_manifest(models_dir)["current_version"] == "legacy"
+
+    with pytest.raises(FileNotFoundError):
+        registry.activate("missing")
+
+
+@pytest.mark.parametrize("version, error", [("tampered", "fingerprint"), ("wide", "expects 8 features")])
+def test_schema_mismatch_is_rejected(models_dir, version, error):
+    from model_registry import ModelRegistry, read_manifest, write_manifest
+
+    registry = ModelRegistry(models_dir, poll_seconds=0)
+    assert registry.get().version == "legacy"
+    registry.activate(version)
+    wait_until_idle(registry)
+    assert registry.get().version == "legacy"
+    assert error in registry.status()["lastError"]
+
+    # A fresh worker whose manifest names the bad version serves nothing rather than misaligned inputs
+    write_manifest(dict(read_manifest(models_dir), current_version=version), models_dir)
+    fresh = ModelRegistry(models_dir, poll_seconds=0)
+    assert fresh.get() is None
+    assert error in fresh.status()["lastError"]
+
+
+def test_workers_follow_the_manifest(models_dir):
+    from model_registry import ModelRegistry, read_manifest, write_manifest
+
+    registry = ModelRegistry(models_dir, poll_seconds=0.01)
+    assert registry.get().version == "legacy"
+
+    # Another process activates v2 and persists it
+    write_manifest(dict(read_manifest(models_dir), current_version="v2"), models_dir)
+    stat = os.stat(os.path.join(models_dir, "model_metadata.json"))
+    os.utime(os.path.join(models_dir, "model_metadata.json"), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    deadline = time.monotonic() + 30
+    while registry.get().version != "v2":
+        assert time.monotonic() < deadline, "registry did not pick up the manifest change"
+        time.sleep(0.02)
+    assert registry.status()["previousVersion"] == "legacy"
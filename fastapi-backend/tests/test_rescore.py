@@ -0,0 +1,35 @@
+import json
+
+from sqlalchemy import select
+
+from conftest import make_sample
+
+
+def test_rescore_resumes_after_checkpoint(client, auth_headers, tmp_path):
+    import rescore
+    from database import SampleDB, SessionLocal
+    from inference import MODELS_DIR
+    from model_registry import ModelRegistry
+
+    sample_ids = [f"RESCORE-{i}" for i in range(6)]
+    response = client.post("/api/upload?classify=false", json=[make_sample(s) for s in sample_ids], headers=auth_headers)
+    assert response.status_code == 200, response.text
+    with SessionLocal() as db:
+        ids = dict(db.execute(select(SampleDB.sampleID, SampleDB.id).where(SampleDB.sampleID.in_(sample_ids))).all())
+
+    # An earlier run that stopped after the first three rows
+    version = ModelRegistry(MODELS_DIR, poll_seconds=0).get().version
+    checkpoint = tmp_path / "rescore.checkpoint.json"
+    done = ids["RESCORE-2"]
+    checkpoint.write_text(json.dumps({"modelVersion": version, "all": False, "lastId": done, "updated": 3, "skipped": 0}))
+
+    result = rescore.rescore(workers=1, chunk_size=2, checkpoint_path=str(checkpoint))
+
+    with SessionLocal() as db:
+        versions = dict(db.execute(select(SampleDB.sampleID, SampleDB.modelVersion)
+                                   .where(SampleDB.sampleID.in_(sample_ids))).all())
+    assert all(versions[s] is None for s in sample_ids[:3])
+    assert all(versions[s] == version for s in sample_ids[3:])
+    assert result["lastId"] == ids["RESCORE-5"]
+    assert json.loads(checkpoint.read_text())["lastId"] == ids["RESCORE-5"]
+    assert result["updated"] >= 3 + 3
@@ -0,0 +1,19 @@
+from sqlalchemy import func, select
+
+from conftest import make_sample
+
+
+def test_rebuild_replaces_rollup_rows(client, auth_headers):
+    from database import HerbDailyStatsDB, SampleDB, engine
+
+    response = client.post("/api/classify/batch", json=[make_sample(f"STATS-{i}", pH=6.0 + i / 10) for i in range(5)])
+    assert response.status_code == 200, response.text
+    with engine.connect() as conn:
+        classified = conn.execute(select(func.count()).where(SampleDB.purityPercent.is_not(None))).scalar()
+    assert sum(herb["samples"] for herb in client.get("/api/stats", headers=auth_headers).json()["herbs"]) == classified
+
+    # Rows a concurrent rebuild left behind must be replaced, not added to
+    with engine.begin() as conn:
+        conn.execute(HerbDailyStatsDB.__table__.update().values(samples=HerbDailyStatsDB.samples * 2))
+    assert client.post("/api/stats/rebuild", headers=auth_headers).status_code == 200
+    assert sum(herb["samples"] for herb in client.get("/api/stats", headers=auth_headers).json()["herbs"]) == classified
@@ -0,0 +1,39 @@
+import asyncio
+
+import pytest
+
+from streaming_upload import STREAM_MAX_LINE_LENGTH, StreamFormatError, iter_lines
+
+
+async def _chunks(*chunks: bytes):
+    for chunk in chunks:
+        yield chunk
+
+
+async def _lines(*chunks: bytes, max_line_length: int):
+    return [line async for line in iter_lines(_chunks(*chunks), max_line_length)]
+
+
+def test_iter_lines_splits_across_chunks():
+    lines = asyncio.run(_lines(b'{"a":', b' 1}\r\n\n{"b"', b": 2}", max_line_length=10))
+    assert lines == ['{"a": 1}', '{"b": 2}']
+
+
+@pytest.mark.parametrize("chunks", [
+    (b"short\n", b"x" * 8, b"x" * 8, b"\nnever read\n"),  # grows past the limit across chunks
+    (b"short\n" + b"x" * 11 + b"\nnext\n",),                # complete, but too long
+    (b"short\n" + b"x" * 11,),                              # last line without a newline
+])
+def test_iter_lines_rejects_long_lines(chunks):
+    with pytest.raises(StreamFormatError, match="Line 2 is longer than 10 characters"):
+        asyncio.run(_lines(*chunks, max_line_length=10))
+
+
+def test_stream_upload_without_newlines_fails_the_job(client, auth_headers):
+    body = b"x" * (STREAM_MAX_LINE_LENGTH + 1)
+    response = client.post("/api/upload/stream?format=ndjson&uploadId=no-newlines", content=body,
+                           headers=auth_headers)
+    assert response.status_code == 400
+    assert "Line 1 is longer than" in response.json()["detail"]
+    job = client.get("/api/upload/jobs/no-newlines", headers=auth_headers).json()
+    assert job["status"] == "failed"
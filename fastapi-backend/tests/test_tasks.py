@@ -0,0 +1,28 @@
+import pytest
+
+from conftest import make_sample
+
+pytest.importorskip("celery")
+
+
+def test_classify_task_stores_sample_without_curve_and_refreshes_history(client, auth_headers):
+    import tasks
+
+    # Cache a history page first; the task's row must show up in the next one
+    assert client.post("/api/classify/batch", json=[make_sample("TASK-0")]).status_code == 200
+    assert client.get("/api/history", params={"limit": 500}, headers=auth_headers).status_code == 200
+    sample = make_sample("TASK-1")
+    del sample["sensors"]["voltammetry"]
+    result = tasks.classify_sample_async(sample)
+    assert result["herbName"]
+
+    history = client.get("/api/history", params={"limit": 500}, headers=auth_headers).json()
+    assert "TASK-1" in {row["sampleID"] for row in history}
+
+
+def test_classify_task_without_model_fails_cleanly(monkeypatch):
+    import tasks
+
+    monkeypatch.setattr(tasks.ml_models, "get", lambda: None)
+    with pytest.raises(RuntimeError, match="No trained model available"):
+        tasks.classify_sample_async(make_sample("TASK-2"))
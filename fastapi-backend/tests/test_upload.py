@@ -0,0 +1,62 @@
+from conftest import make_sample
+
+
+def test_upload_counts_inserted_updated_and_duplicate_rows(client, auth_headers):
+    first = [make_sample("UPLOAD-1"), make_sample("UPLOAD-2")]
+    response = client.post("/api/upload?classify=false", json=first, headers=auth_headers)
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert (body["uploadedSamples"], body["duplicateRows"], body["updatedRows"]) == (2, 0, 0)
+
+    # Existing sampleIDs are skipped, not an error; a repeat within the batch counts as a duplicate too
+    again = [make_sample("UPLOAD-2"), make_sample("UPLOAD-3"), make_sample("UPLOAD-3", pH=7.0)]
+    body = client.post("/api/upload?classify=false", json=again, headers=auth_headers).json()
+    assert (body["uploadedSamples"], body["duplicateRows"], body["updatedRows"]) == (1, 2, 0)
+
+    body = client.post("/api/upload?classify=false&mode=upsert", json=[make_sample("UPLOAD-1", pH=7.5)],
+                       headers=auth_headers).json()
+    assert (body["uploadedSamples"], body["duplicateRows"], body["updatedRows"]) == (1, 0, 1)
+
+
+def test_non_object_rows_fail_individually(client, auth_headers):
+    rows = [make_sample("ROWS-1"), 5, "text", None, make_sample("ROWS-2")]
+
+    response = client.post("/api/classify/batch", json=rows)
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert (body["total"], body["classified"], body["failed"]) == (5, 2, 3)
+    assert [item["error"] for item in body["results"]][1:4] == ["Sample expected dict not int",
+                                                                 "Sample expected dict not str",
+                                                                 "Sample expected dict not NoneType"]
+
+    response = client.post("/api/upload?classify=false", json=[make_sample("ROWS-3"), 5], headers=auth_headers)
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert (body["uploadedSamples"], body["invalidRows"]) == (1, 1)
+    assert body["errors"] == [{"index": 1, "sampleID": None, "error": "Sample expected dict not int"}]
+
+
+def test_upsert_clears_the_whole_classification(client, auth_headers):
+    from sqlalchemy import select
+    from database import SampleDB, engine
+
+    assert client.post("/api/classify/batch", json=[make_sample("UPSERT-1")]).status_code == 200
+    body = client.post("/api/upload?classify=false&mode=upsert", json=[make_sample("UPSERT-1", pH=7.5)],
+                       headers=auth_headers).json()
+    assert body["updatedRows"] == 1
+
+    with engine.connect() as conn:
+        row = conn.execute(select(SampleDB).where(SampleDB.sampleID == "UPSERT-1")).one()
+    assert (row.herbName, row.purityPercent, row.confidenceScore, row.modelVersion) == (None, None, None, None)
+    assert row.pH == 7.5
+
+    history = client.get("/api/history", params={"sampleID": "UPSERT-1"}, headers=auth_headers).json()
+    assert history[0]["herbName"] is None and history[0]["purityPercent"] == 0
+
+
+def test_sensor_columns_match_the_dict_mapping():
+    import main
+    from database import sensor_values
+
+    sample = main.Sample.parse_obj(make_sample("COLUMNS-1"))
+    assert main.sensor_columns(sample.sensors) == sensor_values(sample.sensors.dict())
@@ -0,0 +1,62 @@
+import threading
+import time
+
+from conftest import make_sample
+
+
+def wait_for_job(client, auth_headers, job_id, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f"/api/upload/jobs/{job_id}", headers=auth_headers).json()
+        if job["status"] in ("complete", "failed"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"upload job {job_id} did not finish: {job}")
+
+
+def test_history_is_fresh_after_background_classification(client, auth_headers):
+    import main
+
+    # Hold the classification workers so the unclassified row is cached first
+    gate = threading.Event()
+    for _ in range(main.classify_executor.workers):
+        main.classify_executor._pool.submit(gate.wait)
+    try:
+        response = client.post("/api/upload", json=[make_sample("JOB-FRESH-1")], headers=auth_headers)
+        assert response.status_code == 200, response.text
+        job_id = response.json()["jobId"]
+
+        before = client.get("/api/history", params={"sampleID": "JOB-FRESH-1"}, headers=auth_headers).json()
+        assert before[0]["purityPercent"] == 0.0
+    finally:
+        gate.set()
+
+    job = wait_for_job(client, auth_headers, job_id)
+    assert job["status"] == "complete" and job["classified"] == 1
+
+    after = client.get("/api/history", params={"sampleID": "JOB-FRESH-1"}, headers=auth_headers).json()
+    assert after[0]["purityPercent"] > 0.0
+    assert after[0]["herbName"]
+
+
+def test_skipped_duplicates_are_not_reclassified(client, auth_headers):
+    from sqlalchemy import select, update
+    from database import SampleDB, engine
+
+    assert client.post("/api/classify/batch", json=[make_sample("JOB-SKIP-1")]).status_code == 200
+    # A stored prediction the models would never reproduce, so a re-classification shows
+    with engine.begin() as conn:
+        conn.execute(update(SampleDB).where(SampleDB.sampleID == "JOB-SKIP-1").values(purityPercent=42.0))
+
+    response = client.post("/api/upload", json=[make_sample("JOB-SKIP-1", pH=3.0), make_sample("JOB-SKIP-2")],
+                           headers=auth_headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["duplicateRows"] == 1
+    job = wait_for_job(client, auth_headers, response.json()["jobId"])
+    assert job["status"] == "complete" and job["classified"] == 1
+
+    with engine.connect() as conn:
+        rows = dict(conn.execute(select(SampleDB.sampleID, SampleDB.purityPercent)
+                                 .where(SampleDB.sampleID.in_(["JOB-SKIP-1", "JOB-SKIP-2"]))).all())
+    assert rows["JOB-SKIP-1"] == 42.0
+    assert rows["JOB-SKIP-2"] > 0.0
@@ -7,6 +7,13 @@ from sklearn.metrics import accuracy_score, classification_report
 import joblib
 import json
 import os
+import sys
+from datetime import datetime
+
+from feature_schema import FULL_SCHEMA
+from features import FEATURE_NAMES, extract_frame_features
+from model_registry import MANIFEST_FILE, VERSIONS_DIR, new_version_id, read_manifest, write_manifest
+from inference_pipeline import PIPELINE_DIR, build_pipeline, save_pipeline
 
 def load_and_preprocess_data():
     """Load sample data and preprocess for ML training"""
@@ -16,24 +23,9 @@ def load_and_preprocess_data():
     # Extract herb names from SampleID (everything before the underscore)
     df['herb_name'] = df['SampleID'].str.split('_').str[0]
 
-    # Parse voltammetry data (it's stored as JSON string)
-    def parse_voltammetry(volt_str):
-        try:
-            data = json.loads(volt_str.replace('""', '"'))
-            # Use mean of current values as a feature
-            return np.mean(data['Current'])
-        except:
-            return 0.0
-
-    df['voltammetry_mean'] = df['Voltammetry'].apply(parse_voltammetry)
-
-    # Select features for ML model
-    features = [
-        'pH', 'Conductivity', 'ORP', 'Turbidity',
-        'Temperature', 'Moisture', 'RF_Resonator', 'voltammetry_mean'
-    ]
-
-    X = df[features]
+    # Scalar sensors, ion-selective electrodes and voltammetry curve features, computed for all rows at once
+    features = list(FEATURE_NAMES)
+    X = pd.DataFrame(extract_frame_features(df), columns=features, index=df.index)
     y = df['herb_name']
 
     # Encode target labels
@@ -142,6 +134,23 @@ def create_adulteration_detector():
 
     return detector, scaler
 
+def export_compiled_models(herb_clf, herb_scaler, label_encoder, adulteration_clf, adulteration_scaler, models_dir='models'):
+    """Flatten both forests and fuse their scalers into one inference pipeline artifact"""
+    save_pipeline(os.path.join(models_dir, PIPELINE_DIR),
+                  build_pipeline(herb_clf, herb_scaler, label_encoder, adulteration_clf, adulteration_scaler))
+
+def export_saved_models(models_dir='models'):
+    """Compile the already-trained pickles without retraining"""
+    export_compiled_models(
+        joblib.load(os.path.join(models_dir, 'herb_classifier.pkl')),
+        joblib.load(os.path.join(models_dir, 'herb_scaler.pkl')),
+        joblib.load(os.path.join(models_dir, 'label_encoder.pkl')),
+        joblib.load(os.path.join(models_dir, 'adulteration_detector.pkl')),
+        joblib.load(os.path.join(models_dir, 'adulteration_scaler.pkl')),
+        models_dir
+    )
+    print("Inference pipeline exported to", os.path.join(models_dir, PIPELINE_DIR))
+
 def save_models():
     """Train and save all ML models"""
     print("Training ML models for Herbal E-Tongue...")
@@ -152,30 +161,52 @@ def save_models():
     # Train adulteration detector
     adulteration_clf, adulteration_scaler = create_adulteration_detector()
 
-    # Save models
-    os.makedirs('models', exist_ok=True)
+    # Save models into a new registry version; the API hot-swaps to it once the manifest points at it
+    version = new_version_id()
+    output_dir = os.path.join('models', VERSIONS_DIR, version)
+    os.makedirs(output_dir, exist_ok=True)
+
+    joblib.dump(herb_clf, os.path.join(output_dir, 'herb_classifier.pkl'))
+    joblib.dump(herb_scaler, os.path.join(output_dir, 'herb_scaler.pkl'))
+    joblib.dump(label_encoder, os.path.join(output_dir, 'label_encoder.pkl'))
 
-    joblib.dump(herb_clf, 'models/herb_classifier.pkl')
-    joblib.dump(herb_scaler, 'models/herb_scaler.pkl')
-    joblib.dump(label_encoder, 'models/label_encoder.pkl')
+    joblib.dump(adulteration_clf, os.path.join(output_dir, 'adulteration_detector.pkl'))
+    joblib.dump(adulteration_scaler, os.path.join(output_dir, 'adulteration_scaler.pkl'))
 
-    joblib.dump(adulteration_clf, 'models/adulteration_detector.pkl')
-    joblib.dump(adulteration_scaler, 'models/adulteration_scaler.pkl')
+    # Fused scalers + flattened forests, the artifact the API serves from
+    export_compiled_models(herb_clf, herb_scaler, label_encoder, adulteration_clf, adulteration_scaler, output_dir)
 
     # Save model metadata
     metadata = {
+        'version': version,
         'herb_accuracy': herb_accuracy,
         'herb_classes': label_encoder.classes_.tolist(),
-        'features': ['pH', 'Conductivity', 'ORP', 'Turbidity', 'Temperature', 'Moisture', 'RF_Resonator', 'voltammetry_mean']
+        'features': list(FEATURE_NAMES),
+        'feature_schema': FULL_SCHEMA.to_metadata()
     }
 
-    with open('models/model_metadata.json', 'w') as f:
+    with open(os.path.join(output_dir, MANIFEST_FILE), 'w') as f:
         json.dump(metadata, f, indent=2)
 
-    print("\nModels saved successfully!")
+    # Register the version in the manifest written last, so workers only see complete versions
+    manifest = read_manifest('models')
+    manifest.update(metadata)
+    manifest['current_version'] = version
+    manifest.setdefault('versions', []).append({
+        'version': version,
+        'created_at': datetime.utcnow().isoformat(),
+        'herb_accuracy': herb_accuracy,
+    })
+    write_manifest(manifest, 'models')
+
+    print(f"\nModels saved successfully as version {version}!")
     print("- herb_classifier.pkl")
     print("- adulteration_detector.pkl")
+    print("- " + PIPELINE_DIR)
     print("- model_metadata.json")
 
 if __name__ == "__main__":
-    save_models()
+    if "--export-only" in sys.argv:
+        export_saved_models()
+    else:
+        save_models()
@@ -55,6 +55,32 @@ def test_classify(token):
     print(f"Response: {response.json()}")
     return response.status_code == 200
 
+def test_classify_batch():
+    print("\nTesting batch classification...")
+    sensors = {
+        "voltammetry": [1.1, 2.1, 3.1],
+        "pH": 6.9,
+        "tds_ec": 140.0,
+        "orp": 190.0,
+        "turbidity": 4.0,
+        "temperature": 25.0,
+        "moisture": 48.0,
+        "ion_selective": {"Na": 11.0, "K": 5.5, "Ca": 8.5},
+        "rf_resonator": 80.0
+    }
+    data = [
+        {"sampleID": f"batch{i:03d}", "timestamp": datetime.now().isoformat(), "sensors": sensors}
+        for i in range(3)
+    ]
+    data.append({"sampleID": "batch_invalid", "sensors": {"pH": 7.0}})
+    response = requests.post(f"{BASE_URL}/api/classify/batch", json=data)
+    print(f"Status: {response.status_code}")
+    print(f"Response: {response.json()}")
+    if response.status_code != 200:
+        return False
+    body = response.json()
+    return body["total"] == 4 and body["results"][3]["error"] is not None
+
 def test_upload(token):
     print("\nTesting upload...")
     headers = {"Authorization": f"Bearer {token}"}
@@ -126,6 +152,10 @@ if __name__ == "__main__":
             print("Classification failed")
             exit(1)
 
+        if not test_classify_batch():
+            print("Batch classification failed")
+            exit(1)
+
         if not test_upload(token):
             print("Upload failed")
             exit(1)